@@ -0,0 +1,197 @@
+import json
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, Callable, Dict
+
+import click
+
+# Benchmarks of the Python parts of the diagram generation (the image
+# generation is left out, it is dominated by PcbDraw and KiCAD). Every stage
+# runs on the Arduino Learning Kit Starter board from the documentation and on
+# synthetic boards of given pad counts, see benchmarks.boards. Run it from the
+# repository root:
+#
+#   python -m benchmarks.bench run -o baseline.json
+#   ... change the code ...
+#   python -m benchmarks.bench run -o current.json
+#   python -m benchmarks.bench compare baseline.json current.json
+#
+# The results store the minimum and the median time of the repeats for each
+# board and stage; the comparison uses the minimum, which is the least noisy.
+#
+# Without KiCAD (e.g., in CI), pass --fake-pcbnew to run against the
+# pure-Python stand-in of pcbnew from tests/fakepcbnew. Its timings of the
+# board loading and geometry extraction are not comparable with the real
+# pcbnew, so compare only results obtained with the same pcbnew.
+
+ROOT = Path(__file__).resolve().parent.parent
+ALKS_BOARD = ROOT / "docs" / "resources" / "ArduinoLearningKitStarter.kicad_pcb"
+ALKS_SPEC = ROOT / "docs" / "resources" / "alksSpec.yml"
+FAKE_PCBNEW = ROOT / "tests" / "fakepcbnew"
+
+DEFAULT_SIZES = [1000, 10000, 50000]
+
+def measure(function: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {"min": min(times), "median": statistics.median(times)}
+
+def plainData(data):
+    """
+    Convert ruamel.yaml containers into plain dicts and lists
+    """
+    return json.loads(json.dumps(data))
+
+def benchmarkBoard(boardfile: Path, specification: Any, repeat: int) -> Dict[str, Any]:
+    """
+    Run all stages on a board, if no specification is given, the template of
+    the board is used
+    """
+    import pcbnew
+    from PIL import Image
+    from pinion.board import BoardIndex
+    from pinion.generate import (boardAreaRect, buildSpecification, collectGroups,
+                                 componentsDefinition, embedPinion, sortByRectangles)
+    from pinion.specformat import encodeSpecification
+    from pinion.template import collectComponents
+
+    results = {}
+    results["loadBoard"] = measure(lambda: pcbnew.LoadBoard(str(boardfile)), repeat)
+    board = pcbnew.LoadBoard(str(boardfile))
+
+    results["collectComponents"] = measure(lambda: collectComponents(board), repeat)
+    if specification is None:
+        specification = {
+            "name": boardfile.stem,
+            "description": "",
+            "components": plainData(collectComponents(board))
+        }
+    components = specification["components"]
+
+    results["componentsDefinition"] = measure(
+        lambda: componentsDefinition(components, board), repeat)
+    definitions = componentsDefinition(components, board, BoardIndex(board))
+    # Sort them again in the specification order
+    order = {ref: i for i, ref in enumerate(components.keys())}
+    unsorted = sorted(definitions, key=lambda d: order[d["ref"]])
+    results["sortByRectangles"] = measure(
+        lambda: sortByRectangles(list(unsorted)), repeat)
+    results["collectGroups"] = measure(lambda: collectGroups(components), repeat)
+
+    area = boardAreaRect(board)
+    spec = buildSpecification(board, specification, {"front": area, "back": area})
+    for specFormat in [1, 2]:
+        results[f"encodeSpecification{specFormat}"] = measure(
+            lambda: encodeSpecification(spec, specFormat), repeat)
+
+    with TemporaryDirectory() as outputdir:
+        outputdir = Path(outputdir)
+        for side in ["front", "back"]:
+            Image.new("RGBA", (1000, 1000)).save(outputdir / f"{side}.png")
+        results["embedPinion"] = measure(
+            lambda: embedPinion(outputdir, spec), repeat)
+    return results
+
+def runBenchmarks(sizes, repeat: int) -> Dict[str, Any]:
+    from ruamel.yaml import YAML
+    from benchmarks.boards import syntheticBoard, writeKicadBoard
+
+    with open(ALKS_SPEC) as f:
+        alksSpec = plainData(YAML(typ="safe").load(f))
+
+    results = {}
+    print("Benchmarking alks", file=sys.stderr)
+    results["alks"] = benchmarkBoard(ALKS_BOARD, alksSpec, repeat)
+    with TemporaryDirectory() as tmp:
+        for size in sizes:
+            board = syntheticBoard(size)
+            boardfile = Path(tmp) / f"{board['name']}.kicad_pcb"
+            writeKicadBoard(board, boardfile)
+            print(f"Benchmarking {board['name']}", file=sys.stderr)
+            results[board["name"]] = benchmarkBoard(boardfile, None, repeat)
+    return results
+
+def compareResults(baseline: Dict[str, Any], current: Dict[str, Any],
+                   threshold: float, minTime: float):
+    """
+    Compare two benchmark results. Return list of (board, stage, baseline
+    time, current time, regressed) for all stages present in both.
+    """
+    comparison = []
+    for board, stages in current["results"].items():
+        for stage, times in stages.items():
+            base = baseline["results"].get(board, {}).get(stage)
+            if base is None:
+                continue
+            regressed = times["min"] > base["min"] * (1 + threshold) and \
+                        times["min"] - base["min"] > minTime
+            comparison.append((board, stage, base["min"], times["min"], regressed))
+    return comparison
+
+@click.group()
+def cli():
+    """
+    Pinion benchmarks
+    """
+    pass
+
+@cli.command("run")
+@click.option("--output", "-o", type=click.Path(dir_okay=False), required=True,
+    help="JSON file to store the results to")
+@click.option("--sizes", default=",".join(str(x) for x in DEFAULT_SIZES),
+    help="Comma separated pad counts of the synthetic boards")
+@click.option("--repeat", type=click.IntRange(min=1), default=3,
+    help="Number of repeats of every stage")
+@click.option("--fake-pcbnew/--no-fake-pcbnew", default=False,
+    help="Use the pure-Python stand-in of pcbnew instead of KiCAD")
+def run(output, sizes, repeat, fake_pcbnew):
+    """
+    Run the benchmarks
+    """
+    if fake_pcbnew:
+        sys.path.insert(0, str(FAKE_PCBNEW))
+    sizes = [int(x) for x in sizes.split(",") if x.strip()]
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "pcbnew": "fake" if fake_pcbnew else "kicad",
+        "repeat": repeat,
+        "results": runBenchmarks(sizes, repeat)
+    }
+    with open(output, "w") as f:
+        json.dump(results, f, indent=4)
+
+@cli.command("compare")
+@click.argument("baseline", type=click.Path(dir_okay=False, exists=True))
+@click.argument("current", type=click.Path(dir_okay=False, exists=True))
+@click.option("--threshold", type=click.FloatRange(min=0), default=0.2,
+    help="Maximal allowed relative slowdown of a stage")
+@click.option("--min-time", type=click.FloatRange(min=0), default=0.005,
+    help="Ignore slowdowns smaller than this (in seconds) as noise")
+def compare(baseline, current, threshold, min_time):
+    """
+    Compare two benchmark results, fail if any stage slowed down beyond the
+    threshold
+    """
+    with open(baseline) as f:
+        baseline = json.load(f)
+    with open(current) as f:
+        current = json.load(f)
+    if baseline.get("pcbnew") != current.get("pcbnew"):
+        print("Warning: the results were obtained with different pcbnew", file=sys.stderr)
+    comparison = compareResults(baseline, current, threshold, min_time)
+    for board, stage, base, now, regressed in comparison:
+        mark = "REGRESSION" if regressed else ""
+        print(f"{board:<20} {stage:<24} {base:>10.4f} {now:>10.4f} {now / base:>7.2f}x {mark}")
+    if any(regressed for *_, regressed in comparison):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    cli()
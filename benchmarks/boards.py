@@ -0,0 +1,180 @@
+import math
+from pathlib import Path
+from typing import Any, Dict, List
+
+# Synthetic boards for the benchmarks. A board is described by a plain
+# dictionary (all dimensions in mm):
+#
+#   {
+#       "name": <board name>,
+#       "outline": [x1, y1, x2, y2],
+#       "footprints": [{
+#           "ref": <reference>,
+#           "value": <value>,
+#           "layer": "F.Cu" or "B.Cu",
+#           "at": [x, y],
+#           "pads": [{
+#               "name": <pad name>,
+#               "type": "smd" or "thru_hole",
+#               "shape": "rect", "roundrect", "oval" or "circle",
+#               "at": [x, y] (relative to the footprint),
+#               "size": [width, height],
+#               "drill": <drill diameter> (only for thru_hole),
+#               "net": <net name>
+#           }, ...]
+#       }, ...]
+#   }
+#
+# and it can be written as a .kicad_pcb file, see writeKicadBoard.
+
+PITCH = 2.54
+
+def connector(ref: str, pins: int) -> Dict[str, Any]:
+    """
+    Double row pin header, the first pad is square
+    """
+    rows = pins // 2
+    return {
+        "ref": ref,
+        "value": f"Conn_02x{rows:02}",
+        "pads": [{
+            "name": str(i + 1),
+            "type": "thru_hole",
+            "shape": "rect" if i == 0 else "circle",
+            "at": [(i % 2) * PITCH, (i // 2) * PITCH],
+            "size": [1.7, 1.7],
+            "drill": 1.0
+        } for i in range(rows * 2)]
+    }
+
+def soic(ref: str, pins: int) -> Dict[str, Any]:
+    rows = pins // 2
+    return {
+        "ref": ref,
+        "value": f"SOIC-{pins}",
+        "pads": [{
+            "name": str(i + 1),
+            "type": "smd",
+            "shape": "roundrect",
+            "at": [0 if i < rows else 5.4, 1.27 * (i if i < rows else pins - 1 - i)],
+            "size": [1.95, 0.6]
+        } for i in range(rows * 2)]
+    }
+
+def resistor(ref: str) -> Dict[str, Any]:
+    return {
+        "ref": ref,
+        "value": "10k",
+        "pads": [{
+            "name": str(i + 1),
+            "type": "smd",
+            "shape": "rect",
+            "at": [i * 1.6, 0],
+            "size": [0.9, 0.95]
+        } for i in range(2)]
+    }
+
+def syntheticBoard(padCount: int) -> Dict[str, Any]:
+    """
+    Synthesize a board with (at least) padCount pads. The board is a grid of
+    pin headers, SOICs and resistors; some resistors are placed over the other
+    components and some components are on the back side, so the specification
+    has overlapping components on both sides.
+    """
+    footprints: List[Dict[str, Any]] = []
+    pads = 0
+    i = 0
+    while pads < padCount:
+        kind = i % 8
+        if kind == 0:
+            footprint = connector(f"J{i}", 20)
+        elif kind in (1, 2):
+            footprint = soic(f"U{i}", 16)
+        else:
+            footprint = resistor(f"R{i}")
+        footprint["layer"] = "B.Cu" if i % 5 == 4 else "F.Cu"
+        footprints.append(footprint)
+        pads += len(footprint["pads"])
+        i += 1
+
+    # The cells fit the largest footprint (the pin header); the board is
+    # roughly square
+    cellWidth, cellHeight = 9, 30
+    columns = max(1, math.ceil((len(footprints) * cellHeight / cellWidth) ** 0.5))
+    for i, footprint in enumerate(footprints):
+        if i % 9 == 8:
+            # Place it over the previous component
+            x, y = footprints[i - 1]["at"]
+            footprint["at"] = [x + 0.5, y + 0.5]
+        else:
+            footprint["at"] = [10 + (i % columns) * cellWidth,
+                               10 + (i // columns) * cellHeight]
+        for j, pad in enumerate(footprint["pads"]):
+            # Neighbouring pads share nets, so the nets are reasonably large
+            pad["net"] = f"N{(i * 64 + j) // 4}"
+    rows = (len(footprints) + columns - 1) // columns
+    return {
+        "name": f"synthetic-{padCount}",
+        "outline": [0, 0, 20 + columns * cellWidth, 20 + rows * cellHeight],
+        "footprints": footprints
+    }
+
+LAYERS = """  (layers
+    (0 "F.Cu" signal)
+    (31 "B.Cu" signal)
+    (34 "B.Paste" user)
+    (35 "F.Paste" user)
+    (36 "B.SilkS" user "B.Silkscreen")
+    (37 "F.SilkS" user "F.Silkscreen")
+    (38 "B.Mask" user)
+    (39 "F.Mask" user)
+    (44 "Edge.Cuts" user)
+  )
+"""
+
+def _padText(pad: Dict[str, Any], side: str, nets: Dict[str, int]) -> str:
+    x, y = pad["at"]
+    w, h = pad["size"]
+    if pad["type"] == "thru_hole":
+        layers = '"*.Cu" "*.Mask"'
+        extra = f' (drill {pad["drill"]})'
+    else:
+        layers = f'"{side}.Cu" "{side}.Paste" "{side}.Mask"'
+        extra = ""
+    if pad["shape"] == "roundrect":
+        extra += " (roundrect_rratio 0.25)"
+    net = pad["net"]
+    return (f'    (pad "{pad["name"]}" {pad["type"]} {pad["shape"]} (at {x} {y}) '
+            f'(size {w} {h}){extra} (layers {layers}) (net {nets[net]} "{net}"))\n')
+
+def writeKicadBoard(board: Dict[str, Any], filename: Path) -> None:
+    """
+    Write the board description as a KiCAD 6 board file
+    """
+    nets = {}
+    for footprint in board["footprints"]:
+        for pad in footprint["pads"]:
+            nets.setdefault(pad["net"], len(nets) + 1)
+    with open(filename, "w") as f:
+        f.write('(kicad_pcb (version 20211014) (generator pinion-benchmark)\n')
+        f.write('  (general (thickness 1.6))\n  (paper "A4")\n')
+        f.write(LAYERS)
+        f.write('  (setup (pad_to_mask_clearance 0))\n')
+        f.write('  (net 0 "")\n')
+        for name, number in nets.items():
+            f.write(f'  (net {number} "{name}")\n')
+        for footprint in board["footprints"]:
+            side = footprint["layer"][0]
+            x, y = footprint["at"]
+            f.write(f'  (footprint "Benchmark:{footprint["value"]}" (layer "{footprint["layer"]}")\n')
+            f.write(f'    (at {x} {y})\n')
+            for kind, text, offset in [("reference", footprint["ref"], -2),
+                                       ("value", footprint["value"], 2)]:
+                f.write(f'    (fp_text {kind} "{text}" (at 0 {offset}) (layer "{side}.SilkS")\n')
+                f.write('      (effects (font (size 1 1) (thickness 0.15))))\n')
+            for pad in footprint["pads"]:
+                f.write(_padText(pad, side, nets))
+            f.write('  )\n')
+        x1, y1, x2, y2 = board["outline"]
+        f.write(f'  (gr_rect (start {x1} {y1}) (end {x2} {y2}) (layer "Edge.Cuts") (width 0.1))\n')
+        f.write(')\n')
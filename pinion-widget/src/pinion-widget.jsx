@@ -3,6 +3,9 @@ import GridLoader from "react-spinners/GridLoader";
 import ReactMarkdown from 'react-markdown';
 import './pinion-widget.css';
 import {FlatRootCheckbox} from "./checkbox-tree";
+import {decodeSpecification, decodeGeometry} from "./spec-format";
+import {tileLevel, levelTiles, placeholderImage} from "./tiles";
+import {chooseImage} from "./srcset";
 import _ from "lodash";
 
 function useResizeObserver() {
@@ -47,6 +50,14 @@ async function fetchJson(path) {
     return await response.json();
 }
 
+async function fetchBinary(path) {
+    let response = await fetch(path);
+    if (!response.ok) {
+        throw new Error(response.statusText);
+    }
+    return await response.arrayBuffer();
+}
+
 function resolveSourcePath(source, path) {
     if (/^(?:[a-z][a-z0-9+.-]*:|\/|#)/i.test(path)) {
         return path;
@@ -57,6 +68,65 @@ function resolveSourcePath(source, path) {
     return source.replace(/\/$/, "") + "/" + path;
 }
 
+async function loadSpecification(source, specification) {
+    let spec = decodeSpecification(specification);
+    if (spec.geometry !== undefined) {
+        let geometry = await fetchBinary(resolveSourcePath(source, spec.geometry));
+        spec = decodeGeometry(spec, geometry);
+    }
+    for (let side of ["front", "back"]) {
+        if (spec[side] && spec[side].tiles) {
+            let path = resolveSourcePath(source, spec[side].tiles);
+            spec[side] = {
+                ...spec[side],
+                tileManifest: {
+                    ...await fetchJson(path),
+                    base: path.replace(/[^/]*$/, "")
+                }
+            };
+        }
+    }
+    return spec;
+}
+
+// Board image split into a tile pyramid. The placeholder takes the place of the
+// full image in the layout and shows the coarsest level; the tiles of the level
+// matching the displayed resolution are laid over it.
+function TiledImage(props) {
+    let { manifest, style, width, imgRef } = props;
+    let coarsest = manifest.levels.length - 1;
+    let level = tileLevel(manifest, width * (window.devicePixelRatio || 1));
+    return <>
+        <img src={placeholderImage(manifest)}
+             alt="PCB Preview"
+             className="tight-shadow max-h-full"
+             style={{
+                 backgroundImage: `url(${manifest.base}${coarsest}/0_0.${manifest.format || "png"})`,
+                 backgroundSize: "100% 100%"
+             }}
+             ref={imgRef}/>
+        {
+            width === 0 || level === coarsest ? null :
+            <div className="absolute top-0 left-0" style={style}>
+            {
+                levelTiles(manifest, level).map(tile =>
+                    <img key={tile.file}
+                         src={manifest.base + tile.file}
+                         alt=""
+                         className="absolute max-w-none"
+                         style={{
+                             left: `${tile.left}%`,
+                             top: `${tile.top}%`,
+                             width: `${tile.width}%`,
+                             height: `${tile.height}%`
+                         }}/>
+                )
+            }
+            </div>
+        }
+    </>;
+}
+
 function bboxToPoly(bbox) {
     return [
         bbox.tl,
@@ -68,10 +138,28 @@ function bboxToPoly(bbox) {
 
 function PcbMap(props) {
     const { ref, width, height, entry } = useResizeObserver();
+    // Browsers without support for the image format get the PNG fallback
+    const [failedSrc, setFailedSrc] = useState(null);
 
-    let {area, src, transform, hotspots, className,
+    let {area, src, fallback, srcset, tiles, transform, hotspots, className,
          htmlAnnotations, svgAnnotations, ...others} = props;
 
+    // With multiple resolutions, the image gets the dimensions of the largest
+    // one so its layout doesn't depend on the chosen resolution. The image is
+    // loaded once we know its displayed size.
+    let imageAttributes = {};
+    if (srcset) {
+        let largest = srcset[srcset.length - 1];
+        let aspect = (area.br[1] - area.tl[1]) / (area.br[0] - area.tl[0]);
+        src = width > 0
+            ? chooseImage(srcset, width * (window.devicePixelRatio || 1)).file
+            : undefined;
+        imageAttributes = {
+            width: largest.width,
+            height: Math.round(largest.width * aspect)
+        };
+    }
+
     let mapX = x => 0;
     let mapY = y => 0;
     let overlayStyle = {};
@@ -90,10 +178,17 @@ function PcbMap(props) {
     }
 
     return <div className={"max-w-max relative top-0 left-0 h-full max-h-full " + className} {...others}>
-        <img src={src}
-                alt="PCB Preview"
-                className="tight-shadow max-h-full"
-                ref={ref}/>
+        {
+            tiles
+                ? <TiledImage manifest={tiles} style={overlayStyle}
+                              width={width} imgRef={ref}/>
+                : <img src={fallback && failedSrc === src ? fallback : src}
+                        alt="PCB Preview"
+                        className="tight-shadow max-h-full"
+                        onError={() => setFailedSrc(src)}
+                        {...imageAttributes}
+                        ref={ref}/>
+        }
         {/* SVG for drawing annotations */}
         <svg className="absolute top-0 left-0"
             style={overlayStyle}
@@ -128,12 +223,41 @@ function PcbMap(props) {
     </div>
 }
 
-function PcbHotSpot(props) {
-    let polySpec = props.shape
-        .map(p => props.transform(p))
+function isCircleShape(shape) {
+    return !Array.isArray(shape) && shape.radius !== undefined;
+}
+
+// Draw a pin or a component shape; the shape is either a polygon (list of
+// points) or a circle primitive
+function PcbShape(props) {
+    let {shape, transform, ...others} = props;
+    if (isCircleShape(shape)) {
+        let center = transform(shape.center);
+        return <circle cx={center[0]} cy={center[1]} r={shape.radius} {...others}/>;
+    }
+    return <polygon points={polygonPoints(shape, transform)} {...others}/>;
+}
+
+// Polygons are either lists of points or flat typed arrays of coordinates
+// (when loaded from the geometry sidecar)
+function polygonPoints(shape, transform) {
+    if (ArrayBuffer.isView(shape)) {
+        let points = [];
+        for (let i = 0; i < shape.length; i += 2) {
+            let p = transform([shape[i], shape[i + 1]]);
+            points.push(`${p[0]},${p[1]}`);
+        }
+        return points.join(" ");
+    }
+    return shape
+        .map(p => transform(p))
         .map(p => `${p[0]},${p[1]}`).join(" ");
-    return <polygon
-            points={polySpec}
+}
+
+function PcbHotSpot(props) {
+    return <PcbShape
+            shape={props.shape}
+            transform={props.transform}
             style={{"fill": "rgba(0,0,0,0)"}}
             strokeWidth="1"
             stroke="rgba(0,0,0,0)"
@@ -196,21 +320,19 @@ function ComponentHighlight(props) {
 
 function PinHighlight(props) {
     let pin = props.pin;
-    let shape = pin.shape;
-    let polySpec = shape
-        .map(p => props.transform(p))
-        .map(p => `${p[0]},${p[1]}`).join(" ");
     return <>
-        <polygon
-            points={polySpec}
+        <PcbShape
+            shape={pin.shape}
+            transform={props.transform}
             fill="none"
             strokeWidth="1"
             stroke="rgba(255, 255, 255, 200)"
             style={{
                 filter: "url(#sharpBlur)"
             }}/>
-        <polygon
-            points={polySpec}
+        <PcbShape
+            shape={pin.shape}
+            transform={props.transform}
             fill="none"
             strokeWidth="0.8"
             stroke={props.color}
@@ -218,8 +340,9 @@ function PinHighlight(props) {
                 filter: "url(#sharpBlur)",
                 "transformOrigin": "center"
             }}/>
-        <polygon
-            points={polySpec}
+        <PcbShape
+            shape={pin.shape}
+            transform={props.transform}
             fill="none"
             strokeWidth="0.3"
             stroke="rgba(0, 0, 0, 0.3)"/>
@@ -578,17 +701,16 @@ export function PinionWidget(props) {
     const { ref: observe, width } = useResizeObserver();
 
     useEffect(() => {
-        if ("specification" in props) {
-            setSpec(props.specification);
-        }
-        else {
-            fetchJson(props.source + "/spec.json")
-                .then(setSpec)
-                .catch(e => {
-                    console.log(e);
-                    setError(e.message + ": " + e.toString());
-                });
-        }
+        let specification = "specification" in props
+            ? Promise.resolve(props.specification)
+            : fetchJson(props.source + "/spec.json");
+        specification
+            .then(spec => loadSpecification(props.source, spec))
+            .then(setSpec)
+            .catch(e => {
+                console.log(e);
+                setError(e.message + ": " + e.toString());
+            });
     }, [props.source, props.specification]);
 
     let applyGroupVisibility = (groups, state, options = {}) => {
@@ -752,6 +874,10 @@ export function PinionWidget(props) {
                     onClick={handleMisClick}>
                     <PcbMap className="mx-auto max-h-full py-4"
                             src={resolveSourcePath(props.source, side.file)}
+                            fallback={side.fallback && resolveSourcePath(props.source, side.fallback)}
+                            srcset={side.srcset && side.srcset.map(x =>
+                                ({...x, file: resolveSourcePath(props.source, x.file)}))}
+                            tiles={side.tileManifest}
                             area={side.area}
                             transform={sideTransform}
                             htmlAnnotations={
@@ -0,0 +1,150 @@
+// Decoding of the compact specification format (format 2) into the plain
+// format (format 1). See pinion/specformat.py for the description of the
+// format.
+
+const UNITS_PER_MM = 1000;
+
+const FLAG_FRONT = 1;
+const FLAG_BACK = 2;
+const FLAG_HIGHLIGHT = 4;
+
+function decodeRect(rect) {
+    return {
+        tl: [rect[0] / UNITS_PER_MM, rect[1] / UNITS_PER_MM],
+        br: [rect[2] / UNITS_PER_MM, rect[3] / UNITS_PER_MM]
+    };
+}
+
+function decodeShape(shape) {
+    if (!Array.isArray(shape)) {
+        return {
+            center: [shape.center[0] / UNITS_PER_MM, shape.center[1] / UNITS_PER_MM],
+            radius: shape.radius / UNITS_PER_MM
+        };
+    }
+    let points = [];
+    let x = 0, y = 0;
+    for (let i = 0; i < shape.length; i += 2) {
+        x += shape[i];
+        y += shape[i + 1];
+        points.push([x / UNITS_PER_MM, y / UNITS_PER_MM]);
+    }
+    return points;
+}
+
+function decodeV2(spec) {
+    let s = spec.strings;
+    // With a geometry sidecar, the geometry is filled in by decodeGeometry
+    let sidecar = spec.geometry !== undefined;
+    let decodePin = ([name, description, alias, groups, flags, pos, bbox, shape]) => ({
+        ...(sidecar ? {} : {
+            shape: decodeShape(shape),
+            bbox: decodeRect(bbox),
+            pos: [pos[0] / UNITS_PER_MM, pos[1] / UNITS_PER_MM],
+            front: (flags & FLAG_FRONT) !== 0,
+            back: (flags & FLAG_BACK) !== 0
+        }),
+        name: s[name],
+        description: s[description],
+        alias: alias >= 0 ? s[alias] : false,
+        groups: groups.map(g => s[g])
+    });
+    let decodeComponent = ([ref, description, flags, bbox, groups, pins]) => ({
+        ...(sidecar ? {} : {
+            front: (flags & FLAG_FRONT) !== 0,
+            back: (flags & FLAG_BACK) !== 0,
+            bbox: decodeRect(bbox)
+        }),
+        ref: s[ref],
+        description: s[description],
+        highlight: (flags & FLAG_HIGHLIGHT) !== 0,
+        groups: groups.map(g => s[g]),
+        pins: pins.map(decodePin)
+    });
+
+    let decoded = {
+        pinionVersion: spec.pinionVersion,
+        name: s[spec.name],
+        description: s[spec.description],
+        components: spec.components.map(decodeComponent),
+        groups: spec.groups
+    };
+    ["front", "back", "geometry"].forEach(key => {
+        if (spec[key])
+            decoded[key] = spec[key];
+    });
+    return decoded;
+}
+
+export function decodeSpecification(spec) {
+    let format = spec.format === undefined ? 1 : spec.format;
+    if (format === 1)
+        return spec;
+    if (format === 2)
+        return decodeV2(spec);
+    throw new Error(`Unsupported specification format ${format}`);
+}
+
+// Binary geometry sidecar, see pinion/sidecar.py for the description of the
+// format. The shapes are kept as views into the vertex buffer.
+
+const GEOMETRY_MAGIC = "PNGM";
+const GEOMETRY_VERSION = 1;
+
+const ITEM_FRONT = 1;
+const ITEM_BACK = 2;
+const ITEM_CIRCLE = 4;
+
+export function decodeGeometry(spec, buffer) {
+    let magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic !== GEOMETRY_MAGIC)
+        throw new Error("The geometry sidecar is not a Pinion geometry file");
+    let [version, count, vertexCount] = new Uint32Array(buffer, 4, 3);
+    if (version !== GEOMETRY_VERSION)
+        throw new Error(`Unsupported geometry sidecar version ${version}`);
+    let offset = 16;
+    let view = (Type, length) => {
+        let array = new Type(buffer, offset, length);
+        offset += length * 4;
+        return array;
+    };
+    let flags = view(Int32Array, count);
+    let bboxes = view(Float32Array, 4 * count);
+    let positions = view(Float32Array, 2 * count);
+    let offsets = view(Int32Array, count + 1);
+    let vertices = view(Float32Array, vertexCount);
+
+    let geometry = i => ({
+        front: (flags[i] & ITEM_FRONT) !== 0,
+        back: (flags[i] & ITEM_BACK) !== 0,
+        bbox: {
+            tl: [bboxes[4 * i], bboxes[4 * i + 1]],
+            br: [bboxes[4 * i + 2], bboxes[4 * i + 3]]
+        }
+    });
+    let shape = i => {
+        let v = vertices.subarray(offsets[i], offsets[i + 1]);
+        if (flags[i] & ITEM_CIRCLE)
+            return { center: [v[0], v[1]], radius: v[2] };
+        return v;
+    };
+
+    let i = 0;
+    let components = spec.components.map(component => {
+        let c = { ...component, ...geometry(i) };
+        i++;
+        c.pins = component.pins.map(pin => {
+            let p = {
+                ...pin,
+                ...geometry(i),
+                pos: [positions[2 * i], positions[2 * i + 1]],
+                shape: shape(i)
+            };
+            i++;
+            return p;
+        });
+        return c;
+    });
+    let { geometry: _, ...rest } = spec;
+    return { ...rest, components };
+}
@@ -0,0 +1,8 @@
+// Board images in multiple resolutions, see imageSrcsets in pinion/generate.py
+
+// Choose the smallest image that still has at least the displayed resolution.
+// The srcset is sorted by width.
+export function chooseImage(srcset, displayWidth) {
+    let image = srcset.find(x => x.width >= displayWidth);
+    return image !== undefined ? image : srcset[srcset.length - 1];
+}
@@ -0,0 +1,40 @@
+// Tile pyramids of the board images, see pinion/tiles.py for the description
+// of the manifest.
+
+// Choose the coarsest level that still has at least the displayed resolution
+export function tileLevel(manifest, displayWidth) {
+    let level = 0;
+    manifest.levels.forEach((l, i) => {
+        if (l.width >= displayWidth)
+            level = i;
+    });
+    return level;
+}
+
+// List tiles of a given level with their placement in percents of the image
+export function levelTiles(manifest, level) {
+    let l = manifest.levels[level];
+    let size = manifest.tileSize;
+    let format = manifest.format || "png";
+    let tiles = [];
+    for (let column = 0; column < l.columns; column++) {
+        for (let row = 0; row < l.rows; row++) {
+            let left = column * size, top = row * size;
+            tiles.push({
+                file: `${level}/${column}_${row}.${format}`,
+                left: 100 * left / l.width,
+                top: 100 * top / l.height,
+                width: 100 * Math.min(size, l.width - left) / l.width,
+                height: 100 * Math.min(size, l.height - top) / l.height
+            });
+        }
+    }
+    return tiles;
+}
+
+// Transparent image with the full resolution dimensions, it makes a tiled
+// image take the same place in the layout as the full image would
+export function placeholderImage(manifest) {
+    let svg = `<svg xmlns="http://www.w3.org/2000/svg" width="${manifest.width}" height="${manifest.height}"/>`;
+    return "data:image/svg+xml," + encodeURIComponent(svg);
+}
@@ -0,0 +1,105 @@
+import assert from 'node:assert/strict';
+import test from 'node:test';
+import { decodeGeometry, decodeSpecification } from '../src/spec-format.js';
+
+const plain = {
+  pinionVersion: '0.0.0',
+  name: 'Board',
+  description: 'Test board',
+  components: [{
+    ref: 'J1',
+    description: 'Header',
+    front: true,
+    back: false,
+    highlight: true,
+    bbox: { tl: [0, 0], br: [10, 5] },
+    groups: ['Power'],
+    pins: [{
+      shape: [[1, 2], [1.5, 2], [1.5, 2.25]],
+      bbox: { tl: [1, 2], br: [1.5, 2.25] },
+      pos: [1.25, 2.125],
+      front: true,
+      back: true,
+      name: 'GND',
+      description: 'Ground',
+      alias: false,
+      groups: ['Power'],
+    }, {
+      shape: { center: [3, 4], radius: 0.5 },
+      bbox: { tl: [2.5, 3.5], br: [3.5, 4.5] },
+      pos: [3, 4],
+      front: true,
+      back: false,
+      name: 'GND2',
+      description: '',
+      alias: 'GND',
+      groups: [],
+    }],
+  }],
+  groups: { Power: {} },
+  front: { file: 'front.png', area: { tl: [0, 0], br: [10, 5] } },
+};
+
+const compact = {
+  format: 2,
+  pinionVersion: '0.0.0',
+  name: 0,
+  description: 1,
+  components: [[2, 3, 5, [0, 0, 10000, 5000], [4], [
+    [5, 6, -1, [4], 3, [1250, 2125], [1000, 2000, 1500, 2250],
+      [1000, 2000, 500, 0, 0, 250]],
+    [7, 8, 5, [], 1, [3000, 4000], [2500, 3500, 3500, 4500],
+      { center: [3000, 4000], radius: 500 }],
+  ]]],
+  groups: { Power: {} },
+  front: { file: 'front.png', area: { tl: [0, 0], br: [10, 5] } },
+  strings: ['Board', 'Test board', 'J1', 'Header', 'Power', 'GND', 'Ground', 'GND2', ''],
+};
+
+test('plain specifications pass through unchanged', () => {
+  assert.equal(decodeSpecification(plain), plain);
+});
+
+test('compact specifications decode into the plain format', () => {
+  assert.deepEqual(decodeSpecification(compact), plain);
+});
+
+test('unknown formats are rejected', () => {
+  assert.throws(() => decodeSpecification({ format: 3 }), /Unsupported specification format 3/);
+});
+
+function geometryBuffer() {
+  // One component followed by a polygon pin and a circle pin
+  let buffer = new ArrayBuffer(16 + 4 * (3 + 12 + 6 + 4 + 9));
+  new Uint8Array(buffer, 0, 4).set([...'PNGM'].map(c => c.charCodeAt(0)));
+  new Uint32Array(buffer, 4, 3).set([1, 3, 9]);
+  let offset = 16;
+  let write = (Type, values) => {
+    new Type(buffer, offset, values.length).set(values);
+    offset += 4 * values.length;
+  };
+  write(Int32Array, [1 | 2 | 8, 1 | 2, 1 | 4]);
+  write(Float32Array, [0, 0, 10, 5, 1, 2, 1.5, 2.25, 2.5, 3.5, 3.5, 4.5]);
+  write(Float32Array, [0, 0, 1.25, 2.125, 3, 4]);
+  write(Int32Array, [0, 0, 6, 9]);
+  write(Float32Array, [1, 2, 1.5, 2, 1.5, 2.25, 3, 4, 0.5]);
+  return buffer;
+}
+
+test('geometry sidecar fills in the geometry', () => {
+  let metadata = decodeSpecification({ ...compact, geometry: 'geometry.bin' });
+  let spec = decodeGeometry(metadata, geometryBuffer());
+  assert.equal(spec.geometry, undefined);
+  let [component] = spec.components;
+  assert.deepEqual(component.bbox, plain.components[0].bbox);
+  assert.equal(component.back, true);
+  let [polygon, circle] = component.pins;
+  assert.deepEqual(Array.from(polygon.shape), [1, 2, 1.5, 2, 1.5, 2.25]);
+  assert.deepEqual(polygon.pos, [1.25, 2.125]);
+  assert.deepEqual(circle.shape, { center: [3, 4], radius: 0.5 });
+  assert.equal(circle.alias, 'GND');
+});
+
+test('geometry sidecar with a foreign file is rejected', () => {
+  assert.throws(() => decodeGeometry(plain, new ArrayBuffer(16)), /not a Pinion geometry file/);
+});
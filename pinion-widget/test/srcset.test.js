@@ -0,0 +1,19 @@
+import assert from 'node:assert/strict';
+import test from 'node:test';
+import { chooseImage } from '../src/srcset.js';
+
+const srcset = [
+  { file: 'front-400w.png', width: 400 },
+  { file: 'front-150.png', width: 1181 },
+  { file: 'front.png', width: 2362 },
+];
+
+test('the smallest sufficient image is chosen', () => {
+  assert.equal(chooseImage(srcset, 300).file, 'front-400w.png');
+  assert.equal(chooseImage(srcset, 400).file, 'front-400w.png');
+  assert.equal(chooseImage(srcset, 800).file, 'front-150.png');
+});
+
+test('the largest image is chosen for large displays', () => {
+  assert.equal(chooseImage(srcset, 4000).file, 'front.png');
+});
@@ -0,0 +1,31 @@
+import assert from 'node:assert/strict';
+import test from 'node:test';
+import { levelTiles, tileLevel } from '../src/tiles.js';
+
+const manifest = {
+  tileSize: 512,
+  width: 2000,
+  height: 1000,
+  levels: [
+    { width: 2000, height: 1000, columns: 4, rows: 2 },
+    { width: 1000, height: 500, columns: 2, rows: 1 },
+    { width: 500, height: 250, columns: 1, rows: 1 },
+  ],
+};
+
+test('the coarsest sufficient level is chosen', () => {
+  assert.equal(tileLevel(manifest, 300), 2);
+  assert.equal(tileLevel(manifest, 500), 2);
+  assert.equal(tileLevel(manifest, 501), 1);
+  assert.equal(tileLevel(manifest, 1600), 0);
+  assert.equal(tileLevel(manifest, 5000), 0);
+});
+
+test('tiles cover the whole level', () => {
+  let tiles = levelTiles(manifest, 1);
+  assert.deepEqual(tiles.map(t => t.file), ['1/0_0.png', '1/1_0.png']);
+  assert.equal(tiles[0].width, 51.2);
+  assert.equal(tiles[1].left, 51.2);
+  assert.equal(tiles[1].left + tiles[1].width, 100);
+  assert.equal(tiles[1].height, 100);
+});
@@ -0,0 +1,40 @@
+from typing import Dict, Iterable, List, Tuple
+
+class BoardIndex:
+    """
+    Index of board footprints by reference and of their pads by name. Every
+    query on the board crosses the SWIG boundary, so we walk the board only
+    once and share the index among all consumers.
+    """
+    def __init__(self, board):
+        # Keep all footprints (even with duplicate references) in the board
+        # order; the reference lookup follows FindFootprintByReference and
+        # yields the first one.
+        self.footprints = list(board.GetFootprints())
+        self.references = {}
+        for footprint in self.footprints:
+            self.references.setdefault(footprint.GetReference(), footprint)
+        # SWIG creates a new proxy object on every call, hence we key the pad
+        # cache by proxies we hold in self.footprints.
+        self._pads = {}
+
+    def resolve(self, references: Iterable[str]) -> Dict[str, any]:
+        """
+        Return footprints for all given references. Report all missing
+        references at once.
+        """
+        references = list(references)
+        missing = [r for r in references if r not in self.references]
+        if len(missing) > 0:
+            raise RuntimeError("The following components were not found on the board: "
+                               + ", ".join(missing))
+        return {r: self.references[r] for r in references}
+
+    def pads(self, footprint) -> List[Tuple[str, any]]:
+        """
+        Return list of (name, pad) of a footprint in the footprint order
+        """
+        key = id(footprint)
+        if key not in self._pads:
+            self._pads[key] = (footprint, [(pad.GetName(), pad) for pad in footprint.Pads()])
+        return self._pads[key][1]
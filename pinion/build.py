@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+from pinion import __version__
+from pinion.common import RESOURCES
+
+MANIFEST_NAME = ".pinion-build.json"
+
+def fileDigest(path) -> str:
+    """
+    Compute content hash of a file
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def valueDigest(value: Any) -> str:
+    """
+    Compute hash of a JSON-serializable value
+    """
+    payload = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def optionDigest(value: Optional[str]) -> Optional[str]:
+    """
+    CLI options often reference files (e.g., style or remapping). If the value
+    is an existing file, return hash of its content, otherwise return the value
+    itself.
+    """
+    if value is not None and os.path.isfile(value):
+        return fileDigest(value)
+    return value
+
+def directoryDigest(paths: Iterable[str]) -> str:
+    """
+    Compute hash of the content of all files in the given directories (missing
+    directories are skipped)
+    """
+    digests = {}
+    for path in paths:
+        files = {}
+        for root, dirs, names in os.walk(path):
+            dirs.sort()
+            for name in sorted(names):
+                filename = os.path.join(root, name)
+                files[os.path.relpath(filename, path)] = fileDigest(filename)
+        digests[str(path)] = files
+    return valueDigest(digests)
+
+def resourcesDigest() -> str:
+    """
+    Compute hash of the bundled pinion-widget resources
+    """
+    return valueDigest({
+        name: fileDigest(os.path.join(RESOURCES, name))
+        for name in sorted(os.listdir(RESOURCES))
+        if os.path.isfile(os.path.join(RESOURCES, name))
+    })
+
+class BuildManifest:
+    """
+    Records the input hashes of individual build stages in the output
+    directory, so a subsequent build can skip the stages whose inputs haven't
+    changed. When disabled, no stage is ever considered fresh and nothing is
+    written.
+    """
+    def __init__(self, outputdir, enabled: bool = True):
+        self.outputdir = Path(outputdir)
+        self.enabled = enabled
+        self.stages = {}
+        if enabled:
+            self.stages = self._load()
+
+    @property
+    def path(self) -> Path:
+        return self.outputdir / MANIFEST_NAME
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # Results of a different Pinion version cannot be trusted
+        if not isinstance(manifest, dict) or manifest.get("pinionVersion") != __version__:
+            return {}
+        return manifest.get("stages", {})
+
+    def fresh(self, stage: str, key: str) -> bool:
+        """
+        Decide whether the stage was already built with the given key and all
+        its outputs still exist.
+        """
+        if not self.enabled:
+            return False
+        record = self.stages.get(stage)
+        if record is None or record["key"] != key:
+            return False
+        return all((self.outputdir / x).exists() for x in record["outputs"])
+
+    def result(self, stage: str) -> Any:
+        return self.stages[stage]["result"]
+
+    def record(self, stage: str, key: str, result: Any = None,
+               outputs: Iterable[str] = ()) -> None:
+        self.stages[stage] = {
+            "key": key,
+            "result": result,
+            "outputs": list(outputs)
+        }
+
+    def save(self) -> None:
+        if not self.enabled:
+            return
+        with open(self.path, "w") as f:
+            json.dump({
+                "pinionVersion": __version__,
+                "stages": self.stages
+            }, f, indent=4)
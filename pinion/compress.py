@@ -0,0 +1,75 @@
+import gzip
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, List
+
+# Static hosting can serve precompressed siblings (e.g., spec.json.gz next to
+# spec.json) without compressing on the fly. We compress with maximum levels
+# as the files are compressed once and downloaded many times.
+
+COMPRESSIONS = ("gz", "br")
+
+def gzipCompress(data: bytes) -> bytes:
+    # Fixed mtime makes the output reproducible
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+def brotliCompress(data: bytes) -> bytes:
+    try:
+        import brotli
+    except ImportError:
+        raise RuntimeError("Brotli compression requires the brotli package, " +
+                           "install it via 'pip install pinion[brotli]'") from None
+    return brotli.compress(data, quality=11)
+
+COMPRESSORS = {
+    "gz": gzipCompress,
+    "br": brotliCompress
+}
+
+def compressedPath(path: Path, method: str) -> Path:
+    return path.with_name(f"{path.name}.{method}")
+
+def isCompressionFresh(path: Path, method: str) -> bool:
+    target = compressedPath(path, method)
+    return target.exists() and target.stat().st_mtime_ns >= path.stat().st_mtime_ns
+
+def compressFile(path: Path, method: str) -> Path:
+    """
+    Write a compressed sibling of given file and return its path
+    """
+    target = compressedPath(path, method)
+    with open(path, "rb") as f:
+        data = COMPRESSORS[method](f.read())
+    with open(target, "wb") as f:
+        f.write(data)
+    return target
+
+def removeCompressed(path: Path, method: str) -> None:
+    try:
+        compressedPath(path, method).unlink()
+    except FileNotFoundError:
+        pass
+
+def compressFiles(paths: Iterable[Path], methods: Iterable[str]) -> List[Path]:
+    """
+    Write compressed siblings of given files in parallel. Only missing or
+    outdated siblings are written. Siblings of the other methods are removed,
+    so a static server never serves a stale file. Return the list of written
+    files.
+    """
+    paths = [Path(path) for path in paths]
+    methods = list(methods)
+    for method in methods:
+        if method not in COMPRESSORS:
+            raise RuntimeError(f"Unknown compression '{method}'")
+    for path in paths:
+        for method in COMPRESSIONS:
+            if method not in methods:
+                removeCompressed(path, method)
+    tasks = [(path, method) for path in paths for method in methods
+             if not isCompressionFresh(path, method)]
+    if len(tasks) == 0:
+        return []
+    # Both zlib and brotli release the GIL, so threads are sufficient
+    with ThreadPoolExecutor() as executor:
+        return list(executor.map(lambda task: compressFile(*task), tasks))
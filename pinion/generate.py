@@ -2,38 +2,146 @@ from pathlib import Path
 import pcbnew
 import json
 import base64
+import contextlib
+import functools
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from tempfile import TemporaryDirectory
 
-from typing import Tuple, Callable, Dict, Optional
+from typing import TYPE_CHECKING, Tuple, Callable, Dict, List, Optional
 
-from pcbdraw.plot import (PcbPlotter, PlotComponents, PlotSubstrate,
-                          load_remapping, mm2ki)
-from pcbdraw import convert
+if TYPE_CHECKING:
+    from pcbdraw.plot import PcbPlotter
 
 from pinion import __version__
+from pinion.board import BoardIndex
+from pinion.geometry import fitCircle, simplifyPolygon
+from pinion.specformat import encodeSpecification, decodeSpecification
+from pinion.sidecar import splitGeometry, joinGeometry
+from pinion.compress import COMPRESSIONS, compressFiles, removeCompressed
+from pinion.tiles import generateTiles
+from pinion.images import (convertImage, imageFile, fallbackFile, imageFiles,
+                           imageMimeType, optimizeImages, imageArgsOrDefault,
+                           variantFile, variantFiles, variantDpi, variantWidth,
+                           imageWidth, cropTransparent, croppedArea)
+from pinion.svg import optimizeSvg
+from pinion.libcache import FootprintCache
+from pinion.kicadcli import DEFAULT_RENDER_TIMEOUT, RenderSession
+from pinion.profile import stage
+from pinion.build import (BuildManifest, directoryDigest, fileDigest, valueDigest,
+                          resourcesDigest)
 
 def ki2mm(val):
     return val / 1000000.0
 
 def mm2ki(val):
-    return val * 1000000
+    return int(val * 1000000)
+
+# Detecting circles needs a tolerance (in mm) even if the pin shapes are not
+# simplified
+DEFAULT_CIRCLE_TOLERANCE = 0.005
+
+def padLayer(layers):
+    """
+    Given a list of pad copper layers, choose the one to take the shape from
+    """
+    return layers[0] if layers else pcbnew.F_Cu
 
 def padOutline(pad):
     """
     Given a pad return list of points forming a polygon for the pad shape
     """
-    layers = list(pad.GetLayerSet().CuStack())
-    layer = layers[0] if layers else pcbnew.F_Cu
+    layer = padLayer(list(pad.GetLayerSet().CuStack()))
     p = pad.GetEffectivePolygon(layer)
     outline = p.Outline(0)
     points = [outline.CPoint(i) for i in range(outline.PointCount())]
     return [(ki2mm(p.x), ki2mm(p.y)) for p in points]
 
-def serializeEdaRect(rect):
+def serializeRect(x, y, w, h):
     return {
-        "tl": (ki2mm(rect.GetX()), ki2mm(rect.GetY())),
-        "br": (ki2mm(rect.GetX() + rect.GetWidth()), ki2mm(rect.GetY() + rect.GetHeight()))
+        "tl": (ki2mm(x), ki2mm(y)),
+        "br": (ki2mm(x + w), ki2mm(y + h))
     }
 
+def serializeEdaRect(rect):
+    return serializeRect(rect.GetX(), rect.GetY(), rect.GetWidth(), rect.GetHeight())
+
+def padGeometryKey(pad, layer):
+    """
+    Return a key describing the pad shape independently of its position. Pads
+    with equal keys have equal geometry up to translation. Custom pads cannot
+    be described by a key, so we return None for them.
+    """
+    shape = pad.GetShape(layer)
+    if shape == pcbnew.PAD_SHAPE_CUSTOM:
+        return None
+    size = pad.GetSize(layer)
+    drill = pad.GetDrillSize()
+    offset = pad.GetOffset(layer)
+    delta = pad.GetDelta(layer)
+    return (layer, shape, size.x, size.y, drill.x, drill.y, pad.GetDrillShape(),
+            pad.GetOrientation().AsDegrees(), offset.x, offset.y, delta.x, delta.y,
+            pad.GetRoundRectRadiusRatio(layer), pad.GetChamferRectRatio(layer),
+            pad.GetChamferPositions(layer))
+
+class PadGeometryCache:
+    """
+    Cache of pad outlines and bounding boxes in pad-local coordinates (relative
+    to the pad position in KiCAD units). Boards usually contain many identical
+    pads, so we extract the geometry only once per pad shape and translate it.
+    As the coordinates are integers, the result is identical to extracting the
+    geometry of each pad.
+
+    The outlines can be simplified with given tolerance and outlines
+    approximating circles can be replaced by a circle primitive. Both
+    tolerances are in KiCAD units, None disables the feature.
+    """
+    def __init__(self, tolerance: Optional[int] = None,
+                 circleTolerance: Optional[int] = None):
+        self.tolerance = tolerance
+        self.circleTolerance = circleTolerance
+        self._geometry = {}
+
+    def _shape(self, outline):
+        if self.circleTolerance is not None:
+            circle = fitCircle(outline, self.circleTolerance)
+            if circle is not None:
+                return circle
+        return simplifyPolygon(outline, self.tolerance)
+
+    def _localGeometry(self, pad, layer, pos):
+        outline = pad.GetEffectivePolygon(layer).Outline(0)
+        points = [outline.CPoint(i) for i in range(outline.PointCount())]
+        bbox = pad.GetBoundingBox()
+        return (
+            self._shape([(p.x - pos.x, p.y - pos.y) for p in points]),
+            (bbox.GetX() - pos.x, bbox.GetY() - pos.y, bbox.GetWidth(), bbox.GetHeight())
+        )
+
+    def geometry(self, pad, layer, pos):
+        """
+        Return pad outline and bounding box serialized for the specification
+        """
+        key = padGeometryKey(pad, layer)
+        if key is None:
+            outline, bbox = self._localGeometry(pad, layer, pos)
+        else:
+            if key not in self._geometry:
+                self._geometry[key] = self._localGeometry(pad, layer, pos)
+            outline, bbox = self._geometry[key]
+        x, y = pos.x, pos.y
+        if isinstance(outline, tuple):
+            (cx, cy), radius = outline
+            shape = {
+                "center": [ki2mm(cx + x), ki2mm(cy + y)],
+                "radius": ki2mm(radius)
+            }
+        else:
+            shape = [(ki2mm(px + x), ki2mm(py + y)) for px, py in outline]
+        return shape, serializeRect(bbox[0] + x, bbox[1] + y, bbox[2], bbox[3])
+
 def intervalIntersection(a, b):
     """
     Compute interval intersection, return it as tuple or None
@@ -71,30 +179,95 @@ def overlappingRectComparator(a, b):
         return -1
     return 1
 
+def overlappingNeighbours(rects):
+    """
+    Given a list of serialized rects, find the overlapping ones. Returns a list
+    of indices of the overlapping rects for each rect. Touching rects are
+    considered overlapping (the same way as intervalIntersection does).
+
+    We use a sweep line along the x axis, so we compare only rects whose x
+    intervals overlap instead of all pairs.
+    """
+    spans = [(min(r["tl"][0], r["br"][0]), max(r["tl"][0], r["br"][0]),
+              min(r["tl"][1], r["br"][1]), max(r["tl"][1], r["br"][1]))
+             for r in rects]
+    neighbours = [[] for _ in rects]
+    active = []
+    for i in sorted(range(len(spans)), key=lambda i: spans[i][0]):
+        xMin, _, yMin, yMax = spans[i]
+        active = [j for j in active if spans[j][1] >= xMin]
+        for j in active:
+            if spans[j][2] <= yMax and yMin <= spans[j][3]:
+                neighbours[i].append(j)
+                neighbours[j].append(i)
+        active.append(i)
+    return neighbours
+
 def sortByRectangles(items):
     """
-    Implementation of insert sort on partial ordering for overlapping
-    rectangles.
+    Sort items on partial ordering for overlapping rectangles.
+
+    The result is the same as of an insertion sort using
+    overlappingRectComparator: each item is placed right after the last placed
+    item that should be below it, or at the beginning if there is no such item.
+    As only overlapping items can be below each other, we find them upfront and
+    never compare the rest. The order is kept as a linked list with integer
+    labels, so we can compare positions of items without searching for them.
     """
-    for i in range(1, len(items)):
-        for j in reversed(range(i)):
-            cmp = overlappingRectComparator(items[j]["bbox"], items[j+1]["bbox"])
-            if cmp == 1:
-                break
-            items[j], items[j + 1] = items[j + 1], items[j]
+    gap = 1 << 32
+    neighbours = overlappingNeighbours([x["bbox"] for x in items])
+    successor = [None] * len(items)
+    label = [0] * len(items)
+    head = None
+
+    def relabel():
+        i, l = head, 0
+        while i is not None:
+            label[i] = l
+            i, l = successor[i], l + gap
+
+    for i, item in enumerate(items):
+        placed = sorted((j for j in neighbours[i] if j < i),
+                        key=lambda j: label[j], reverse=True)
+        below = next((j for j in placed
+            if overlappingRectComparator(items[j]["bbox"], item["bbox"]) == 1), None)
+        if below is None:
+            label[i] = label[head] - gap if head is not None else 0
+            successor[i] = head
+            head = i
+            continue
+        after = successor[below]
+        if after is None:
+            label[i] = label[below] + gap
+        else:
+            if label[after] - label[below] < 2:
+                relabel()
+            label[i] = (label[below] + label[after]) // 2
+        successor[i] = after
+        successor[below] = i
+
+    order = []
+    i = head
+    while i is not None:
+        order.append(items[i])
+        i = successor[i]
+    items[:] = order
     return items
 
 
-def pinDefinition(spec, pad, footprint):
+def pinDefinition(spec, pad, footprint, geometryCache: Optional[PadGeometryCache] = None):
     """
     Given a pin specification and pad, construct description
     """
+    if geometryCache is None:
+        geometryCache = PadGeometryCache()
     # There is a bug in SWIG wrapper so we can't call test on layer set
     layers = list(pad.GetLayerSet().CuStack())
     pos = pad.GetPosition()
+    shape, bbox = geometryCache.geometry(pad, padLayer(layers), pos)
     return {
-        "shape": padOutline(pad),
-        "bbox": serializeEdaRect(pad.GetBoundingBox()),
+        "shape": shape,
+        "bbox": bbox,
         "pos": [ki2mm(pos.x), ki2mm(pos.y)],
         "front": pcbnew.F_Cu in layers,
         "back": pcbnew.B_Cu in layers,
@@ -104,25 +277,46 @@ def pinDefinition(spec, pad, footprint):
         "groups": getGroup(spec)
     }
 
-def pinsDefinition(spec, footprint):
+def pinsDefinition(spec, footprint, index: BoardIndex,
+                   geometryCache: Optional[PadGeometryCache] = None):
     """
     Given a pins definition and a footprint, construct description
     """
     if spec is None:
         return []
     return [
-        pinDefinition(spec[pad.GetName()], pad, footprint)
-        for pad in footprint.Pads()
-        if pad.GetName() in spec.keys()
+        pinDefinition(spec[name], pad, footprint, geometryCache)
+        for name, pad in index.pads(footprint)
+        if name in spec
     ]
 
-def componentsDefinition(spec, board):
+def pinGeometryCache(shapeArgs: Optional[Dict[str, any]]) -> PadGeometryCache:
+    """
+    Given pin shape options (tolerance in mm and whether to emit circles),
+    construct the pad geometry cache
+    """
+    if shapeArgs is None:
+        return PadGeometryCache()
+    tolerance = shapeArgs.get("tolerance", None)
+    circleTolerance = None
+    if shapeArgs.get("circles", False):
+        circleTolerance = mm2ki(tolerance if tolerance else DEFAULT_CIRCLE_TOLERANCE)
+    return PadGeometryCache(
+        tolerance=mm2ki(tolerance) if tolerance else None,
+        circleTolerance=circleTolerance)
+
+def componentsDefinition(spec, board, index: Optional[BoardIndex] = None,
+                         shapeArgs: Optional[Dict[str, any]] = None):
     """
     Given a specification, construct component description
     """
+    if index is None:
+        index = BoardIndex(board)
+    footprints = index.resolve(spec.keys())
+    geometryCache = pinGeometryCache(shapeArgs)
     defs = []
     for ref, s in spec.items():
-        footprint = board.FindFootprintByReference(ref)
+        footprint = footprints[ref]
         highlightBoth = s.get("highlightBoth", False)
         defs.append({
             "ref": ref,
@@ -132,20 +326,53 @@ def componentsDefinition(spec, board):
             "highlight": s.get("highlight", False),
             "bbox": serializeEdaRect(footprint.GetBoundingBox(False, False)),
             "groups": getGroup(s),
-            "pins": pinsDefinition(s.get("pins", None), footprint)
+            "pins": pinsDefinition(s.get("pins", None), footprint, index, geometryCache)
         })
     # Sort the components so overlapping components are placed on top of each
     # other
     sortByRectangles(defs)
     return defs
 
-def generateImage(boardfilename, outputfilename, dpi, pcbdrawArgs, back):
+def libraryPaths(libs: Optional[List[str]]) -> List[str]:
     """
-    Generate board image for the diagram. Returns bounding box (top let, bottom
-    right) active areas of the images in KiCAD native units.
+    Return the existing directories PcbDraw searches for the footprints of
+    given libraries, using the same data paths as createPlotter
     """
+    from pcbdraw.plot import PKG_BASE, get_global_datapaths
+
+    dataPath = [os.path.realpath(".")]
+    dataPath += [x for x in os.environ.get("PCBDRAW_LIB_PATH", "").split(":") if x]
+    dataPath.append(os.path.join(PKG_BASE, "resources"))
+    dataPath += get_global_datapaths()
+    paths = [os.path.join(p, l) for l in libs or [] for p in dataPath]
+    paths += [os.path.join(p, "footprints", l) for l in libs or [] for p in dataPath]
+    return [x for x in paths if os.path.isdir(x)]
+
+def libraryDigest(libs: Optional[List[str]]) -> Optional[str]:
+    """
+    Compute hash of the PcbDraw footprint libraries for the incremental build
+    """
+    if libs is None:
+        return None
+    return valueDigest({"libs": libs, "content": directoryDigest(libraryPaths(libs))})
 
-    plotter = PcbPlotter(boardfilename)
+def createPlotter(board, pcbdrawArgs) -> "PcbPlotter":
+    """
+    Set up a plotter according to pcbdrawArgs. The board is either a file name
+    or an already loaded pcbnew.BOARD, which the plotter then uses instead of
+    parsing the file again. PcbDraw 1.3 accepts only a file name, so the board
+    is then loaded again from its file. The plotter can be used to plot both
+    board sides.
+    """
+    # PcbDraw is needed only for the plotted images, so we import it lazily
+    from pcbdraw.plot import PcbPlotter, PlotComponents, PlotSubstrate, load_remapping
+
+    try:
+        plotter = PcbPlotter(board)
+    except TypeError:
+        if isinstance(board, str):
+            raise
+        plotter = PcbPlotter(board.GetFileName())
     plotter.setup_arbitrary_data_path(".")
     plotter.setup_env_data_path()
     plotter.setup_builtin_data_path()
@@ -156,8 +383,7 @@ def generateImage(boardfilename, outputfilename, dpi, pcbdrawArgs, back):
 
     if pcbdrawArgs["libs"] is not None:
         plotter.libs = pcbdrawArgs["libs"]
-    plotter.render_back = back
-    plotter.svg_precision = 5
+    plotter.svg_precision = pcbdrawArgs.get("precision", 5)
     if pcbdrawArgs["style"] is not None:
         plotter.resolve_style(pcbdrawArgs["style"])
 
@@ -182,17 +408,91 @@ def generateImage(boardfilename, outputfilename, dpi, pcbdrawArgs, back):
     plotter.plot_plan = [
         PlotSubstrate(drill_holes=True, outline_width=mm2ki(0.2)),
         plot_components]
+    # The library paths don't change between the plots, so we can remember
+    # the footprint lookups. The lookup is a PcbDraw internal, so we leave it
+    # alone if it is missing.
+    if pcbdrawArgs.get("footprintCache", False) and hasattr(plotter, "_get_model_file"):
+        plotter._get_model_file = functools.lru_cache(maxsize=None)(plotter._get_model_file)
+    return plotter
 
-    image = plotter.plot()
+def footprintCache(pcbdrawArgs) -> Optional[FootprintCache]:
+    return FootprintCache() if pcbdrawArgs.get("footprintCache", False) else None
 
-    convert.save(image, outputfilename, dpi)
+def generateImage(boardfilename, outputfilename, dpi, pcbdrawArgs, back,
+                  imageArgs=None):
+    """
+    Generate board image for the diagram. Returns bounding box (top let, bottom
+    right) active areas of the images in KiCAD native units.
+    """
+    return plotImage(createPlotter(boardfilename, pcbdrawArgs), outputfilename,
+                     dpi, back, imageArgs, footprintCache(pcbdrawArgs))
+
+def plotImage(plotter: "PcbPlotter", outputfilename, dpi, back, imageArgs=None,
+              cache: Optional[FootprintCache] = None):
+    """
+    Plot board side with given plotter, see generateImage. The image is stored
+    as PNG and converted according to imageArgs, see pinion.images. The
+    srcset variants are rasterized from the same plot. When SVG is requested,
+    the plot is optimized and stored directly. The footprint graphics are read
+    via the cache if given.
+    """
+    plotter.render_back = back
+    side = Path(outputfilename).stem
+    with stage(f"plot {side}"), \
+            cache.installed() if cache is not None else contextlib.nullcontext():
+        image = plotter.plot()
 
     tlx, tly, w, h = map(float, image.getroot().attrib["viewBox"].split())
-    return {
+    area = {
         "tl": (ki2mm(plotter.svg2ki(tlx)), ki2mm(plotter.svg2ki(tly))),
         "br": (ki2mm(plotter.svg2ki(tlx + w)), ki2mm(plotter.svg2ki(tly + h)))
     }
 
+    outputfilename = Path(outputfilename)
+    boardWidth = area["br"][0] - area["tl"][0]
+    imageArgs = imageArgsOrDefault(imageArgs)
+    if imageArgs["format"] == "svg":
+        if imageArgs["keepPng"]:
+            with stage(f"rasterize {side}"):
+                rasterizeImage(image, [(outputfilename, dpi)])
+        # Give the image the same size in pixels as the raster image would have
+        # so the widget lays it out the same way
+        root = image.getroot()
+        root.attrib["width"] = str(round(boardWidth / 25.4 * dpi))
+        root.attrib["height"] = str(round((area["br"][1] - area["tl"][1]) / 25.4 * dpi))
+        with stage(f"optimize svg {side}"):
+            optimizeSvg(image)
+            image.write(str(outputfilename.with_suffix(".svg")))
+        return area
+    variants = [(outputfilename.with_name(variantFile(side, v)), variantDpi(v, boardWidth))
+                for v in imageArgs["srcset"]]
+    with stage(f"rasterize {side}"):
+        rasterizeImage(image, [(outputfilename, dpi)] + variants)
+    with stage(f"convert {side}"):
+        convertImage(outputfilename, imageArgs)
+        for filename, _ in variants:
+            convertImage(filename, dict(imageArgs, keepPng=False))
+    return area
+
+def rasterizeImage(image, targets: List[Tuple[Path, int]]) -> None:
+    """
+    Rasterize the plotted SVG image into PNG files at given DPIs. The image is
+    serialized only once and the files are rasterized in parallel.
+    """
+    from pcbdraw import convert
+
+    if len(targets) == 1:
+        convert.save(image, str(targets[0][0]), targets[0][1])
+        return
+    with TemporaryDirectory() as d:
+        svgfilename = os.path.join(d, "board.svg")
+        image.write(svgfilename)
+        # The rasterization runs in external tools, so threads are sufficient
+        with ThreadPoolExecutor() as executor:
+            list(executor.map(
+                lambda target: convert.svgToPng(svgfilename, str(target[0]), target[1]),
+                targets))
+
 def collectGroups(components):
     groups = set()
     for c in components.values():
@@ -239,7 +539,9 @@ def getGroup(spec):
         return []
     return g
 
-def packPinion(outputdir):
+PACKED_FILES = ["pinion.js", "pinion.css", "template.html"]
+
+def packPinion(outputdir, compress: Tuple[str, ...] = ()):
     from pinion.get import get
     with open(outputdir / "pinion.js", "w") as f:
         get("js", f)
@@ -247,6 +549,7 @@ def packPinion(outputdir):
         get("css", f)
     with open(outputdir / "template.html", "w") as f:
         get("template", f)
+    compressFiles([outputdir / x for x in PACKED_FILES], compress)
 
 def embedResource(filename: Path, mimeType: str) -> str:
     with open(filename, "rb") as f:
@@ -260,10 +563,18 @@ def embeddedSpecification(outputdir: Path, specification: any):
     embedded = json.loads(json.dumps(specification))
     for side in ["front", "back"]:
         if side in embedded:
-            embedded[side]["file"] = embedResource(outputdir / embedded[side]["file"], "image/png")
+            for key in ["file", "fallback"]:
+                if key in embedded[side]:
+                    filename = outputdir / embedded[side][key]
+                    embedded[side][key] = embedResource(filename, imageMimeType(filename))
+            # Tiles and other resolutions are not embedded, the full image is
+            # used instead
+            embedded[side].pop("tiles", None)
+            embedded[side].pop("srcset", None)
     return embedded
 
-def embedPinion(outputdir: Path, specification: any):
+def embedPinion(outputdir: Path, specification: any, specFormat: int = 1,
+                compress: Tuple[str, ...] = ()):
     from pinion.get import get
     import io
 
@@ -272,7 +583,8 @@ def embedPinion(outputdir: Path, specification: any):
     get("js", js)
     get("css", css)
 
-    spec = scriptText(json.dumps(embeddedSpecification(outputdir, specification)))
+    spec = scriptText(encodeSpecification(
+        embeddedSpecification(outputdir, specification), specFormat))
     js = scriptText(js.getvalue())
     css = css.getvalue()
 
@@ -306,19 +618,48 @@ def embedPinion(outputdir: Path, specification: any):
   </body>
 </html>
 """)
+    compressFiles([outputdir / "index.html"], compress)
 
 ImageGenerator = Callable[[pcbnew.BOARD, Path, Tuple[str, ...]], Dict[str, Dict[str, Tuple[int, int]]]]
 
+def runSideJobs(tasks: Dict[str, Tuple[Callable, Tuple]], jobs: int) -> Dict[str, any]:
+    """
+    Given a mapping side -> (function, arguments), invoke the functions and
+    return a mapping side -> result. When more than one job is allowed, the
+    functions run in separate worker processes, each with its own pcbnew
+    instance. Therefore, the functions and their arguments have to be picklable.
+    """
+    if jobs <= 1 or len(tasks) <= 1:
+        return {side: fun(*args) for side, (fun, args) in tasks.items()}
+    # We spawn the workers instead of forking them as pcbnew doesn't survive
+    # forking reliably
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(jobs, len(tasks)), mp_context=context) as executor:
+        futures = {side: executor.submit(fun, *args) for side, (fun, args) in tasks.items()}
+        return {side: future.result() for side, future in futures.items()}
+
 def generateDrawnImages(board: pcbnew.BOARD, outputdir: Path, dpi: int, pcbdrawArgs: any,
-                        sides: Tuple[str, ...]) -> Dict[str, Dict[str, Tuple[int, int]]]:
-    result = {}
+                        sides: Tuple[str, ...], jobs: int = 1,
+                        imageArgs: Optional[Dict[str, any]] = None) -> Dict[str, Dict[str, Tuple[int, int]]]:
+    if jobs <= 1 or len(sides) <= 1:
+        # Load the libraries, style and remapping only once for both sides;
+        # the plotter shares the board we already have loaded (if the PcbDraw
+        # version allows it)
+        plotter = createPlotter(board, pcbdrawArgs)
+        cache = footprintCache(pcbdrawArgs)
+        return {side: plotImage(plotter, outputdir / f"{side}.png", dpi,
+                                side == "back", imageArgs, cache)
+                for side in ["front", "back"] if side in sides}
+    # The worker processes have to load the board on their own as pcbnew.BOARD
+    # cannot be passed to them
+    tasks = {}
     if "front" in sides:
-        result["front"] = generateImage(board.GetFileName(), outputdir / "front.png",
-            dpi, pcbdrawArgs, False)
+        tasks["front"] = (generateImage, (board.GetFileName(), outputdir / "front.png",
+            dpi, pcbdrawArgs, False, imageArgs))
     if "back" in sides:
-        result["back"] = generateImage(board.GetFileName(), outputdir / "back.png",
-            dpi, pcbdrawArgs, True)
-    return result
+        tasks["back"] = (generateImage, (board.GetFileName(), outputdir / "back.png",
+            dpi, pcbdrawArgs, True, imageArgs))
+    return runSideJobs(tasks, jobs)
 
 def boardAreaRect(board: pcbnew.BOARD):
     """
@@ -330,15 +671,157 @@ def boardAreaRect(board: pcbnew.BOARD):
         "br": (ki2mm(bbox.GetX() + bbox.GetWidth()), ki2mm(bbox.GetY() + bbox.GetHeight()))
     }
 
+def renderedAreaRect(board: pcbnew.BOARD, components: bool = True):
+    """
+    Get the bounding box in mm of what a 3D render of the board shows: the
+    board and, if the components are rendered, the footprints that overhang
+    its edge (e.g., connectors). The rendered images cropped to their content
+    span this area.
+    """
+    bbox = board.GetBoardEdgesBoundingBox()
+    if components:
+        footprints = [f.GetBoundingBox(False, False) for f in board.GetFootprints()]
+        if bbox.GetWidth() == 0 or bbox.GetHeight() == 0:
+            # A board without outline; the empty box would add the origin
+            bbox = footprints.pop(0) if footprints else bbox
+        for footprintBox in footprints:
+            bbox.Merge(footprintBox)
+    return {
+        "tl": (ki2mm(bbox.GetX()), ki2mm(bbox.GetY())),
+        "br": (ki2mm(bbox.GetX() + bbox.GetWidth()), ki2mm(bbox.GetY() + bbox.GetHeight()))
+    }
+
+# Default pixel budget of a rendered image, it matches the former fixed
+# resolution of 3000x3000 pixels
+DEFAULT_RENDER_PIXELS = 3000 * 3000
+
+def renderResolution(area, pixelsPerMm: Optional[float] = None,
+                     maxPixels: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Choose the render resolution so it follows the aspect ratio of the board
+    area (in mm). With pixelsPerMm, the resolution is given by the board size;
+    the total number of pixels is capped by maxPixels. Without pixelsPerMm, the
+    whole pixel budget is used. A board without outline (zero area) is
+    rendered into a square using the whole budget.
+    """
+    width = area["br"][0] - area["tl"][0]
+    height = area["br"][1] - area["tl"][1]
+    if maxPixels is None:
+        maxPixels = DEFAULT_RENDER_PIXELS
+    if width <= 0 or height <= 0:
+        side = max(1, math.isqrt(maxPixels))
+        return side, side
+    budgetScale = math.sqrt(maxPixels / (width * height))
+    scale = budgetScale if pixelsPerMm is None else min(pixelsPerMm, budgetScale)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def renderImage(boardfilename: str, outputfilename: Path, action: any,
+                imageArgs: Optional[Dict[str, any]] = None,
+                boardWidth: Optional[float] = None,
+                crop: bool = False) -> Tuple[Tuple[int, int, int, int], Tuple[int, int]]:
+    """
+    Render a single board side and save it as an image. The srcset variants
+    are downscaled from the rendered image; boardWidth (in mm) is needed for
+    the variants given by DPI. When crop is requested, the transparent margins
+    are removed. Return the crop box and the size of the rendered image.
+    """
+    from pcbdraw.renderer import renderBoard
+
+    side = Path(outputfilename).stem
+    with stage(f"render {side}"):
+        image = renderBoard(boardfilename, action)
+    with stage(f"save {side}"):
+        return saveRenderedImage(image, outputfilename, imageArgs, boardWidth, crop)
+
+def saveRenderedImage(image, outputfilename: Path,
+                      imageArgs: Optional[Dict[str, any]] = None,
+                      boardWidth: Optional[float] = None,
+                      crop: bool = False) -> Tuple[Tuple[int, int, int, int], Tuple[int, int]]:
+    """
+    Save the rendered PIL image together with its srcset variants, see
+    renderImage
+    """
+    from PIL import Image
+
+    size = image.size
+    box = (0, 0, size[0], size[1])
+    if crop:
+        image, box = cropTransparent(image)
+        if boardWidth is not None:
+            # The DPI of the variants relates to the cropped part
+            boardWidth *= image.size[0] / size[0]
+    image.save(outputfilename)
+    convertImage(outputfilename, imageArgs)
+
+    outputfilename = Path(outputfilename)
+    for variant in imageArgsOrDefault(imageArgs)["srcset"]:
+        width = variantWidth(variant, boardWidth)
+        height = max(1, round(image.size[1] * width / image.size[0]))
+        filename = outputfilename.with_name(variantFile(outputfilename.stem, variant))
+        image.resize((width, height), Image.LANCZOS).save(filename)
+        convertImage(filename, dict(imageArgsOrDefault(imageArgs), keepPng=False))
+    return box, size
+
 def generateRenderedImages(board: pcbnew.BOARD, outputdir: Path,
                      orthographic: bool, raytraced: bool, componets: bool,
-                     baseResolution: Tuple[int, int], sides: Tuple[str, ...]):
-    from pcbdraw.renderer import RenderAction, renderBoard, Side
+                     baseResolution: Tuple[int, int], sides: Tuple[str, ...],
+                     jobs: int = 1, imageArgs: Optional[Dict[str, any]] = None,
+                     crop: bool = False, backend: str = "pcbdraw",
+                     timeout: float = DEFAULT_RENDER_TIMEOUT):
+    """
+    Render the board sides. The backend is either "pcbdraw" (renderBoard of
+    PcbDraw, which runs one kicad-cli process at a time) or "kicad-cli" (Pinion
+    runs the kicad-cli processes concurrently, see pinion.kicadcli).
 
-    result = {}
-    if "front" in sides:
-        frontImage = renderBoard(board.GetFileName(), RenderAction(
-            side=Side.FRONT,
+    The image rendered by PcbDraw spans exactly the rendered area (see
+    renderedAreaRect); when the transparent margins are cropped, the area is
+    adjusted to the cropped image. kicad-cli frames the board with a margin of
+    its own, so its images are always cropped to the rendered content, which
+    then spans the rendered area.
+    """
+    if backend == "kicad-cli":
+        if not crop:
+            raise RuntimeError("Images rendered by kicad-cli have to be cropped")
+        if not componets:
+            raise RuntimeError("kicad-cli cannot render the board without components")
+        session = RenderSession(timeout=timeout)
+        with TemporaryDirectory() as renderdir:
+            generator = queueKicadCliRenders(board, Path(renderdir),
+                orthographic=orthographic, raytraced=raytraced,
+                baseResolution=baseResolution, sides=sides, session=session,
+                imageArgs=imageArgs)
+            with stage("render " + " ".join(sides)):
+                session.run()
+            return generator(board, outputdir, sides)
+
+    area = renderedAreaRect(board, componets)
+    crops = renderSidesByPcbdraw(board.GetFileName(), outputdir,
+        orthographic=orthographic, raytraced=raytraced, componets=componets,
+        baseResolution=baseResolution, sides=sides, jobs=jobs,
+        imageArgs=imageArgs, boardWidth=area["br"][0] - area["tl"][0], crop=crop)
+    return {side: croppedArea(sideArea(area, side), *crops[side]) for side in sides}
+
+def sideArea(area, side: str):
+    """
+    Get the area of the given board side; the back side is mirrored
+    """
+    if side == "front":
+        return area
+    return {
+        "tl": (-(area["br"][0]), area["tl"][1]),
+        "br": (-(area["tl"][0]), area["br"][1])
+    }
+
+def renderSidesByPcbdraw(boardfilename: str, outputdir: Path,
+                         orthographic: bool, raytraced: bool, componets: bool,
+                         baseResolution: Tuple[int, int], sides: Tuple[str, ...],
+                         jobs: int, imageArgs: Optional[Dict[str, any]],
+                         boardWidth: float, crop: bool):
+    from pcbdraw.renderer import RenderAction, Side
+
+    def renderTask(side: Side, outputfilename: Path):
+        return (renderImage, (boardfilename, outputfilename, RenderAction(
+            side=side,
             components=componets,
             raytraced=raytraced,
             orthographic=orthographic,
@@ -346,63 +829,331 @@ def generateRenderedImages(board: pcbnew.BOARD, outputdir: Path,
             width=baseResolution[0],
             height=baseResolution[1],
             padding=0,
-        ))
-        frontImage.save(outputdir / "front.png")
-        result["front"] = boardAreaRect(board)
+        ), imageArgs, boardWidth, crop))
 
+    tasks = {}
+    if "front" in sides:
+        tasks["front"] = renderTask(Side.FRONT, outputdir / "front.png")
     if "back" in sides:
-        backImage = renderBoard(board.GetFileName(), RenderAction(
-            side=Side.BACK,
-            components=componets,
-            raytraced=raytraced,
-            orthographic=orthographic,
-            transparent=True,
-            width=baseResolution[0],
-            height=baseResolution[1],
-            padding=0,
-        ))
-        backImage.save(outputdir / "back.png")
-        bArea = boardAreaRect(board)
-        result["back"] = {
-            "tl": (-(bArea["br"][0]), bArea["tl"][1]),
-            "br": (-(bArea["tl"][0]), bArea["br"][1])
-        }
-    return result
+        tasks["back"] = renderTask(Side.BACK, outputdir / "back.png")
+    return runSideJobs(tasks, jobs)
 
+def queueKicadCliRenders(board: pcbnew.BOARD, renderdir: Path,
+                         orthographic: bool, raytraced: bool,
+                         baseResolution: Tuple[int, int], sides: Tuple[str, ...],
+                         session: RenderSession,
+                         imageArgs: Optional[Dict[str, any]] = None) -> ImageGenerator:
+    """
+    Queue the kicad-cli renders of the board sides into the session; the raw
+    renders go to renderdir. Return an image generator that, once the session
+    has run, saves the rendered sides into the output directory.
+    """
+    from PIL import Image
 
-def generate(board: pcbnew.BOARD, specification: any, outputdir, pack: bool,
-             embed: bool, sides: Tuple[str, ...],
-             imageGenerator: ImageGenerator):
+    renders = {side: session.render(board.GetFileName(), renderdir / f"{side}.png",
+                                    side=side,
+                                    width=baseResolution[0],
+                                    height=baseResolution[1],
+                                    raytraced=raytraced,
+                                    orthographic=orthographic)
+               for side in sides}
+    area = renderedAreaRect(board)
+
+    def generator(board: pcbnew.BOARD, outputdir: Path, sides: Tuple[str, ...]):
+        for side in sides:
+            with Image.open(renders[side]) as image, stage(f"save {side}"):
+                # kicad-cli frames the board with a margin of its own choice,
+                # so we crop the image to the rendered content, which then
+                # spans the rendered area including overhanging components
+                image, _ = cropTransparent(image.convert("RGBA"))
+                saveRenderedImage(image, Path(outputdir) / f"{side}.png", imageArgs,
+                                  area["br"][0] - area["tl"][0], crop=False)
+        return {side: sideArea(area, side) for side in sides}
+    return generator
+
+def generateRenderedBatch(diagrams: List[Tuple[pcbnew.BOARD, any, Path]],
+                          session: RenderSession, orthographic: bool,
+                          raytraced: bool, sides: Tuple[str, ...],
+                          pixelsPerMm: Optional[float] = None,
+                          maxPixels: Optional[int] = None,
+                          imageKey: any = None, incremental: bool = False,
+                          imageArgs: Optional[Dict[str, any]] = None,
+                          **generateArgs):
     """
-    Generate board pinout diagram
+    Generate diagrams of several boards rendered by kicad-cli. The diagrams are
+    given as (board, specification, outputdir). The renders of all boards are
+    queued first and executed by a single run of the session, so the kicad-cli
+    processes of different boards overlap. The remaining arguments are shared
+    by all the diagrams, see generate.
     """
-    outputdir = Path(outputdir)
-    outputdir.mkdir(parents=True, exist_ok=True)
+    with TemporaryDirectory() as renderdir:
+        generators = []
+        for i, (board, _, outputdir) in enumerate(diagrams):
+            boarddir = Path(renderdir) / str(i)
+            boarddir.mkdir()
+            generators.append(queueKicadCliRenders(board, boarddir,
+                orthographic=orthographic, raytraced=raytraced,
+                baseResolution=renderResolution(renderedAreaRect(board), pixelsPerMm, maxPixels),
+                sides=staleImageSides(board, Path(outputdir), sides, imageKey,
+                                      incremental, imageArgs),
+                session=session, imageArgs=imageArgs))
+        with stage("render boards"):
+            session.run()
+        for (board, specification, outputdir), generator in zip(diagrams, generators):
+            generate(board=board, specification=specification, outputdir=outputdir,
+                     sides=sides, imageGenerator=generator, imageKey=imageKey,
+                     incremental=incremental, imageArgs=imageArgs, **generateArgs)
 
-    imageSources = imageGenerator(board, outputdir, sides)
+def stagedImageGenerator(imageGenerator: ImageGenerator,
+                         imageArgs: Optional[Dict[str, any]] = None) -> ImageGenerator:
+    """
+    Wrap the image generator so it writes into a staging directory and the
+    finished images atomically replace the ones in the output directory. The
+    previous images (e.g., previews) stay in place until then.
+    """
+    def generator(board: pcbnew.BOARD, outputdir: Path, sides: Tuple[str, ...]):
+        # The staging directory lives in the output directory so os.replace
+        # doesn't cross file systems
+        with TemporaryDirectory(dir=outputdir, prefix=".staging-") as stagingdir:
+            imageSources = imageGenerator(board, Path(stagingdir), sides)
+            for side in imageSources:
+                for filename in imageFiles(side, imageArgs):
+                    os.replace(Path(stagingdir) / filename, Path(outputdir) / filename)
+        return imageSources
+    return generator
 
+def imageKeys(sides: Tuple[str, ...], imageKey: any, boardKey: str,
+              imageArgs: Optional[Dict[str, any]] = None) -> Dict[str, str]:
+    return {
+        side: valueDigest({"board": boardKey, "image": imageKey, "side": side,
+                           "format": imageArgs})
+        for side in sides
+    }
+
+def staleImageSides(board: pcbnew.BOARD, outputdir: Path, sides: Tuple[str, ...],
+                    imageKey: any, incremental: bool,
+                    imageArgs: Optional[Dict[str, any]] = None) -> Tuple[str, ...]:
+    """
+    Get the sides whose images generate would regenerate, see
+    imageSourcesIncremental
+    """
+    if imageKey is None or not incremental:
+        return sides
+    manifest = BuildManifest(outputdir)
+    keys = imageKeys(sides, imageKey, fileDigest(board.GetFileName()), imageArgs)
+    return tuple(side for side in sides
+        if not manifest.fresh(f"image-{side}", keys[side]))
+
+def imageSourcesIncremental(board: pcbnew.BOARD, outputdir: Path,
+                            sides: Tuple[str, ...], imageGenerator: ImageGenerator,
+                            imageKey: any, boardKey: str, manifest: BuildManifest,
+                            imageArgs: Optional[Dict[str, any]] = None):
+    """
+    Invoke the image generator only on the sides whose inputs changed since the
+    last build. The areas of the remaining sides are taken from the manifest.
+    The freshly generated PNG images are optimized if requested by imageArgs.
+    """
+    keys = imageKeys(sides, imageKey, boardKey, imageArgs)
+    staleSides = tuple(side for side in sides
+        if imageKey is None or not manifest.fresh(f"image-{side}", keys[side]))
+    imageSources = imageGenerator(board, outputdir, staleSides) if staleSides else {}
+    with stage("optimize images"):
+        optimizeImages([outputdir / f for side in staleSides if side in imageSources
+                        for f in imageFiles(side, imageArgs)], imageArgs)
+    for side in staleSides:
+        if side in imageSources:
+            manifest.record(f"image-{side}", keys[side],
+                result=imageSources[side], outputs=imageFiles(side, imageArgs))
+    for side in sides:
+        if side not in staleSides:
+            imageSources[side] = manifest.result(f"image-{side}")
+    return imageSources
+
+def tilesIncremental(outputdir: Path, sides: Tuple[str, ...], tileSize: int,
+                     manifest: BuildManifest,
+                     imageArgs: Optional[Dict[str, any]] = None) -> Dict[str, str]:
+    """
+    Split the board images into tile pyramids, see pinion.tiles. Return a
+    mapping side -> pyramid manifest path.
+    """
+    tiles = {}
+    for side in sides:
+        image = outputdir / imageFile(side, imageArgs)
+        tilesKey = valueDigest({
+            "image": fileDigest(image),
+            "tileSize": tileSize,
+            "format": imageArgs
+        }) if manifest.enabled else None
+        if not manifest.fresh(f"tiles-{side}", tilesKey):
+            path = generateTiles(image, outputdir, side, tileSize, imageArgs)
+            manifest.record(f"tiles-{side}", tilesKey, result=path, outputs=[path])
+        tiles[side] = manifest.result(f"tiles-{side}")
+    return tiles
+
+def imageSrcsets(outputdir: Path, sides: Tuple[str, ...],
+                 imageArgs: Optional[Dict[str, any]] = None) -> Dict[str, any]:
+    """
+    List the resolutions of the board images as a mapping side -> list of
+    {"file", "width"} sorted by width
+    """
+    srcsets = {}
+    for side in sides:
+        files = [imageFile(side, imageArgs)] + variantFiles(side, imageArgs)
+        srcsets[side] = sorted(
+            ({"file": f, "width": imageWidth(outputdir / f)} for f in files),
+            key=lambda x: x["width"])
+    return srcsets
+
+def buildSpecification(board: pcbnew.BOARD, specification: any, imageSources,
+                       shapeArgs: Optional[Dict[str, any]] = None,
+                       tiles: Optional[Dict[str, str]] = None,
+                       imageArgs: Optional[Dict[str, any]] = None,
+                       srcsets: Optional[Dict[str, any]] = None):
+    """
+    Build the diagram specification (the content of spec.json)
+    """
+    with stage("componentsDefinition"):
+        components = componentsDefinition(specification["components"], board,
+                                          shapeArgs=shapeArgs)
     specification = {
         "pinionVersion": __version__,
         "name": specification["name"],
         "description": specification["description"],
-        "components": componentsDefinition(specification["components"], board),
+        "components": components,
         "groups": groupStructure(specification.get("groups", None), specification["components"])
     }
-    if "front" in imageSources:
-        specification["front"] = {
-            "file": "front.png",
-            "area": imageSources["front"]
-        }
-    if "back" in imageSources:
-        specification["back"] = {
-            "file": "back.png",
-            "area": imageSources["back"]
+    for side in ["front", "back"]:
+        if side not in imageSources:
+            continue
+        specification[side] = {
+            "file": imageFile(side, imageArgs),
+            "area": imageSources[side]
         }
+        if fallbackFile(side, imageArgs):
+            specification[side]["fallback"] = fallbackFile(side, imageArgs)
+    for side, path in (tiles or {}).items():
+        specification[side]["tiles"] = path
+    for side, srcset in (srcsets or {}).items():
+        specification[side]["srcset"] = srcset
+    return specification
 
-    with open(outputdir / "spec.json", "w") as f:
-        f.write(json.dumps(specification, indent=4))
+def writeSpecification(outputdir: Path, specification: any, specFormat: int,
+                       geometrySidecar: bool):
+    """
+    Write spec.json and optionally the geometry sidecar. A sidecar left by a
+    previous build is removed when it is not requested.
+    """
+    # The files are replaced atomically, so a diagram that is being served
+    # (e.g., during progressive rendering) never shows a partial file
+    if geometrySidecar:
+        specification, geometry = splitGeometry(specification, "geometry.bin")
+        with open(outputdir / "geometry.bin.tmp", "wb") as f:
+            f.write(geometry)
+        os.replace(outputdir / "geometry.bin.tmp", outputdir / "geometry.bin")
+    with open(outputdir / "spec.json.tmp", "w") as f:
+        f.write(encodeSpecification(specification, specFormat, indent=4))
+    os.replace(outputdir / "spec.json.tmp", outputdir / "spec.json")
+    if not geometrySidecar:
+        (outputdir / "geometry.bin").unlink(missing_ok=True)
+        for method in COMPRESSIONS:
+            removeCompressed(outputdir / "geometry.bin", method)
+
+def readSpecification(outputdir: Path):
+    """
+    Read specification (including the geometry sidecar if present) back
+    """
+    with open(outputdir / "spec.json") as f:
+        specification = decodeSpecification(f.read())
+    if "geometry" in specification:
+        with open(outputdir / specification["geometry"], "rb") as f:
+            specification = joinGeometry(specification, f.read())
+    return specification
+
+def generate(board: pcbnew.BOARD, specification: any, outputdir, pack: bool,
+             embed: bool, sides: Tuple[str, ...],
+             imageGenerator: ImageGenerator, imageKey: any = None,
+             incremental: bool = False, shapeArgs: Optional[Dict[str, any]] = None,
+             specFormat: int = 1, geometrySidecar: bool = False,
+             compress: Tuple[str, ...] = (), tileSize: Optional[int] = None,
+             imageArgs: Optional[Dict[str, any]] = None):
+    """
+    Generate board pinout diagram. When incremental build is requested, the
+    stages whose inputs didn't change since the last build are skipped. The
+    image generator inputs (besides the board) are described by imageKey; if it
+    is None, the images are always regenerated. Pin shapes can be simplified
+    via shapeArgs, see pinGeometryCache. The specification is stored in
+    specFormat, see pinion.specformat. For large boards, the pin and component
+    geometry can be stored in a binary sidecar, see pinion.sidecar. The text
+    outputs get precompressed siblings for every method in compress, see
+    pinion.compress. When tileSize is given, the board images are also split
+    into tile pyramids, see pinion.tiles. The image format is given by
+    imageArgs, see pinion.images; the image generator has to follow it.
+    """
+    if imageArgsOrDefault(imageArgs)["format"] == "svg":
+        if tileSize is not None or imageArgsOrDefault(imageArgs)["srcset"]:
+            raise RuntimeError("SVG images cannot be split into tiles or generated in multiple resolutions")
 
-    if pack:
-        packPinion(outputdir)
+    outputdir = Path(outputdir)
+    outputdir.mkdir(parents=True, exist_ok=True)
+
+    manifest = BuildManifest(outputdir, enabled=incremental)
+    boardKey = fileDigest(board.GetFileName()) if incremental else None
+
+    with stage("images"):
+        imageSources = imageSourcesIncremental(board, outputdir, sides,
+            imageGenerator, imageKey, boardKey, manifest, imageArgs)
+
+    with stage("tiles"):
+        tiles = tilesIncremental(outputdir, sides, tileSize, manifest, imageArgs) \
+            if tileSize is not None else {}
+    srcsets = imageSrcsets(outputdir, sides, imageArgs) \
+        if imageArgsOrDefault(imageArgs)["srcset"] else {}
+
+    specKey = valueDigest({
+        "board": boardKey,
+        "specification": specification,
+        "shapes": shapeArgs,
+        "format": specFormat,
+        "sidecar": geometrySidecar,
+        "images": imageSources,
+        "tiles": tiles,
+        "imageFormat": imageArgs,
+        "srcsets": srcsets
+    }) if incremental else None
+    specFiles = ["spec.json"] + (["geometry.bin"] if geometrySidecar else [])
+    if manifest.fresh("spec", specKey):
+        specification = readSpecification(outputdir)
+    else:
+        specification = buildSpecification(board, specification, imageSources,
+                                           shapeArgs, tiles, imageArgs, srcsets)
+        with stage("write specification"):
+            writeSpecification(outputdir, specification, specFormat, geometrySidecar)
+        manifest.record("spec", specKey, outputs=specFiles)
+
+    resourcesKey = resourcesDigest() if incremental else None
+    if pack and not manifest.fresh("pack", resourcesKey):
+        with stage("pack"):
+            packPinion(outputdir)
+        manifest.record("pack", resourcesKey, outputs=PACKED_FILES)
     if embed:
-        embedPinion(outputdir, specification)
+        embedKey = valueDigest({
+            "spec": specKey,
+            "resources": resourcesKey,
+            "images": [fileDigest(outputdir / specification[side]["file"])
+                for side in ["front", "back"] if side in specification]
+        }) if incremental else None
+        if not manifest.fresh("embed", embedKey):
+            with stage("embed"):
+                embedPinion(outputdir, specification, specFormat)
+            manifest.record("embed", embedKey, outputs=["index.html"])
+
+    # Compress all outputs at once, including the ones of the skipped stages,
+    # so the compressed siblings follow the --compress option. Only missing or
+    # outdated siblings are written; siblings of methods no longer requested
+    # are removed.
+    compressed = specFiles + (PACKED_FILES if pack else []) + \
+        (["index.html"] if embed else [])
+    with stage("compress"):
+        compressFiles([outputdir / x for x in compressed], compress)
+
+    manifest.save()
@@ -0,0 +1,79 @@
+import math
+from typing import List, Optional, Sequence, Tuple
+
+Point = Tuple[float, float]
+
+def distance(a: Point, b: Point) -> float:
+    return math.hypot(a[0] - b[0], a[1] - b[1])
+
+def segmentDistance(p: Point, a: Point, b: Point) -> float:
+    """
+    Compute distance of point p from segment ab
+    """
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    length = dx * dx + dy * dy
+    if length == 0:
+        return distance(p, a)
+    t = ((p[0] - a[0]) * dx + (p[1] - a[1]) * dy) / length
+    t = max(0, min(1, t))
+    return distance(p, (a[0] + t * dx, a[1] + t * dy))
+
+def simplifyPolyline(points: Sequence[Point], tolerance: float) -> List[Point]:
+    """
+    Simplify an open polyline via the Douglas-Peucker algorithm. The end points
+    are always kept.
+    """
+    if len(points) <= 2:
+        return list(points)
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        index, maxDistance = None, tolerance
+        for i in range(first + 1, last):
+            d = segmentDistance(points[i], points[first], points[last])
+            if d > maxDistance:
+                index, maxDistance = i, d
+        if index is not None:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [p for p, k in zip(points, keep) if k]
+
+def simplifyPolygon(points: Sequence[Point], tolerance: Optional[float]) -> List[Point]:
+    """
+    Simplify a closed polygon so no removed vertex is further than tolerance
+    from the resulting outline. If the simplification would degenerate the
+    polygon, return it unchanged.
+    """
+    if tolerance is None or tolerance <= 0 or len(points) <= 3:
+        return list(points)
+    # Split the ring into two polylines at the first vertex and the vertex
+    # farthest from it; both of them are surely kept.
+    far = max(range(len(points)), key=lambda i: distance(points[0], points[i]))
+    first = simplifyPolyline(points[:far + 1], tolerance)
+    second = simplifyPolyline(list(points[far:]) + [points[0]], tolerance)
+    simplified = first[:-1] + second[:-1]
+    if len(simplified) < 3:
+        return list(points)
+    return simplified
+
+def fitCircle(points: Sequence[Point], tolerance: float) -> Optional[Tuple[Point, float]]:
+    """
+    Decide whether a polygon approximates a circle within tolerance. Return
+    (center, radius) if so, otherwise None. Both the vertices and the edge
+    midpoints have to be within the tolerance from the circle, so regular
+    polygons with few vertices (e.g., squares) are not considered circles.
+    """
+    if len(points) < 3:
+        return None
+    center = (sum(p[0] for p in points) / len(points),
+              sum(p[1] for p in points) / len(points))
+    midpoints = [((a[0] + b[0]) / 2, (a[1] + b[1]) / 2)
+                 for a, b in zip(points, list(points[1:]) + [points[0]])]
+    radii = [distance(center, p) for p in list(points) + midpoints]
+    radius = (max(radii) + min(radii)) / 2
+    if radius == 0 or max(radii) - radius > tolerance:
+        return None
+    return center, radius
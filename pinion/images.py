@@ -0,0 +1,213 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# The image generators always produce a PNG. When a different format is
+# requested via imageArgs, the PNG is converted and removed (unless it should
+# be kept as a fallback for browsers without support for the format). The
+# exception is SVG, which the plotted image generator writes directly.
+#
+# imageArgs is a dictionary with the keys:
+# - format: one of IMAGE_FORMATS
+# - quality: quality of the lossy formats (0-100) or None for the default
+# - keepPng: keep the PNG as a fallback
+# - optimize: optimize the PNG images, see optimizePng
+# - colors: quantize the PNG images to given number of colors (or None)
+# - srcset: list of additional resolutions of the images; each is either a DPI
+#   ("150") or a width in pixels ("800w"). See variantFile.
+
+IMAGE_FORMATS = {
+    "png": "image/png",
+    "webp": "image/webp",
+    "avif": "image/avif",
+    "svg": "image/svg+xml"
+}
+
+DEFAULT_IMAGE_ARGS = {
+    "format": "png",
+    "quality": None,
+    "keepPng": False,
+    "optimize": False,
+    "colors": None,
+    "srcset": ()
+}
+
+def imageArgsOrDefault(imageArgs: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    return dict(DEFAULT_IMAGE_ARGS, **(imageArgs or {}))
+
+def imageFile(side: str, imageArgs: Optional[Dict[str, Any]] = None) -> str:
+    return f"{side}.{imageArgsOrDefault(imageArgs)['format']}"
+
+def fallbackFile(side: str, imageArgs: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    imageArgs = imageArgsOrDefault(imageArgs)
+    if imageArgs["format"] != "png" and imageArgs["keepPng"]:
+        return f"{side}.png"
+    return None
+
+def variantFile(side: str, variant: str, imageArgs: Optional[Dict[str, Any]] = None) -> str:
+    return f"{side}-{variant}.{imageArgsOrDefault(imageArgs)['format']}"
+
+def variantFiles(side: str, imageArgs: Optional[Dict[str, Any]] = None) -> List[str]:
+    return [variantFile(side, v, imageArgs)
+            for v in imageArgsOrDefault(imageArgs)["srcset"]]
+
+def imageFiles(side: str, imageArgs: Optional[Dict[str, Any]] = None) -> List[str]:
+    """
+    List all image files generated for given side
+    """
+    fallback = fallbackFile(side, imageArgs)
+    return [imageFile(side, imageArgs)] + ([fallback] if fallback else []) + \
+        variantFiles(side, imageArgs)
+
+def variantWidth(variant: str, boardWidth: float) -> int:
+    """
+    Given a srcset variant and the board width in mm, return the image width in
+    pixels
+    """
+    try:
+        if variant.endswith("w"):
+            width = int(variant[:-1])
+        else:
+            width = round(float(variant) * boardWidth / 25.4)
+    except ValueError:
+        raise RuntimeError(f"Invalid image resolution '{variant}'; specify DPI (e.g., 150) or width (e.g., 800w)") from None
+    if width < 1:
+        raise RuntimeError(f"Invalid image resolution '{variant}'")
+    return width
+
+def variantDpi(variant: str, boardWidth: float) -> int:
+    """
+    Given a srcset variant and the board width in mm, return the DPI to
+    rasterize the image at
+    """
+    return max(1, round(variantWidth(variant, boardWidth) * 25.4 / boardWidth))
+
+def imageWidth(filename: Path) -> int:
+    from PIL import Image
+
+    with Image.open(filename) as image:
+        return image.size[0]
+
+def imageMimeType(filename) -> str:
+    return IMAGE_FORMATS[Path(filename).suffix[1:].lower()]
+
+def saveImage(image, filename: Path, imageArgs: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Save PIL image into a file in the format given by imageArgs
+    """
+    from PIL import Image
+
+    imageArgs = imageArgsOrDefault(imageArgs)
+    imageFormat = imageArgs["format"]
+    if imageFormat == "png":
+        image.save(filename, format="PNG")
+        return
+    if f".{imageFormat}" not in Image.registered_extensions():
+        raise RuntimeError(f"Your Pillow installation doesn't support {imageFormat.upper()} images")
+    options = {}
+    if imageArgs["quality"] is not None:
+        options["quality"] = imageArgs["quality"]
+    image.save(filename, format=imageFormat.upper(), **options)
+
+def convertImage(pngfile: Path, imageArgs: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Convert the generated PNG into the format given by imageArgs
+    """
+    from PIL import Image
+
+    imageArgs = imageArgsOrDefault(imageArgs)
+    if imageArgs["format"] == "png":
+        return
+    pngfile = Path(pngfile)
+    with Image.open(pngfile) as image:
+        saveImage(image, pngfile.with_suffix(f".{imageArgs['format']}"), imageArgs)
+    if not imageArgs["keepPng"]:
+        pngfile.unlink()
+
+def cropTransparent(image):
+    """
+    Crop fully transparent margins of the image. Return the cropped image and
+    the crop box (left, top, right, bottom) in pixels of the original image.
+    """
+    box = image.getchannel("A").getbbox() if "A" in image.getbands() else None
+    if box is None:
+        # Nothing to crop or nothing visible at all
+        return image, (0, 0, image.size[0], image.size[1])
+    return image.crop(box), box
+
+def croppedArea(area, box, size):
+    """
+    Given the area (in mm) of the whole image, the crop box and the image size
+    (in pixels), return the area of the cropped image
+    """
+    width = area["br"][0] - area["tl"][0]
+    height = area["br"][1] - area["tl"][1]
+    return {
+        "tl": (area["tl"][0] + box[0] / size[0] * width,
+               area["tl"][1] + box[1] / size[1] * height),
+        "br": (area["tl"][0] + box[2] / size[0] * width,
+               area["tl"][1] + box[3] / size[1] * height)
+    }
+
+def pngCandidates(image, colors: Optional[int]):
+    """
+    Yield candidate encodings of the image. The lossless ones come first; a
+    palette image is lossless only if the image has at most 256 colors.
+    """
+    from PIL import Image, ImageChops
+
+    yield image
+    rgba = image.convert("RGBA")
+    if colors is not None:
+        yield rgba.quantize(colors, method=Image.Quantize.FASTOCTREE)
+        return
+    if rgba.getcolors(256) is not None:
+        palette = rgba.quantize(256, method=Image.Quantize.FASTOCTREE)
+        if ImageChops.difference(palette.convert("RGBA"), rgba).getbbox() is None:
+            yield palette
+    if rgba.getchannel("A").getextrema() == (255, 255):
+        yield rgba.convert("RGB")
+
+def optimizePng(filename: Path, colors: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Re-encode the PNG with maximum compression and choose the smallest of the
+    candidate encodings (see pngCandidates). Return the file size before and
+    after the optimization.
+    """
+    from PIL import Image
+    import io
+
+    filename = Path(filename)
+    before = filename.stat().st_size
+    best = None
+    with Image.open(filename) as image:
+        image.load()
+        for candidate in pngCandidates(image, colors):
+            encoded = io.BytesIO()
+            candidate.save(encoded, format="PNG", optimize=True)
+            if best is None or encoded.tell() < len(best):
+                best = encoded.getvalue()
+    if len(best) >= before:
+        return before, before
+    tmpName = filename.with_name(filename.name + ".tmp")
+    with open(tmpName, "wb") as f:
+        f.write(best)
+    os.replace(tmpName, filename)
+    return before, len(best)
+
+def optimizeImages(filenames: Iterable[Path], imageArgs: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Optimize the PNG images in parallel and report the saved bytes
+    """
+    imageArgs = imageArgsOrDefault(imageArgs)
+    if not imageArgs["optimize"]:
+        return
+    filenames = [Path(x) for x in filenames if Path(x).suffix == ".png"]
+    with ThreadPoolExecutor() as executor:
+        sizes = list(executor.map(
+            lambda filename: optimizePng(filename, imageArgs["colors"]), filenames))
+    for filename, (before, after) in zip(filenames, sizes):
+        print(f"Optimized {filename.name}: {before} -> {after} bytes " +
+              f"({before - after} bytes saved)", file=sys.stderr)
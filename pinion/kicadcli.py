@@ -0,0 +1,137 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Rendering of the board via `kicad-cli pcb render` (KiCad 9 and newer) run by
+# Pinion itself. PcbDraw renders via kicad-cli as well, but its renderBoard
+# blocks on a single process with a fixed timeout of 300 seconds. Here, every
+# side is rendered by a separate kicad-cli process; the renders are collected
+# in a RenderSession, the processes run concurrently and they are killed on
+# timeout or when another render fails.
+
+DEFAULT_RENDER_TIMEOUT = 300
+
+# How often (in seconds) runCommands checks the running processes
+POLL_INTERVAL = 0.05
+
+def findKicadCli() -> str:
+    """
+    Locate the kicad-cli executable; the KICAD_CLI environment variable takes
+    precedence over PATH
+    """
+    override = os.environ.get("KICAD_CLI")
+    if override:
+        if os.path.isfile(override) and os.access(override, os.X_OK):
+            return override
+        raise RuntimeError(f"KICAD_CLI does not point to an executable: {override}")
+    path = shutil.which("kicad-cli")
+    if path is None:
+        raise RuntimeError("kicad-cli not found; install KiCad 9 or newer or set KICAD_CLI")
+    return path
+
+def isKicadCliAvailable() -> bool:
+    try:
+        findKicadCli()
+        return True
+    except RuntimeError:
+        return False
+
+def renderCommand(executable: str, boardfilename: str, outputfilename: Path,
+                  side: str, width: int, height: int, raytraced: bool,
+                  orthographic: bool) -> List[str]:
+    """
+    Build the kicad-cli command rendering given side ("front" or "back") of the
+    board into a PNG with transparent background
+    """
+    command = [executable, "pcb", "render",
+               "--output", str(outputfilename),
+               "--side", "top" if side == "front" else "bottom",
+               "--width", str(width),
+               "--height", str(height),
+               "--quality", "high" if raytraced else "basic",
+               "--background", "transparent"]
+    if not orthographic:
+        command.append("--perspective")
+    command.append(str(boardfilename))
+    return command
+
+def processOutput(output) -> str:
+    output.seek(0)
+    return output.read().decode("utf-8", errors="replace").strip()
+
+def runCommands(commands: Dict[str, List[str]],
+                timeout: float = DEFAULT_RENDER_TIMEOUT,
+                jobs: Optional[int] = None) -> None:
+    """
+    Run the commands (given as a mapping name -> command), at most jobs of them
+    at once (all by default). Each command has to finish within the timeout (in
+    seconds). When any of them fails, the running commands are killed, the
+    ones that haven't started yet are skipped and RuntimeError is raised.
+    """
+    pending = list(commands.items())
+    jobs = jobs or len(pending)
+    running = {}
+    try:
+        while pending or running:
+            while pending and len(running) < jobs:
+                name, command = pending.pop(0)
+                # The output goes to a file, a pipe nobody reads could fill up
+                output = tempfile.TemporaryFile()
+                process = subprocess.Popen(command, stdout=output, stderr=subprocess.STDOUT)
+                running[name] = (process, output, time.monotonic())
+            time.sleep(POLL_INTERVAL)
+            for name, (process, output, start) in list(running.items()):
+                returncode = process.poll()
+                if returncode is None:
+                    if time.monotonic() - start > timeout:
+                        raise RuntimeError(f"Rendering of {name} by kicad-cli timed out after {timeout} seconds")
+                    continue
+                del running[name]
+                detail = processOutput(output)
+                output.close()
+                if returncode != 0:
+                    raise RuntimeError(f"Rendering of {name} by kicad-cli failed (exit code {returncode}):\n{detail}")
+    finally:
+        for process, output, _ in running.values():
+            process.kill()
+            process.wait()
+            output.close()
+
+class RenderSession:
+    """
+    Batch of renders sharing a single kicad-cli lookup. The renders are queued
+    by render() and executed together by run(), so the renders of all sides,
+    and possibly of several boards (see pinion.generate.generateRenderedBatch),
+    overlap.
+    """
+    def __init__(self, executable: Optional[str] = None,
+                 timeout: float = DEFAULT_RENDER_TIMEOUT,
+                 jobs: Optional[int] = None):
+        self.executable = executable or findKicadCli()
+        self.timeout = timeout
+        self.jobs = jobs
+        self.pending = {}
+
+    def render(self, boardfilename: str, outputfilename: Path, side: str,
+               width: int, height: int, raytraced: bool,
+               orthographic: bool) -> Path:
+        """
+        Queue a render, return the path of the image it will produce
+        """
+        name = f"{Path(boardfilename).name} ({side})"
+        if name in self.pending:
+            name = f"{name} #{len(self.pending)}"
+        self.pending[name] = renderCommand(self.executable, boardfilename,
+            outputfilename, side, width, height, raytraced, orthographic)
+        return Path(outputfilename)
+
+    def run(self) -> None:
+        """
+        Execute all queued renders
+        """
+        pending, self.pending = self.pending, {}
+        runCommands(pending, self.timeout, self.jobs)
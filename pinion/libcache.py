@@ -0,0 +1,125 @@
+import contextlib
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+# PcbDraw reads every footprint graphic twice: it parses the SVG to collect
+# the ids, rewrites all references to the ids in the text with a unique prefix
+# and parses the result again. We keep the rewritten text with a placeholder
+# instead of the prefix in a persistent cache shared by all boards, so
+# subsequent builds need only a single parse per footprint. The entries are
+# keyed by the footprint file path and validated by its mtime and size. When
+# the cache grows over the limit, the least recently used entries are removed.
+
+DEFAULT_CACHE_LIMIT = 64 * 1024 * 1024
+
+# NUL cannot appear in XML, so it cannot clash with the file content
+PREFIX_PLACEHOLDER = "\x00"
+
+def cacheDirectory() -> Path:
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "pinion" / "footprints"
+
+class FootprintCache:
+    def __init__(self, directory: Optional[Path] = None,
+                 limit: int = DEFAULT_CACHE_LIMIT):
+        self.directory = Path(directory) if directory is not None else cacheDirectory()
+        self.limit = limit
+
+    def _entryPath(self, filename: str) -> Path:
+        key = hashlib.sha1(os.path.realpath(filename).encode("utf-8")).hexdigest()
+        return self.directory / f"{key}.json"
+
+    def template(self, filename: str) -> Tuple[str, List[str]]:
+        """
+        Return the footprint SVG text with id references prefixed by the
+        placeholder and the list of ids
+        """
+        from lxml import etree
+
+        stat = os.stat(filename)
+        signature = [os.path.realpath(filename), stat.st_mtime_ns, stat.st_size]
+        entryPath = self._entryPath(filename)
+        try:
+            with open(entryPath) as f:
+                entry = json.load(f)
+            if entry["signature"] == signature:
+                # Mark the entry as recently used
+                os.utime(entryPath)
+                return entry["content"], entry["ids"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        root = etree.parse(filename, etree.XMLParser(huge_tree=True)).getroot()
+        ids = [el.attrib["id"] for el in root.iter()
+               if "id" in el.attrib and el.attrib["id"] != "origin"]
+        with open(filename) as f:
+            content = f.read()
+        # Same rewriting as PcbDraw does, just with the placeholder
+        for i in ids:
+            content = content.replace("#" + i, "#" + PREFIX_PLACEHOLDER + i)
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmpName = entryPath.with_name(f"{entryPath.name}.{os.getpid()}.tmp")
+        with open(tmpName, "w") as f:
+            json.dump({"signature": signature, "content": content, "ids": ids}, f)
+        os.replace(tmpName, entryPath)
+        return content, ids
+
+    def read(self, filename: str, prefix: str):
+        """
+        Drop-in replacement of pcbdraw.plot.read_svg_unique2
+        """
+        from lxml import etree
+
+        content, ids = self.template(filename)
+        content = content.replace(PREFIX_PLACEHOLDER, prefix)
+        root = etree.fromstring(content.encode("utf-8"), etree.XMLParser(huge_tree=True))
+        for el in root.iter():
+            if "id" in el.attrib and el.attrib["id"] != "origin":
+                el.attrib["id"] = prefix + el.attrib["id"]
+        return root, prefix
+
+    def prune(self) -> None:
+        """
+        Remove the least recently used entries over the size limit
+        """
+        try:
+            entries = [(e.stat().st_mtime_ns, e.stat().st_size, e)
+                       for e in self.directory.glob("*.json")]
+        except OSError:
+            return
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries, key=lambda x: x[0]):
+            if total <= self.limit:
+                break
+            with contextlib.suppress(OSError):
+                entry.unlink()
+            total -= size
+
+    @contextlib.contextmanager
+    def installed(self):
+        """
+        Make PcbDraw read the footprint graphics through the cache. If PcbDraw
+        doesn't read them via read_svg_unique2 (it is not a public API), the
+        footprints are read without the cache.
+        """
+        import pcbdraw.plot
+
+        original = getattr(pcbdraw.plot, "read_svg_unique2", None)
+        if original is None:
+            yield self
+            return
+        def read(source, prefix):
+            # Newer PcbDraw can also read footprints from memory
+            if not isinstance(source, str):
+                return original(source, prefix)
+            return self.read(source, prefix)
+        pcbdraw.plot.read_svg_unique2 = read
+        try:
+            yield self
+        finally:
+            pcbdraw.plot.read_svg_unique2 = original
+            self.prune()
@@ -0,0 +1,118 @@
+import contextlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, TextIO
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; the peak memory is not reported there
+    resource = None
+
+# Per-stage profiling of the diagram generation (see --profile). The stages
+# are marked in the code by
+#
+#   with stage("name"):
+#       ...
+#
+# which costs nothing unless a Profiler is active. For every stage, the
+# profiler records:
+#
+# - wall: wall time in seconds,
+# - cpu: CPU time in seconds including the finished child processes (e.g.,
+#   kicad-cli or the worker processes),
+# - peakRss: peak resident set size of the process in bytes observed at the end
+#   of the stage (the peak is never reset, so it is non-decreasing).
+#
+# Stages can nest and can repeat; every occurrence gets its own record. The
+# profiler can also collect a cProfile of all occurrences of a single stage.
+
+_active = None
+
+def peakRss() -> Optional[int]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def cpuTime() -> float:
+    times = os.times()
+    return time.process_time() + times.children_user + times.children_system
+
+class Profiler:
+    def __init__(self, cprofileStage: Optional[str] = None):
+        self.records: List[Dict[str, Any]] = []
+        self.cprofileStage = cprofileStage
+        self.cprofile = None
+        self.depth = 0
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        record = {"stage": name, "depth": self.depth}
+        self.records.append(record)
+        cprofile = None
+        if name == self.cprofileStage:
+            import cProfile
+            if self.cprofile is None:
+                self.cprofile = cProfile.Profile()
+            cprofile = self.cprofile
+        wallStart, cpuStart = time.perf_counter(), cpuTime()
+        self.depth += 1
+        if cprofile is not None:
+            cprofile.enable()
+        try:
+            yield
+        finally:
+            if cprofile is not None:
+                cprofile.disable()
+            self.depth -= 1
+            record["wall"] = time.perf_counter() - wallStart
+            record["cpu"] = cpuTime() - cpuStart
+            record["peakRss"] = peakRss()
+
+    @contextlib.contextmanager
+    def activated(self):
+        """
+        Make the profiler record the stages marked by stage()
+        """
+        global _active
+        previous, _active = _active, self
+        try:
+            yield self
+        finally:
+            _active = previous
+
+    def save(self, outputdir: Path) -> None:
+        """
+        Write profile.json and, if requested, the cProfile of the chosen stage
+        into the output directory
+        """
+        outputdir = Path(outputdir)
+        outputdir.mkdir(parents=True, exist_ok=True)
+        with open(outputdir / "profile.json", "w") as f:
+            json.dump({"stages": self.records}, f, indent=4)
+        if self.cprofile is not None:
+            name = self.cprofileStage.replace(" ", "-")
+            self.cprofile.dump_stats(str(outputdir / f"profile-{name}.prof"))
+
+    def report(self, file: TextIO) -> None:
+        """
+        Print a human-readable summary of the stages
+        """
+        print(f"{'Stage':<40} {'Wall [s]':>9} {'CPU [s]':>9} {'Peak RSS [MB]':>14}", file=file)
+        for record in self.records:
+            name = "  " * record["depth"] + record["stage"]
+            rss = "n/a" if record["peakRss"] is None else f"{record['peakRss'] / 2**20:.1f}"
+            print(f"{name:<40} {record['wall']:>9.3f} {record['cpu']:>9.3f} {rss:>14}", file=file)
+
+def stage(name: str):
+    """
+    Mark a stage of the generation for the active profiler
+    """
+    if _active is None:
+        return contextlib.nullcontext()
+    return _active.stage(name)
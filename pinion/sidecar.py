@@ -0,0 +1,140 @@
+import struct
+import sys
+from array import array
+from typing import Any, Dict, Tuple
+
+# For very large boards, Pinion can store the pin and component geometry in a
+# binary sidecar file instead of spec.json. The sidecar consists of flat arrays
+# that the widget uses directly as typed arrays. All values are little-endian
+# and 4 bytes long, so every array is properly aligned:
+#
+# - header: magic "PNGM", uint32 version, uint32 item count (N), uint32 vertex
+#   buffer length (V)
+# - int32 flags[N] (bitfield of ITEM_*)
+# - float32 bboxes[4 * N] (x1, y1, x2, y2)
+# - float32 positions[2 * N] (pin position, zero for components)
+# - int32 offsets[N + 1] (start of the item shape in the vertex buffer)
+# - float32 vertices[V] (polygons as flat x, y pairs; circles as cx, cy, r)
+#
+# The items are the components, each followed by its pins, in the order of
+# spec.json. The specification keeps only the text and group metadata and
+# refers to the sidecar via the "geometry" key.
+
+GEOMETRY_MAGIC = b"PNGM"
+GEOMETRY_VERSION = 1
+
+ITEM_FRONT = 1
+ITEM_BACK = 2
+ITEM_CIRCLE = 4
+ITEM_COMPONENT = 8
+
+COMPONENT_GEOMETRY = ("front", "back", "bbox")
+PIN_GEOMETRY = ("front", "back", "bbox", "pos", "shape")
+
+def _littleEndian(values: array) -> bytes:
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+def _readArray(typecode: str, data: bytes, offset: int, count: int) -> Tuple[array, int]:
+    values = array(typecode)
+    end = offset + count * values.itemsize
+    values.frombytes(data[offset:end])
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values, end
+
+def splitGeometry(spec: Dict[str, Any], filename: str = "geometry.bin") -> Tuple[Dict[str, Any], bytes]:
+    """
+    Given a specification, return the specification without geometry and the
+    binary sidecar with the geometry
+    """
+    flags = array("i")
+    bboxes = array("f")
+    positions = array("f")
+    offsets = array("i", [0])
+    vertices = array("f")
+
+    def addItem(item, itemFlags, pos, shape):
+        if item["front"]:
+            itemFlags |= ITEM_FRONT
+        if item["back"]:
+            itemFlags |= ITEM_BACK
+        if isinstance(shape, dict):
+            itemFlags |= ITEM_CIRCLE
+            vertices.extend([shape["center"][0], shape["center"][1], shape["radius"]])
+        else:
+            for x, y in shape:
+                vertices.extend([x, y])
+        flags.append(itemFlags)
+        bbox = item["bbox"]
+        bboxes.extend([bbox["tl"][0], bbox["tl"][1], bbox["br"][0], bbox["br"][1]])
+        positions.extend(pos)
+        offsets.append(len(vertices))
+
+    metadata = {key: value for key, value in spec.items() if key != "components"}
+    metadata["geometry"] = filename
+    metadata["components"] = []
+    for component in spec["components"]:
+        addItem(component, ITEM_COMPONENT, [0, 0], [])
+        for pin in component["pins"]:
+            addItem(pin, 0, pin["pos"], pin["shape"])
+        c = {key: value for key, value in component.items()
+             if key not in COMPONENT_GEOMETRY}
+        c["pins"] = [{key: value for key, value in pin.items() if key not in PIN_GEOMETRY}
+                     for pin in component["pins"]]
+        metadata["components"].append(c)
+
+    data = GEOMETRY_MAGIC + struct.pack("<III", GEOMETRY_VERSION, len(flags), len(vertices))
+    for values in [flags, bboxes, positions, offsets, vertices]:
+        data += _littleEndian(values)
+    return metadata, data
+
+def joinGeometry(metadata: Dict[str, Any], data: bytes) -> Dict[str, Any]:
+    """
+    Given a specification without geometry and the binary sidecar, return the
+    full specification
+    """
+    if data[:4] != GEOMETRY_MAGIC:
+        raise RuntimeError("The geometry sidecar is not a Pinion geometry file")
+    version, count, vertexCount = struct.unpack("<III", data[4:16])
+    if version != GEOMETRY_VERSION:
+        raise RuntimeError(f"Unsupported geometry sidecar version {version}")
+    flags, offset = _readArray("i", data, 16, count)
+    bboxes, offset = _readArray("f", data, offset, 4 * count)
+    positions, offset = _readArray("f", data, offset, 2 * count)
+    offsets, offset = _readArray("i", data, offset, count + 1)
+    vertices, offset = _readArray("f", data, offset, vertexCount)
+
+    def geometry(i):
+        g = {
+            "front": bool(flags[i] & ITEM_FRONT),
+            "back": bool(flags[i] & ITEM_BACK),
+            "bbox": {
+                "tl": [bboxes[4 * i], bboxes[4 * i + 1]],
+                "br": [bboxes[4 * i + 2], bboxes[4 * i + 3]]
+            }
+        }
+        if flags[i] & ITEM_COMPONENT:
+            return g
+        v = vertices[offsets[i]:offsets[i + 1]]
+        if flags[i] & ITEM_CIRCLE:
+            g["shape"] = {"center": [v[0], v[1]], "radius": v[2]}
+        else:
+            g["shape"] = [[v[j], v[j + 1]] for j in range(0, len(v), 2)]
+        g["pos"] = [positions[2 * i], positions[2 * i + 1]]
+        return g
+
+    spec = {key: value for key, value in metadata.items() if key != "geometry"}
+    spec["components"] = []
+    i = 0
+    for component in metadata["components"]:
+        c = dict(component, **geometry(i))
+        i += 1
+        c["pins"] = []
+        for pin in component["pins"]:
+            c["pins"].append(dict(pin, **geometry(i)))
+            i += 1
+        spec["components"].append(c)
+    return spec
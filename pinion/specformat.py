@@ -0,0 +1,213 @@
+import json
+from typing import Any, Dict, List
+
+# Pinion can store the specification in two formats:
+#
+# - format 1 is the plain, human-readable specification as built by
+#   pinion.generate.
+# - format 2 is a compact encoding of format 1 intended for large boards. All
+#   coordinates are integer micrometers, polygons are delta-encoded (the first
+#   point is absolute, the rest is relative to the previous point) and
+#   component references, names, descriptions and groups are stored in a
+#   shared string table and referenced by index. Components and pins are stored
+#   as arrays:
+#
+#   component: [ref, description, flags, bbox, groups, pins]
+#   pin:       [name, description, alias, groups, flags, pos, bbox, shape]
+#
+#   where flags is a bitfield of FLAG_*, bbox is [x1, y1, x2, y2], alias is a
+#   string index or -1 when the pin is not an alias and shape is either a flat
+#   list of delta-encoded coordinates or a {"center", "radius"} circle. When
+#   the geometry is stored in a binary sidecar (see pinion.sidecar), pos, bbox
+#   and shape are null and the side flags are not set.
+#
+# The pinion-widget accepts both formats (see spec-format.js).
+
+SPEC_FORMATS = (1, 2)
+
+FLAG_FRONT = 1
+FLAG_BACK = 2
+FLAG_HIGHLIGHT = 4
+
+UNITS_PER_MM = 1000
+
+def quantize(value: float) -> int:
+    return int(round(value * UNITS_PER_MM))
+
+def dequantize(value: int) -> float:
+    return value / UNITS_PER_MM
+
+class StringTable:
+    def __init__(self):
+        self.strings = []
+        self._indices = {}
+
+    def index(self, value: str) -> int:
+        if value not in self._indices:
+            self._indices[value] = len(self.strings)
+            self.strings.append(value)
+        return self._indices[value]
+
+def _flags(item: Dict[str, Any]) -> int:
+    flags = 0
+    if item.get("front", False):
+        flags |= FLAG_FRONT
+    if item.get("back", False):
+        flags |= FLAG_BACK
+    if item.get("highlight", False):
+        flags |= FLAG_HIGHLIGHT
+    return flags
+
+def _compactRect(rect) -> List[int]:
+    if rect is None:
+        return None
+    return [quantize(rect["tl"][0]), quantize(rect["tl"][1]),
+            quantize(rect["br"][0]), quantize(rect["br"][1])]
+
+def _expandRect(rect) -> Dict[str, List[float]]:
+    return {
+        "tl": [dequantize(rect[0]), dequantize(rect[1])],
+        "br": [dequantize(rect[2]), dequantize(rect[3])]
+    }
+
+def _compactShape(shape):
+    if shape is None:
+        return None
+    if isinstance(shape, dict):
+        return {
+            "center": [quantize(shape["center"][0]), quantize(shape["center"][1])],
+            "radius": quantize(shape["radius"])
+        }
+    encoded = []
+    prevX, prevY = 0, 0
+    for x, y in shape:
+        x, y = quantize(x), quantize(y)
+        encoded += [x - prevX, y - prevY]
+        prevX, prevY = x, y
+    return encoded
+
+def _expandShape(shape):
+    if isinstance(shape, dict):
+        return {
+            "center": [dequantize(shape["center"][0]), dequantize(shape["center"][1])],
+            "radius": dequantize(shape["radius"])
+        }
+    points = []
+    x, y = 0, 0
+    for i in range(0, len(shape), 2):
+        x, y = x + shape[i], y + shape[i + 1]
+        points.append([dequantize(x), dequantize(y)])
+    return points
+
+def compactSpecification(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Encode specification in format 1 into format 2
+    """
+    strings = StringTable()
+    def pin(p):
+        alias = p.get("alias", False)
+        return [
+            strings.index(p["name"]),
+            strings.index(p.get("description", "")),
+            strings.index(alias) if isinstance(alias, str) else -1,
+            [strings.index(g) for g in p["groups"]],
+            _flags(p),
+            [quantize(p["pos"][0]), quantize(p["pos"][1])] if "pos" in p else None,
+            _compactRect(p.get("bbox")),
+            _compactShape(p.get("shape"))
+        ]
+    def component(c):
+        return [
+            strings.index(c["ref"]),
+            strings.index(c["description"]),
+            _flags(c),
+            _compactRect(c.get("bbox")),
+            [strings.index(g) for g in c["groups"]],
+            [pin(p) for p in c["pins"]]
+        ]
+
+    compact = {
+        "format": 2,
+        "pinionVersion": spec["pinionVersion"],
+        "name": strings.index(spec["name"]),
+        "description": strings.index(spec["description"]),
+        "components": [component(c) for c in spec["components"]],
+        "groups": spec["groups"]
+    }
+    for key in ["front", "back", "geometry"]:
+        if key in spec:
+            compact[key] = spec[key]
+    compact["strings"] = strings.strings
+    return compact
+
+def expandSpecification(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Decode specification in format 2 into format 1
+    """
+    s = spec["strings"]
+    sidecar = "geometry" in spec
+    def pin(p):
+        name, description, alias, groups, flags, pos, bbox, shape = p
+        expanded = {} if sidecar else {
+            "shape": _expandShape(shape),
+            "bbox": _expandRect(bbox),
+            "pos": [dequantize(pos[0]), dequantize(pos[1])],
+            "front": bool(flags & FLAG_FRONT),
+            "back": bool(flags & FLAG_BACK)
+        }
+        expanded.update({
+            "name": s[name],
+            "description": s[description],
+            "alias": s[alias] if alias >= 0 else False,
+            "groups": [s[g] for g in groups]
+        })
+        return expanded
+    def component(c):
+        ref, description, flags, bbox, groups, pins = c
+        expanded = {} if sidecar else {
+            "front": bool(flags & FLAG_FRONT),
+            "back": bool(flags & FLAG_BACK),
+            "bbox": _expandRect(bbox)
+        }
+        expanded.update({
+            "ref": s[ref],
+            "description": s[description],
+            "highlight": bool(flags & FLAG_HIGHLIGHT),
+            "groups": [s[g] for g in groups],
+            "pins": [pin(p) for p in pins]
+        })
+        return expanded
+
+    expanded = {
+        "pinionVersion": spec["pinionVersion"],
+        "name": s[spec["name"]],
+        "description": s[spec["description"]],
+        "components": [component(c) for c in spec["components"]],
+        "groups": spec["groups"]
+    }
+    for key in ["front", "back", "geometry"]:
+        if key in spec:
+            expanded[key] = spec[key]
+    return expanded
+
+def encodeSpecification(spec: Dict[str, Any], format: int = 1, indent=None) -> str:
+    """
+    Serialize specification (in format 1) into given format
+    """
+    if format == 1:
+        return json.dumps(spec, indent=indent)
+    if format == 2:
+        return json.dumps(compactSpecification(spec), separators=(",", ":"))
+    raise RuntimeError(f"Unknown specification format {format}")
+
+def decodeSpecification(text: str) -> Dict[str, Any]:
+    """
+    Parse specification in any format and return it in format 1
+    """
+    spec = json.loads(text)
+    format = spec.get("format", 1)
+    if format == 1:
+        return spec
+    if format == 2:
+        return expandSpecification(spec)
+    raise RuntimeError(f"Unknown specification format {format}")
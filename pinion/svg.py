@@ -0,0 +1,165 @@
+import re
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional
+
+# Optimization of the plotted SVG board images used directly as the diagram
+# background (see --image-format svg). The optimization:
+#
+# - removes comments, metadata and formatting whitespace,
+# - trims trailing zeros of numbers in the geometry attributes,
+# - moves the content of groups that repeat in the image (e.g., the same
+#   footprint graphics placed multiple times) into a <symbol> and replaces it
+#   by <use>.
+
+XLINK_HREF = "{http://www.w3.org/1999/xlink}href"
+
+# Groups with shorter serialized content are not worth deduplicating
+MIN_SYMBOL_SIZE = 256
+
+NUMERIC_ATTRIBUTES = ("d", "points", "transform", "x", "y", "x1", "y1", "x2",
+                      "y2", "cx", "cy", "r", "rx", "ry", "width", "height",
+                      "stroke-width", "viewBox")
+
+# A number followed by "." is left intact, the dot starts the next number in
+# compact path data (e.g., "M1.000.5")
+NUMBER = re.compile(r"(\d+)\.(\d*?)0+(?![\d.])")
+
+# Id references (href="#id", fill="url(#id)") and id definitions. Colors like
+# #ff0000 match as references too; they are harmless as we only look up the
+# matched names among the defined ids.
+REFERENCE = re.compile(r"(#)([^\s\"'()#;,]+)")
+DEFINITION = re.compile(r"(\sid=\")([^\"]*)")
+
+def localName(element) -> Optional[str]:
+    from lxml import etree
+
+    if not isinstance(element.tag, str):
+        return None
+    return etree.QName(element).localname
+
+def _trimNumber(match) -> str:
+    integer, fraction = match.group(1), match.group(2)
+    return f"{integer}.{fraction}" if fraction else integer
+
+def trimNumbers(value: str) -> str:
+    """
+    Remove trailing zeros of decimal numbers, e.g., "1.500 2.000" -> "1.5 2"
+    """
+    return NUMBER.sub(_trimNumber, value)
+
+def minifySvg(root) -> None:
+    from lxml import etree
+
+    for element in list(root.iter()):
+        if isinstance(element, (etree._Comment, etree._ProcessingInstruction)) \
+                or localName(element) == "metadata":
+            parent = element.getparent()
+            if parent is not None:
+                # Keep the tail text (it belongs to the parent)
+                previous = element.getprevious()
+                if element.tail and element.tail.strip():
+                    if previous is not None:
+                        previous.tail = (previous.tail or "") + element.tail
+                    else:
+                        parent.text = (parent.text or "") + element.tail
+                parent.remove(element)
+            continue
+        if element.text is not None and not element.text.strip():
+            element.text = None
+        if element.tail is not None and not element.tail.strip():
+            element.tail = None
+        for attribute in NUMERIC_ATTRIBUTES:
+            if attribute in element.attrib:
+                element.attrib[attribute] = trimNumbers(element.attrib[attribute])
+
+def referencingElements(root) -> Dict[str, List[Any]]:
+    """
+    Map every id referenced in an attribute (href or url()) to the elements
+    referencing it
+    """
+    references = defaultdict(list)
+    for element in root.iter():
+        if not isinstance(element.tag, str):
+            continue
+        for value in element.attrib.values():
+            for match in REFERENCE.finditer(value):
+                references[match.group(2)].append(element)
+    return references
+
+def contentKey(group, references) -> Optional[str]:
+    """
+    Serialize the content of the group for comparison. PcbDraw prefixes the
+    ids of every footprint placement uniquely, so the ids defined in the
+    content are replaced by their order of appearance. Return None if any of
+    them is referenced from outside of the group; such content has to stay in
+    place.
+    """
+    from lxml import etree
+
+    ids = [e.get("id") for child in group for e in child.iter()
+           if isinstance(e.tag, str) and "id" in e.attrib]
+    if ids:
+        inside = set(group.iter())
+        for i in ids:
+            if any(e not in inside for e in references.get(i, [])):
+                return None
+    content = "".join(etree.tostring(child, encoding="unicode") for child in group)
+    if not ids:
+        return content
+    # NUL cannot appear in XML, so the names cannot clash with the content
+    names = {i: f"\x00{n}" for n, i in enumerate(ids)}
+    rename = lambda match: match.group(1) + names.get(match.group(2), match.group(2))
+    content = DEFINITION.sub(rename, content)
+    return REFERENCE.sub(rename, content)
+
+def deduplicateGroups(root, minSize: int = MIN_SYMBOL_SIZE) -> int:
+    """
+    Move the repeated content of groups into symbols. Return the number of
+    created symbols. The groups stay in place (with their ids), only their
+    content is replaced by <use>. The deepest groups are processed first, so
+    e.g. the differently placed copies of a footprint share one symbol.
+    """
+    from lxml import etree
+
+    groups = [g for g in root.iter() if localName(g) == "g" and len(g) > 0]
+    depths = {g: sum(1 for _ in g.iterancestors()) for g in groups}
+    symbols = {}
+    for depth in sorted(set(depths.values()), reverse=True):
+        # The content of the shallower groups changes as we go, so we compare
+        # it level by level
+        references = referencingElements(root)
+        keys = {}
+        for g in groups:
+            if depths[g] == depth:
+                key = contentKey(g, references)
+                if key is not None:
+                    keys[g] = key
+        counts = Counter(keys.values())
+        for g, key in keys.items():
+            if counts[key] < 2 or len(key) < minSize:
+                continue
+            namespace = etree.QName(g).namespace
+            tag = lambda name: f"{{{namespace}}}{name}" if namespace else name
+            if key not in symbols:
+                symbolId = f"pinion-s{len(symbols)}"
+                symbol = etree.Element(tag("symbol"), id=symbolId, overflow="visible")
+                symbol.extend(list(g))
+                symbols[key] = symbol
+            for child in list(g):
+                g.remove(child)
+            g.append(etree.Element(tag("use"), {XLINK_HREF: "#" + symbols[key].get("id")}))
+
+    if symbols:
+        namespace = etree.QName(root).namespace
+        defs = etree.Element(f"{{{namespace}}}defs" if namespace else "defs")
+        defs.extend(symbols.values())
+        root.insert(0, defs)
+    return len(symbols)
+
+def optimizeSvg(tree) -> None:
+    """
+    Optimize the SVG element tree in place
+    """
+    root = tree.getroot()
+    minifySvg(root)
+    deduplicateGroups(root)
@@ -2,36 +2,39 @@ import os
 import re
 from ruamel.yaml import YAML
 from ruamel.yaml.comments import Comment, CommentedSeq, CommentedMap
+from pinion.board import BoardIndex
 
 yaml=YAML()
 yaml.default_flow_style=False
 yaml.width=80
 yaml.indent=4
 
-def collectPins(footprint):
+def collectPins(footprint, index):
     pins = CommentedMap()
-    for i, pad in enumerate(footprint.Pads()):
+    for i, (name, pad) in enumerate(index.pads(footprint)):
         p = CommentedMap()
         p.insert(0, "name", pad.GetNetname())
         p.insert(1, "description", "")
         p.insert(2, "groups", [])
-        pins.insert(i, pad.GetName(), p)
+        pins.insert(i, name, p)
     return pins
 
-def collectComponents(board, components=None):
+def collectComponents(board, components=None, index=None):
     """
     Collect components template from the board. Include only footprints in
     components if specified
     """
+    if index is None:
+        index = BoardIndex(board)
     d = CommentedMap()
-    footprints = [f for f in board.GetFootprints()
+    footprints = [f for f in index.footprints
         if components is None or len(components) == 0 or any([re.match(c, f.GetReference()) for c in components])]
     footprints.sort(key=lambda f: f.GetReference())
     for i, f in enumerate(footprints):
         description = CommentedMap()
         description.insert(0, "description", f.GetValue(), "Arbitrary comment")
         description.insert(1, "groups", [], "Specify component groups")
-        description.insert(2, "pins", collectPins(f))
+        description.insert(2, "pins", collectPins(f, index))
         description.insert(3, "highlight", False, "Make the component active")
         description.insert(4, "highlightBoth", f.HasThroughHolePads())
         d.insert(i, f.GetReference(), description)
@@ -0,0 +1,82 @@
+import json
+import math
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from pinion.images import imageArgsOrDefault, saveImage
+
+# For large boards, the board image can be split into a tile pyramid so the
+# widget downloads only the tiles it needs for the displayed size. Level 0 is
+# the full resolution image, every next level halves the resolution until the
+# whole image fits into a single tile. The tiles are stored as
+#
+#   <side>_tiles/<level>/<column>_<row>.<format>
+#
+# and described by <side>_tiles/manifest.json:
+#
+#   {
+#       "tileSize": <tile edge in pixels>,
+#       "format": <image format of the tiles, see pinion.images>,
+#       "width": <full resolution width>,
+#       "height": <full resolution height>,
+#       "levels": [{"width", "height", "columns", "rows"}, ...]
+#   }
+
+DEFAULT_TILE_SIZE = 512
+
+def tileDirectory(side: str) -> str:
+    return f"{side}_tiles"
+
+def pyramidLevels(width: int, height: int, tileSize: int):
+    """
+    Return the list of level sizes (width, height) from the full resolution
+    down to the level that fits into a single tile
+    """
+    levels = [(width, height)]
+    while width > tileSize or height > tileSize:
+        width, height = max(1, math.ceil(width / 2)), max(1, math.ceil(height / 2))
+        levels.append((width, height))
+    return levels
+
+def generateTiles(imagefile: Path, outputdir: Path, side: str,
+                  tileSize: int = DEFAULT_TILE_SIZE,
+                  imageArgs: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Split the image into a tile pyramid. The tiles are stored in the format
+    given by imageArgs. Return the path of the pyramid manifest relative to
+    outputdir.
+    """
+    from PIL import Image
+    import shutil
+
+    tiledir = Path(outputdir) / tileDirectory(side)
+    # Remove stale tiles from a previous build with different dimensions
+    shutil.rmtree(tiledir, ignore_errors=True)
+
+    imageFormat = imageArgsOrDefault(imageArgs)["format"]
+    manifest = {"tileSize": tileSize, "format": imageFormat, "levels": []}
+    with Image.open(imagefile) as image:
+        manifest["width"], manifest["height"] = image.size
+        level = image
+        for i, (width, height) in enumerate(pyramidLevels(*image.size, tileSize)):
+            if level.size != (width, height):
+                level = level.resize((width, height), Image.LANCZOS)
+            columns = math.ceil(width / tileSize)
+            rows = math.ceil(height / tileSize)
+            leveldir = tiledir / str(i)
+            leveldir.mkdir(parents=True)
+            for column in range(columns):
+                for row in range(rows):
+                    left, top = column * tileSize, row * tileSize
+                    tile = level.crop((left, top,
+                        min(left + tileSize, width), min(top + tileSize, height)))
+                    saveImage(tile, leveldir / f"{column}_{row}.{imageFormat}", imageArgs)
+            manifest["levels"].append({
+                "width": width,
+                "height": height,
+                "columns": columns,
+                "rows": rows
+            })
+    with open(tiledir / "manifest.json", "w") as f:
+        json.dump(manifest, f)
+    return f"{tileDirectory(side)}/manifest.json"
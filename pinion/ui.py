@@ -1,11 +1,13 @@
 import click
+import contextlib
 import csv
 import io
+import sys
 import functools
 from pathlib import Path
 from typing import Dict, Tuple
 from pinion import __version__
-from pinion.generate import generateDrawnImages
+from pinion.profile import stage
 
 def splitStr(delimiter, escapeChar, s):
     """
@@ -36,6 +38,18 @@ class CliList(click.ParamType):
         return list(splitStr(self.separator, self.escape, value))
 
 
+def imageArguments(image_format, image_quality, keep_png, optimize_png,
+                   png_colors, srcset):
+    return {
+        "format": image_format,
+        "quality": image_quality,
+        "keepPng": keep_png,
+        "optimize": optimize_png,
+        "colors": png_colors,
+        "srcset": srcset or []
+    }
+
+
 def selectedSides(side):
     if side == "both":
         return ("front", "back")
@@ -149,18 +163,81 @@ def generateCommandArgs(func):
     type=click.Path(file_okay=True, dir_okay=False, exists=True),
     callback=resolveSpecification,
     help="YAML specification of the pinout. Defaults to <project>_pinion.yaml or the only *_pinion YAML file.")
+    @click.option("-j", "--jobs", type=click.IntRange(min=1), default=1,
+    help="Number of worker processes; with more than one, the board sides are generated in parallel")
+    @diagramCommandArgs
+    @click.option("--profile/--no-profile", default=False,
+    help="Record time and memory of the generation stages into profile.json in the output directory")
+    @click.option("--profile-summary/--no-profile-summary", default=True,
+    help="With --profile, also print a summary of the stages to stderr")
+    @click.option("--profile-stage", default=None,
+    help="Dump cProfile of the given stage (e.g., \"plot front\") into profile-<stage>.prof in the output directory (spaces become dashes)")
+
+    @functools.wraps(func)
+    def wrapper(*args, profile, profile_summary, profile_stage, **kwargs):
+        with profiling(profile, profile_stage, kwargs["outputdir"], profile_summary):
+            return func(*args, **kwargs)
+    return wrapper
+
+def diagramCommandArgs(func):
+    """
+    Options shared by all commands generating diagrams
+    """
     @click.option("--pack/--no-pack", default=True,
     help="Pack pinion-widget with the source")
     @click.option("--embed/--no-embed", default=False,
     help="Generate a standalone index.html with all resources embedded")
     @click.option("--side", type=click.Choice(["front", "back", "both"]), default="both",
     help="Which board side to include in the diagram")
-
+    @click.option("--incremental/--no-incremental", default=False,
+    help="Skip build stages whose inputs didn't change since the last build in the output directory")
+    @click.option("--shape-tolerance", type=click.FloatRange(min=0), default=None,
+    help="Simplify pin shapes with given tolerance in mm to reduce the diagram size")
+    @click.option("--circles/--no-circles", default=False,
+    help="Emit circular pins as a circle primitive instead of a polygon")
+    @click.option("--spec-format", type=click.Choice(["1", "2"]), default="1",
+    help="Format of the specification; format 2 is compact and suitable for large boards")
+    @click.option("--geometry-sidecar/--no-geometry-sidecar", default=False,
+    help="Store pin and component geometry in a binary file next to the specification")
+    @click.option("--compress", type=click.Choice(["gz", "br"]), multiple=True,
+    help="Write precompressed siblings of the text outputs (can be specified multiple times)")
+    @click.option("--tiles/--no-tiles", default=False,
+    help="Split the board images into a tile pyramid so the widget loads only the resolution it needs")
+    @click.option("--tile-size", type=click.IntRange(min=64), default=512,
+    help="Size of the tiles in pixels")
+    @click.option("--image-format", type=click.Choice(["png", "webp", "avif", "svg"]), default="png",
+    help="Format of the board images; svg is supported only by plotted diagrams")
+    @click.option("--image-quality", type=click.IntRange(min=0, max=100), default=None,
+    help="Quality of the lossy image formats (0-100)")
+    @click.option("--keep-png/--no-keep-png", default=False,
+    help="Keep the PNG images as a fallback for browsers without support for the image format")
+    @click.option("--optimize-png/--no-optimize-png", default=False,
+    help="Optimize the PNG images for size (slow)")
+    @click.option("--png-colors", type=click.IntRange(min=2, max=256), default=None,
+    help="Quantize the optimized PNG images to given number of colors; suitable for plotted images")
+    @click.option("--srcset", type=CliList(), default=None,
+    help="Comma separated list of additional image resolutions as DPI (e.g., 150) or width in pixels (e.g., 800w)")
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
         return func(*args, **kwargs)
     return wrapper
 
+@contextlib.contextmanager
+def profiling(enabled, cprofileStage, outputdir, summary=True):
+    if not enabled:
+        yield
+        return
+    from pinion.profile import Profiler
+
+    profiler = Profiler(cprofileStage)
+    try:
+        with profiler.activated():
+            yield
+    finally:
+        profiler.save(Path(outputdir))
+        if summary:
+            profiler.report(sys.stderr)
+
 
 @click.command("plotted")
 @generateCommandArgs
@@ -171,73 +248,298 @@ def generateCommandArgs(func):
     help="PcbDraw library specification")
 @click.option("--remap", help="PcbDraw footprint remapping specification")
 @click.option("--filter", help="PcbDraw filter specification")
-def generatePlotted(board, specification, outputdir, dpi, pack, embed, side, style, libs, remap, filter):
+@click.option("--svg-precision", type=click.IntRange(min=3, max=6), default=5,
+    help="Number of significant digits of the coordinates in the plotted SVG")
+@click.option("--footprint-cache/--no-footprint-cache", default=True,
+    help="Cache PcbDraw footprint graphics in the user cache directory")
+def generatePlotted(board, specification, outputdir, dpi, pack, embed, side, jobs,
+                    incremental, shape_tolerance, circles, spec_format,
+                    geometry_sidecar, compress, tiles, tile_size, image_format,
+                    image_quality, keep_png, optimize_png, png_colors, srcset,
+                    style, libs, remap, filter, svg_precision, footprint_cache):
     """
     Generate a pinout diagram with stylized image of the board
     """
     # Note that we import inside functions as pcbnew import takes ~1 to load
     # which makes the UI laggy
-    from pinion.generate import generate, generateDrawnImages
+    with stage("import pcbnew"):
+        from pinion.generate import generate, generateDrawnImages, libraryDigest
+        import pcbnew
+    from pinion.build import optionDigest
     from ruamel.yaml import YAML
-    import pcbnew
 
     yaml=YAML(typ='safe')
+    imageArgs = imageArguments(image_format, image_quality, keep_png,
+                               optimize_png, png_colors, srcset)
 
     def generateImages(board: pcbnew.BOARD, outputdir: Path, sides) -> Dict[str, Dict[str, Tuple[int, int]]]:
         return generateDrawnImages(board, outputdir, dpi, {
                  "style": style,
                  "libs": libs,
                  "remap": remap,
-                 "filter": filter
-             }, sides)
+                 "filter": filter,
+                 "precision": svg_precision,
+                 "footprintCache": footprint_cache
+             }, sides, jobs, imageArgs)
+
+    imageKey = {
+        "generator": "plotted",
+        "dpi": dpi,
+        "style": optionDigest(style),
+        "libs": libraryDigest(libs) if incremental else libs,
+        "remap": optionDigest(remap),
+        "filter": filter,
+        "precision": svg_precision
+    }
+
+    with click.open_file(specification, "r") as specificationFile, \
+            stage("parse specification"):
+        specification = yaml.load(specificationFile)
+    with stage("load board"):
+        loadedBoard = pcbnew.LoadBoard(board)
+
+    generate(specification=specification,
+             board=loadedBoard,
+             outputdir=outputdir,
+             pack=pack,
+             embed=embed,
+             sides=selectedSides(side),
+             imageGenerator=generateImages,
+             imageKey=imageKey,
+             incremental=incremental,
+             shapeArgs={
+                 "tolerance": shape_tolerance,
+                 "circles": circles
+             },
+             specFormat=int(spec_format),
+             geometrySidecar=geometry_sidecar,
+             compress=compress,
+             tileSize=tile_size if tiles else None,
+             imageArgs=imageArgs)
+
+def renderCommandArgs(func):
+    """
+    Options shared by the commands generating diagrams with rendered images
+    """
+    @click.option("--renderer", type=click.Choice(["raytrace", "normal"]), default="raytrace",
+    help="Specify what renderer to use")
+    @click.option("--projection", type=click.Choice(["orthographic", "perspective"]), default="orthographic",
+    help="Specify projection")
+    @click.option("--pixels-per-mm", type=click.FloatRange(min=0, min_open=True), default=None,
+    help="Resolution of the rendered images; by default, the whole pixel budget is used")
+    @click.option("--max-pixels", type=click.IntRange(min=1), default=None,
+    help="Maximal number of pixels of a rendered image (default 9000000)")
+    @click.option("--render-timeout", type=click.FloatRange(min=0, min_open=True), default=300,
+    help="Timeout of a single kicad-cli render in seconds")
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return func(*args, **kwargs)
+    return wrapper
 
-    with click.open_file(specification, "r") as specificationFile:
-        generate(specification=yaml.load(specificationFile),
-                 board=pcbnew.LoadBoard(board),
-                 outputdir=outputdir,
-                 pack=pack,
-                 embed=embed,
-                 sides=selectedSides(side),
-                 imageGenerator=generateImages)
+def renderedImageKey(backend, renderer, projection, components, pixelsPerMm,
+                     maxPixels, crop):
+    return {
+        "generator": "rendered",
+        "backend": backend,
+        "renderer": renderer,
+        "projection": projection,
+        "components": components,
+        "pixelsPerMm": pixelsPerMm,
+        "maxPixels": maxPixels,
+        "crop": crop
+    }
+
+def rejectSvgImages(image_format):
+    if image_format == "svg":
+        raise click.BadParameter("SVG images are supported only by plotted diagrams",
+                                 param_hint="--image-format")
 
 @click.command("rendered")
 @generateCommandArgs
-@click.option("--renderer", type=click.Choice(["raytrace", "normal"]), default="raytrace",
-    help="Specify what renderer to use")
-@click.option("--projection", type=click.Choice(["orthographic", "perspective"]), default="orthographic",
-    help="Specify projection")
+@renderCommandArgs
 @click.option("--no-components", is_flag=True, default=False,
     help="Disable component rendering")
+@click.option("--crop/--no-crop", default=True,
+    help="Crop transparent margins of the rendered images")
+@click.option("--backend", type=click.Choice(["auto", "pcbdraw", "kicad-cli"]), default="pcbdraw",
+    help="Render through PcbDraw (one kicad-cli process at a time) or run kicad-cli (KiCad 9+) directly with concurrent renders and --render-timeout; auto prefers kicad-cli when available")
+@click.option("--progressive", is_flag=True, default=False,
+    help="Write a complete diagram with quick preview images first, then replace them by the raytraced ones (requires --renderer raytrace)")
 def generateRendered(board, specification, pack, outputdir, renderer,
-                     embed, side, projection, no_components):
+                     embed, side, jobs, incremental, shape_tolerance, circles,
+                     spec_format, geometry_sidecar, compress, tiles, tile_size,
+                     image_format, image_quality, keep_png, optimize_png,
+                     png_colors, srcset, projection, no_components, pixels_per_mm,
+                     max_pixels, crop, backend, render_timeout, progressive):
     """
     Generate a pinout diagram with 3D rendered image of the board
     """
     # Note that we import inside functions as pcbnew import takes ~1 to load
     # which makes the UI laggy
-    from pinion.generate import generate, generateRenderedImages
+    with stage("import pcbnew"):
+        from pinion.generate import (generate, generateRenderedImages, renderResolution,
+                                     renderedAreaRect, stagedImageGenerator)
+        import pcbnew
+    from pinion.kicadcli import isKicadCliAvailable
     from ruamel.yaml import YAML
-    import pcbnew
+    import copy
+
+    rejectSvgImages(image_format)
+    if progressive and renderer != "raytrace":
+        raise click.UsageError("--progressive replaces preview images by raytraced ones, it requires --renderer raytrace")
+    if backend == "kicad-cli" and no_components:
+        raise click.BadParameter("kicad-cli cannot render the board without components",
+                                 param_hint="--backend")
+    if backend == "kicad-cli" and not crop:
+        raise click.BadParameter("kicad-cli frames the board with its own margin, its images have to be cropped",
+                                 param_hint="--backend")
+    if backend == "auto":
+        backend = "kicad-cli" if not no_components and crop and isKicadCliAvailable() else "pcbdraw"
 
     yaml=YAML(typ='safe')
-
-    def generateImages(board: pcbnew.BOARD, outputdir: Path, sides) -> Dict[str, Dict[str, Tuple[int, int]]]:
-        return generateRenderedImages(board, outputdir,
-            componets=(not no_components),
-            orthographic=(projection == "orthographic"),
-            raytraced=(renderer == "raytrace"),
-            baseResolution=(3000, 3000),
-            sides=sides)
-
-    with click.open_file(specification, "r") as specificationFile:
-        generate(specification=yaml.load(specificationFile),
-                 board=pcbnew.LoadBoard(board),
+    imageArgs = imageArguments(image_format, image_quality, keep_png,
+                               optimize_png, png_colors, srcset)
+
+    def imageGenerator(renderer):
+        def generateImages(board: pcbnew.BOARD, outputdir: Path, sides) -> Dict[str, Dict[str, Tuple[int, int]]]:
+            return generateRenderedImages(board, outputdir,
+                componets=(not no_components),
+                orthographic=(projection == "orthographic"),
+                raytraced=(renderer == "raytrace"),
+                baseResolution=renderResolution(renderedAreaRect(board, not no_components),
+                                                pixels_per_mm, max_pixels),
+                sides=sides,
+                jobs=jobs,
+                imageArgs=imageArgs,
+                crop=crop,
+                backend=backend,
+                timeout=render_timeout)
+        return generateImages
+
+    def imageKey(renderer):
+        return renderedImageKey(backend, renderer, projection, not no_components,
+                                pixels_per_mm, max_pixels, crop)
+
+    with click.open_file(specification, "r") as specificationFile, \
+            stage("parse specification"):
+        specification = yaml.load(specificationFile)
+    with stage("load board"):
+        loadedBoard = pcbnew.LoadBoard(board)
+
+    def generateDiagram(renderer, imageGenerator):
+        generate(specification=copy.deepcopy(specification),
+                 board=loadedBoard,
                  outputdir=outputdir,
                  pack=pack,
                  embed=embed,
                  sides=selectedSides(side),
-                 imageGenerator=generateImages)
+                 imageGenerator=imageGenerator,
+                 imageKey=imageKey(renderer),
+                 incremental=incremental,
+                 shapeArgs={
+                     "tolerance": shape_tolerance,
+                     "circles": circles
+                 },
+                 specFormat=int(spec_format),
+                 geometrySidecar=geometry_sidecar,
+                 compress=compress,
+                 tileSize=tile_size if tiles else None,
+                 imageArgs=imageArgs)
+
+    if progressive:
+        # An incremental build keeps the previous diagram usable instead of
+        # overwriting it by a preview
+        if not (incremental and (Path(outputdir) / "spec.json").exists()):
+            generateDiagram("normal", imageGenerator("normal"))
+            print("Preview diagram written, rendering raytraced images", file=sys.stderr)
+        # The preview stays usable until the raytraced images are complete
+        generateDiagram(renderer, stagedImageGenerator(imageGenerator(renderer), imageArgs))
+    else:
+        generateDiagram(renderer, imageGenerator(renderer))
+
+def loadBatch(batch):
+    """
+    Read the list of diagrams of a batch. The relative paths are resolved
+    against the directory of the batch file.
+    """
+    from ruamel.yaml import YAML
 
+    yaml=YAML(typ='safe')
+    with click.open_file(batch, "r") as batchFile:
+        diagrams = yaml.load(batchFile)
+    if not isinstance(diagrams, list) or len(diagrams) == 0:
+        raise click.ClickException(f"{batch} has to contain a non-empty list of diagrams")
+    root = Path(batch).parent
+    resolved = []
+    for diagram in diagrams:
+        if not isinstance(diagram, dict) or \
+                any(key not in diagram for key in ["board", "specification", "output"]):
+            raise click.ClickException(
+                f"Every diagram in {batch} needs board, specification and output")
+        resolved.append(tuple(root / diagram[key]
+                              for key in ["board", "specification", "output"]))
+    return resolved
+
+@click.command("rendered-batch")
+@click.argument("batch", type=click.Path(file_okay=True, dir_okay=False, exists=True))
+@diagramCommandArgs
+@renderCommandArgs
+@click.option("-j", "--jobs", type=click.IntRange(min=1), default=None,
+    help="Maximal number of concurrent kicad-cli renders; all at once by default")
+def generateRenderedBatch(batch, pack, embed, side, incremental, shape_tolerance,
+                          circles, spec_format, geometry_sidecar, compress, tiles,
+                          tile_size, image_format, image_quality, keep_png,
+                          optimize_png, png_colors, srcset, renderer, projection,
+                          pixels_per_mm, max_pixels, render_timeout, jobs):
+    """
+    Generate pinout diagrams of several boards with images rendered by
+    kicad-cli. BATCH is a YAML list of diagrams given by board, specification
+    and output (directory). The renders of all boards run concurrently.
+    """
+    with stage("import pcbnew"):
+        import pinion.generate
+        import pcbnew
+    from pinion.kicadcli import RenderSession
+    from ruamel.yaml import YAML
+
+    rejectSvgImages(image_format)
+    diagrams = loadBatch(batch)
+    yaml=YAML(typ='safe')
+    try:
+        session = RenderSession(timeout=render_timeout, jobs=jobs)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+
+    loaded = []
+    for board, specification, outputdir in diagrams:
+        with click.open_file(specification, "r") as specificationFile, \
+                stage("parse specification"):
+            specification = yaml.load(specificationFile)
+        with stage("load board"):
+            loaded.append((pcbnew.LoadBoard(str(board)), specification, outputdir))
+
+    imageArgs = imageArguments(image_format, image_quality, keep_png,
+                               optimize_png, png_colors, srcset)
+    pinion.generate.generateRenderedBatch(loaded, session,
+        orthographic=(projection == "orthographic"),
+        raytraced=(renderer == "raytrace"),
+        sides=selectedSides(side),
+        pixelsPerMm=pixels_per_mm,
+        maxPixels=max_pixels,
+        imageKey=renderedImageKey("kicad-cli", renderer, projection, True,
+                                  pixels_per_mm, max_pixels, True),
+        incremental=incremental,
+        imageArgs=imageArgs,
+        pack=pack,
+        embed=embed,
+        shapeArgs={
+            "tolerance": shape_tolerance,
+            "circles": circles
+        },
+        specFormat=int(spec_format),
+        geometrySidecar=geometry_sidecar,
+        compress=compress,
+        tileSize=tile_size if tiles else None)
 
 @click.group()
 def generate():
@@ -248,6 +550,7 @@ def generate():
 
 generate.add_command(generatePlotted)
 generate.add_command(generateRendered)
+generate.add_command(generateRenderedBatch)
 
 @click.command("get")
 @click.argument("what", type=str)
@@ -17,7 +17,7 @@ setuptools.setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://github.com/yaqwsx/Pinion",
-    packages=setuptools.find_packages(),
+    packages=setuptools.find_packages(exclude=["benchmarks", "benchmarks.*"]),
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
@@ -28,6 +28,9 @@ setuptools.setup(
         "ruamel.yaml",
         "pcbdraw>=1.2",
     ],
+    extras_require={
+        "brotli": ["brotli"]
+    },
     setup_requires=[
         "versioneer"
     ],
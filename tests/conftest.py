@@ -0,0 +1,7 @@
+import importlib.util
+import os
+import sys
+
+# Without KiCAD, the tests run against the pure-Python stand-in of pcbnew
+if importlib.util.find_spec("pcbnew") is None:
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "fakepcbnew"))
@@ -0,0 +1,549 @@
+"""
+Pure-Python stand-in for the subset of the KiCAD pcbnew API that Pinion uses
+outside of image generation. It makes the geometry, sorting and specification
+code testable and benchmarkable without KiCAD.
+
+LoadBoard reads a subset of the KiCAD 6 board format: footprints with their
+reference, value, layer, position, rotation, pads and graphics, and the board
+edges. That covers the boards written by benchmarks.boards and the example
+board in the documentation. The pad shapes are approximated by polygons the
+same way KiCAD does it (with the default maximal error of 5 um). Only two
+copper layers are supported.
+"""
+
+import math
+import os
+import re
+from typing import List, Optional
+
+IU_PER_MM = 1000000
+
+F_Cu = 0
+B_Cu = 31
+
+PAD_SHAPE_CIRCLE = 0
+PAD_SHAPE_RECT = 1
+PAD_SHAPE_OVAL = 2
+PAD_SHAPE_TRAPEZOID = 3
+PAD_SHAPE_ROUNDRECT = 4
+PAD_SHAPE_CHAMFERED_RECT = 5
+PAD_SHAPE_CUSTOM = 6
+
+PAD_DRILL_SHAPE_CIRCLE = 0
+PAD_DRILL_SHAPE_OBLONG = 1
+
+PAD_SHAPES = {
+    "circle": PAD_SHAPE_CIRCLE,
+    "rect": PAD_SHAPE_RECT,
+    "oval": PAD_SHAPE_OVAL,
+    "trapezoid": PAD_SHAPE_TRAPEZOID,
+    "roundrect": PAD_SHAPE_ROUNDRECT,
+    "chamfered_rect": PAD_SHAPE_CHAMFERED_RECT,
+    "custom": PAD_SHAPE_CUSTOM
+}
+
+ARC_HIGH_DEF = 0.005 * IU_PER_MM
+
+def kiRound(value: float) -> int:
+    """
+    Round half up, so rounding commutes with integer translation
+    """
+    return int(math.floor(value + 0.5))
+
+def mm2iu(value) -> int:
+    return kiRound(float(value) * IU_PER_MM)
+
+class VECTOR2I:
+    def __init__(self, x: int = 0, y: int = 0):
+        self.x = x
+        self.y = y
+
+    def __eq__(self, other):
+        return self.x == other.x and self.y == other.y
+
+    def __repr__(self):
+        return f"VECTOR2I({self.x}, {self.y})"
+
+wxPoint = VECTOR2I
+wxSize = VECTOR2I
+
+class EDA_ANGLE:
+    def __init__(self, degrees: float = 0):
+        self.degrees = degrees
+
+    def AsDegrees(self) -> float:
+        return self.degrees
+
+class BOX2I:
+    def __init__(self, position: Optional[VECTOR2I] = None,
+                 size: Optional[VECTOR2I] = None):
+        position = position or VECTOR2I()
+        size = size or VECTOR2I()
+        self.x, self.y = position.x, position.y
+        self.w, self.h = size.x, size.y
+
+    @staticmethod
+    def FromPoints(points) -> "BOX2I":
+        xs = [p[0] for p in points]
+        ys = [p[1] for p in points]
+        return BOX2I(VECTOR2I(min(xs), min(ys)),
+                     VECTOR2I(max(xs) - min(xs), max(ys) - min(ys)))
+
+    def GetX(self) -> int:
+        return self.x
+
+    def GetY(self) -> int:
+        return self.y
+
+    def GetWidth(self) -> int:
+        return self.w
+
+    def GetHeight(self) -> int:
+        return self.h
+
+    def GetPosition(self) -> VECTOR2I:
+        return VECTOR2I(self.x, self.y)
+
+    def GetSize(self) -> VECTOR2I:
+        return VECTOR2I(self.w, self.h)
+
+    def GetLeft(self) -> int:
+        return self.x
+
+    def GetTop(self) -> int:
+        return self.y
+
+    def GetRight(self) -> int:
+        return self.x + self.w
+
+    def GetBottom(self) -> int:
+        return self.y + self.h
+
+    def Merge(self, other: "BOX2I") -> "BOX2I":
+        x1, y1 = min(self.x, other.x), min(self.y, other.y)
+        x2 = max(self.GetRight(), other.GetRight())
+        y2 = max(self.GetBottom(), other.GetBottom())
+        self.x, self.y, self.w, self.h = x1, y1, x2 - x1, y2 - y1
+        return self
+
+EDA_RECT = BOX2I
+
+class SHAPE_LINE_CHAIN:
+    def __init__(self, points):
+        self.points = [VECTOR2I(kiRound(x), kiRound(y)) for x, y in points]
+
+    def PointCount(self) -> int:
+        return len(self.points)
+
+    def CPoint(self, index: int) -> VECTOR2I:
+        return self.points[index]
+
+class SHAPE_POLY_SET:
+    def __init__(self, outlines=()):
+        self.outlines = list(outlines)
+
+    def OutlineCount(self) -> int:
+        return len(self.outlines)
+
+    def Outline(self, index: int) -> SHAPE_LINE_CHAIN:
+        return self.outlines[index]
+
+class LSET:
+    def __init__(self, layers=()):
+        self.layers = set(layers)
+
+    def Contains(self, layer: int) -> bool:
+        return layer in self.layers
+
+    def CuStack(self) -> List[int]:
+        return sorted(l for l in self.layers if l in (F_Cu, B_Cu))
+
+    def Seq(self) -> List[int]:
+        return sorted(self.layers)
+
+def rotate(x: float, y: float, degrees: float):
+    """
+    Rotate a point the same way as KiCAD does (counterclockwise on the screen,
+    the y axis points down)
+    """
+    if degrees == 0:
+        return x, y
+    angle = math.radians(degrees)
+    c, s = math.cos(angle), math.sin(angle)
+    return x * c + y * s, -x * s + y * c
+
+def arcSegmentCount(radius: float, maxError: float = ARC_HIGH_DEF,
+                    degrees: float = 360) -> int:
+    if radius <= maxError:
+        return 8
+    step = 2 * math.degrees(math.acos(1 - maxError / radius))
+    return max(8, math.ceil(degrees / step))
+
+def arc(cx: float, cy: float, radius: float, start: float, end: float):
+    """
+    Approximate an arc (angles in degrees, counterclockwise in the usual
+    mathematical sense, clockwise on the screen) by points including both ends
+    """
+    count = max(1, math.ceil(arcSegmentCount(radius, degrees=abs(end - start))))
+    return [(cx + radius * math.cos(math.radians(start + (end - start) * i / count)),
+             cy + radius * math.sin(math.radians(start + (end - start) * i / count)))
+            for i in range(count + 1)]
+
+class PAD:
+    def __init__(self, footprint: "FOOTPRINT", name: str, padType: str,
+                 shape: str, position: VECTOR2I, orientation: float,
+                 size: VECTOR2I, drill: VECTOR2I, drillShape: int,
+                 layers: LSET, netname: str, offset: VECTOR2I, delta: VECTOR2I,
+                 roundRectRatio: float, chamferRatio: float, chamferPositions: int):
+        self.footprint = footprint
+        self.name = name
+        self.padType = padType
+        self.shape = PAD_SHAPES[shape]
+        self.position = position
+        self.orientation = orientation
+        self.size = size
+        self.drill = drill
+        self.drillShape = drillShape
+        self.layers = layers
+        self.netname = netname
+        self.offset = offset
+        self.delta = delta
+        self.roundRectRatio = roundRectRatio
+        self.chamferRatio = chamferRatio
+        self.chamferPositions = chamferPositions
+        self._polygon = None
+
+    def GetName(self) -> str:
+        return self.name
+
+    GetNumber = GetName
+
+    def GetNetname(self) -> str:
+        return self.netname
+
+    def GetParent(self) -> "FOOTPRINT":
+        return self.footprint
+
+    def GetPosition(self) -> VECTOR2I:
+        return VECTOR2I(self.position.x, self.position.y)
+
+    def GetLayerSet(self) -> LSET:
+        return self.layers
+
+    def IsOnLayer(self, layer: int) -> bool:
+        return self.layers.Contains(layer)
+
+    def GetShape(self, layer: Optional[int] = None) -> int:
+        return self.shape
+
+    def GetSize(self, layer: Optional[int] = None) -> VECTOR2I:
+        return VECTOR2I(self.size.x, self.size.y)
+
+    def GetDrillSize(self) -> VECTOR2I:
+        return VECTOR2I(self.drill.x, self.drill.y)
+
+    def GetDrillShape(self) -> int:
+        return self.drillShape
+
+    def GetOffset(self, layer: Optional[int] = None) -> VECTOR2I:
+        return VECTOR2I(self.offset.x, self.offset.y)
+
+    def GetDelta(self, layer: Optional[int] = None) -> VECTOR2I:
+        return VECTOR2I(self.delta.x, self.delta.y)
+
+    def GetOrientation(self) -> EDA_ANGLE:
+        return EDA_ANGLE(self.orientation)
+
+    def GetRoundRectRadiusRatio(self, layer: Optional[int] = None) -> float:
+        return self.roundRectRatio
+
+    def GetChamferRectRatio(self, layer: Optional[int] = None) -> float:
+        return self.chamferRatio
+
+    def GetChamferPositions(self, layer: Optional[int] = None) -> int:
+        return self.chamferPositions
+
+    def HasHole(self) -> bool:
+        return self.drill.x > 0
+
+    def _localOutline(self):
+        """
+        Outline of the pad shape centered at the origin, unrotated
+        """
+        w, h = self.size.x / 2, self.size.y / 2
+        if self.shape == PAD_SHAPE_CIRCLE:
+            return arc(0, 0, w, 0, 360)[:-1]
+        if self.shape == PAD_SHAPE_OVAL:
+            if w == h:
+                return arc(0, 0, w, 0, 360)[:-1]
+            if w > h:
+                return arc(w - h, 0, h, -90, 90) + arc(-(w - h), 0, h, 90, 270)
+            return arc(0, h - w, w, 0, 180) + arc(0, -(h - w), w, 180, 360)
+        if self.shape == PAD_SHAPE_TRAPEZOID:
+            dx, dy = self.delta.x / 2, self.delta.y / 2
+            return [(-w - dy, h + dx), (w + dy, h - dx),
+                    (w - dy, -h + dx), (-w + dy, -h - dx)]
+        if self.shape == PAD_SHAPE_ROUNDRECT:
+            r = self.roundRectRatio * min(self.size.x, self.size.y)
+            if r > 0:
+                return (arc(w - r, h - r, r, 0, 90) + arc(-w + r, h - r, r, 90, 180) +
+                        arc(-w + r, -h + r, r, 180, 270) + arc(w - r, -h + r, r, 270, 360))
+        # Rectangles and the shapes we don't model (chamfered and custom)
+        return [(-w, -h), (w, -h), (w, h), (-w, h)]
+
+    def _outline(self):
+        if self._polygon is None:
+            points = []
+            for x, y in self._localOutline():
+                x, y = rotate(x + self.offset.x, y + self.offset.y, self.orientation)
+                points.append((x + self.position.x, y + self.position.y))
+            self._polygon = points
+        return self._polygon
+
+    def GetEffectivePolygon(self, layer: Optional[int] = None,
+                            errorLoc: Optional[int] = None) -> SHAPE_POLY_SET:
+        return SHAPE_POLY_SET([SHAPE_LINE_CHAIN(self._outline())])
+
+    def GetBoundingBox(self) -> BOX2I:
+        points = [(kiRound(x), kiRound(y)) for x, y in self._outline()]
+        return BOX2I.FromPoints(points)
+
+class FOOTPRINT:
+    def __init__(self, board: "BOARD", reference: str, value: str, layer: int,
+                 position: VECTOR2I, orientation: float):
+        self.board = board
+        self.reference = reference
+        self.value = value
+        self.layer = layer
+        self.position = position
+        self.orientation = orientation
+        self.pads: List[PAD] = []
+        self.graphics = []
+
+    def GetReference(self) -> str:
+        return self.reference
+
+    def GetValue(self) -> str:
+        return self.value
+
+    def GetLayer(self) -> int:
+        return self.layer
+
+    def IsFlipped(self) -> bool:
+        return self.layer == B_Cu
+
+    def GetPosition(self) -> VECTOR2I:
+        return VECTOR2I(self.position.x, self.position.y)
+
+    def GetOrientation(self) -> EDA_ANGLE:
+        return EDA_ANGLE(self.orientation)
+
+    def GetBoard(self) -> "BOARD":
+        return self.board
+
+    def Pads(self) -> List[PAD]:
+        return list(self.pads)
+
+    def HasThroughHolePads(self) -> bool:
+        return any(pad.padType == "thru_hole" for pad in self.pads)
+
+    def GetBoundingBox(self, includeText: bool = True,
+                       includeInvisible: bool = True) -> BOX2I:
+        # Text is not modeled, it is always excluded
+        points = list(self.graphics)
+        for pad in self.pads:
+            bbox = pad.GetBoundingBox()
+            points += [(bbox.GetLeft(), bbox.GetTop()),
+                       (bbox.GetRight(), bbox.GetBottom())]
+        if not points:
+            return BOX2I(self.GetPosition())
+        return BOX2I.FromPoints(points)
+
+class BOARD:
+    def __init__(self, filename: str = ""):
+        self.filename = filename
+        self.footprints: List[FOOTPRINT] = []
+        self.edges = []
+
+    def GetFileName(self) -> str:
+        return self.filename
+
+    def GetFootprints(self) -> List[FOOTPRINT]:
+        return list(self.footprints)
+
+    Footprints = GetFootprints
+
+    def FindFootprintByReference(self, reference: str) -> Optional[FOOTPRINT]:
+        for footprint in self.footprints:
+            if footprint.GetReference() == reference:
+                return footprint
+        return None
+
+    def GetBoardEdgesBoundingBox(self) -> BOX2I:
+        if not self.edges:
+            return self.ComputeBoundingBox()
+        return BOX2I.FromPoints(self.edges)
+
+    def ComputeBoundingBox(self, boardEdgesOnly: bool = False) -> BOX2I:
+        if boardEdgesOnly:
+            return self.GetBoardEdgesBoundingBox()
+        boxes = [f.GetBoundingBox(False, False) for f in self.footprints]
+        points = list(self.edges)
+        for bbox in boxes:
+            points += [(bbox.GetLeft(), bbox.GetTop()),
+                       (bbox.GetRight(), bbox.GetBottom())]
+        if not points:
+            return BOX2I()
+        return BOX2I.FromPoints(points)
+
+# S-expression reader
+
+TOKEN = re.compile(r'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|([^\s()"]+))')
+
+def parseSexpr(text: str):
+    stack = [[]]
+    for match in TOKEN.finditer(text):
+        opening, closing, string, atom = match.groups()
+        if opening:
+            stack.append([])
+        elif closing:
+            item = stack.pop()
+            stack[-1].append(item)
+        elif string is not None:
+            stack[-1].append(re.sub(r"\\(.)", r"\1", string))
+        elif atom is not None:
+            stack[-1].append(atom)
+    return stack[0][0]
+
+def children(node, name: str):
+    return [x for x in node[1:] if isinstance(x, list) and x and x[0] == name]
+
+def child(node, name: str):
+    found = children(node, name)
+    return found[0] if found else None
+
+def layerNames(node) -> List[str]:
+    names = []
+    for layers in children(node, "layers") + children(node, "layer"):
+        names += layers[1:]
+    return names
+
+def copperLayers(names) -> LSET:
+    layers = set()
+    for name in names:
+        if name in ("*.Cu", "F&B.Cu", "F.Cu"):
+            layers.add(F_Cu)
+        if name in ("*.Cu", "F&B.Cu", "B.Cu"):
+            layers.add(B_Cu)
+    return LSET(layers)
+
+def position(node):
+    """
+    Return (x, y, angle) of an "at" node
+    """
+    at = child(node, "at")
+    if at is None:
+        return 0, 0, 0
+    angle = float(at[3]) if len(at) > 3 and at[3] != "unlocked" else 0
+    return mm2iu(at[1]), mm2iu(at[2]), angle
+
+def graphicPoints(node):
+    """
+    Return the points bounding a graphic item (line, rect, arc, circle or
+    polygon) in its coordinate system including the line width
+    """
+    stroke = child(node, "stroke")
+    width = child(stroke, "width") if stroke is not None else child(node, "width")
+    halfWidth = mm2iu(width[1]) / 2 if width is not None else 0
+    kind = node[0][3:]
+    points = []
+    if kind == "circle":
+        cx, cy = mm2iu(child(node, "center")[1]), mm2iu(child(node, "center")[2])
+        ex, ey = mm2iu(child(node, "end")[1]), mm2iu(child(node, "end")[2])
+        r = math.hypot(ex - cx, ey - cy)
+        points = [(cx - r, cy - r), (cx + r, cy + r)]
+    elif kind == "poly":
+        pts = child(node, "pts")
+        points = [(mm2iu(p[1]), mm2iu(p[2])) for p in children(pts, "xy")]
+    else:
+        for name in ["start", "mid", "end"]:
+            point = child(node, name)
+            if point is not None:
+                points.append((mm2iu(point[1]), mm2iu(point[2])))
+    return [(x + dx, y + dy) for x, y in points
+            for dx, dy in [(-halfWidth, -halfWidth), (halfWidth, halfWidth)]]
+
+def loadPad(footprint: FOOTPRINT, node, fx: int, fy: int, fangle: float) -> PAD:
+    x, y, angle = position(node)
+    # The pad position is relative to the footprint, the orientation is
+    # absolute
+    rx, ry = rotate(x, y, fangle)
+    size = child(node, "size")
+    drill = child(node, "drill")
+    drillSize, drillShape = VECTOR2I(), PAD_DRILL_SHAPE_CIRCLE
+    offset = VECTOR2I()
+    if drill is not None:
+        values = [v for v in drill[1:] if not isinstance(v, list)]
+        if values and values[0] == "oval":
+            drillShape = PAD_DRILL_SHAPE_OBLONG
+            values = values[1:]
+        if values:
+            drillSize = VECTOR2I(mm2iu(values[0]), mm2iu(values[-1]))
+        drillOffset = child(drill, "offset")
+        if drillOffset is not None:
+            offset = VECTOR2I(mm2iu(drillOffset[1]), mm2iu(drillOffset[2]))
+    delta = child(node, "rect_delta")
+    net = child(node, "net")
+    rratio = child(node, "roundrect_rratio")
+    chamferRatio = child(node, "chamfer_ratio")
+    return PAD(footprint, node[1], node[2], node[3],
+               position=VECTOR2I(kiRound(fx + rx), kiRound(fy + ry)),
+               orientation=angle,
+               size=VECTOR2I(mm2iu(size[1]), mm2iu(size[2])),
+               drill=drillSize, drillShape=drillShape,
+               layers=copperLayers(layerNames(node)),
+               netname=net[2] if net is not None and len(net) > 2 else "",
+               offset=offset,
+               delta=VECTOR2I(mm2iu(delta[1]), mm2iu(delta[2])) if delta else VECTOR2I(),
+               roundRectRatio=float(rratio[1]) if rratio else 0.25,
+               chamferRatio=float(chamferRatio[1]) if chamferRatio else 0.2,
+               chamferPositions=0)
+
+def loadFootprint(board: BOARD, node) -> FOOTPRINT:
+    x, y, angle = position(node)
+    texts = {t[1]: t[2] for t in children(node, "fp_text")}
+    for prop in children(node, "property"):
+        texts[prop[1].lower()] = prop[2]
+    layer = B_Cu if child(node, "layer")[1] == "B.Cu" else F_Cu
+    footprint = FOOTPRINT(board, texts.get("reference", ""), texts.get("value", ""),
+                          layer, VECTOR2I(x, y), angle)
+    for pad in children(node, "pad"):
+        footprint.pads.append(loadPad(footprint, pad, x, y, angle))
+    for item in node[1:]:
+        if not isinstance(item, list) or item[0] not in ("fp_line", "fp_rect", "fp_arc",
+                                                         "fp_circle", "fp_poly"):
+            continue
+        points = []
+        for px, py in graphicPoints(item):
+            rx, ry = rotate(px, py, angle)
+            points.append((kiRound(x + rx), kiRound(y + ry)))
+        footprint.graphics += points
+        if "Edge.Cuts" in layerNames(item):
+            board.edges += points
+    return footprint
+
+def LoadBoard(filename: str) -> BOARD:
+    if not os.path.exists(filename):
+        raise IOError(f"Cannot open board '{filename}'")
+    with open(filename, encoding="utf-8") as f:
+        root = parseSexpr(f.read())
+    board = BOARD(filename)
+    for item in root[1:]:
+        if not isinstance(item, list):
+            continue
+        if item[0] in ("footprint", "module"):
+            board.footprints.append(loadFootprint(board, item))
+        elif item[0] in ("gr_line", "gr_rect", "gr_arc", "gr_circle", "gr_poly") \
+                and "Edge.Cuts" in layerNames(item):
+            board.edges += [(kiRound(x), kiRound(y)) for x, y in graphicPoints(item)]
+    return board
@@ -0,0 +1,28 @@
+import unittest
+
+from benchmarks.bench import compareResults
+from benchmarks.boards import syntheticBoard
+
+
+class BenchmarksTest(unittest.TestCase):
+    def test_synthetic_board_size(self):
+        for size in [100, 1000]:
+            board = syntheticBoard(size)
+            pads = sum(len(f["pads"]) for f in board["footprints"])
+            self.assertGreaterEqual(pads, size)
+            self.assertLess(pads, size + 20)
+            references = [f["ref"] for f in board["footprints"]]
+            self.assertEqual(len(references), len(set(references)))
+
+    def test_compare_reports_regressions(self):
+        baseline = {"results": {"alks": {"a": {"min": 1.0}, "b": {"min": 1.0},
+                                         "c": {"min": 0.001}}}}
+        current = {"results": {"alks": {"a": {"min": 1.1}, "b": {"min": 1.5},
+                                        "c": {"min": 0.002}, "d": {"min": 1.0}}}}
+        comparison = compareResults(baseline, current, threshold=0.2, minTime=0.005)
+        self.assertEqual([(stage, regressed) for _, stage, _, _, regressed in comparison],
+                         [("a", False), ("b", True), ("c", False)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from pinion.build import (BuildManifest, MANIFEST_NAME, directoryDigest,
+                          optionDigest, valueDigest)
+
+
+class BuildManifestTest(unittest.TestCase):
+    def test_stage_is_fresh_after_save(self):
+        with tempfile.TemporaryDirectory(prefix="pinion-test-") as directory:
+            (Path(directory) / "spec.json").touch()
+            manifest = BuildManifest(directory)
+            manifest.record("spec", "key", result={"a": 1}, outputs=["spec.json"])
+            manifest.save()
+
+            manifest = BuildManifest(directory)
+            self.assertTrue(manifest.fresh("spec", "key"))
+            self.assertFalse(manifest.fresh("spec", "other key"))
+            self.assertEqual(manifest.result("spec"), {"a": 1})
+
+    def test_stage_with_missing_output_is_stale(self):
+        with tempfile.TemporaryDirectory(prefix="pinion-test-") as directory:
+            manifest = BuildManifest(directory)
+            manifest.record("image-front", "key", outputs=["front.png"])
+            self.assertFalse(manifest.fresh("image-front", "key"))
+
+    def test_disabled_manifest_is_never_fresh(self):
+        with tempfile.TemporaryDirectory(prefix="pinion-test-") as directory:
+            manifest = BuildManifest(directory, enabled=False)
+            manifest.record("spec", "key")
+            manifest.save()
+
+            self.assertFalse(manifest.fresh("spec", "key"))
+            self.assertFalse((Path(directory) / MANIFEST_NAME).exists())
+
+    def test_corrupted_manifest_is_ignored(self):
+        with tempfile.TemporaryDirectory(prefix="pinion-test-") as directory:
+            (Path(directory) / MANIFEST_NAME).write_text("{")
+            manifest = BuildManifest(directory)
+            self.assertFalse(manifest.fresh("spec", "key"))
+
+    def test_option_digest_hashes_file_content(self):
+        with tempfile.TemporaryDirectory(prefix="pinion-test-") as directory:
+            style = Path(directory) / "style.json"
+            style.write_text("{}")
+            digest = optionDigest(str(style))
+            style.write_text('{"board": "#000000"}')
+
+            self.assertNotEqual(optionDigest(str(style)), digest)
+            self.assertEqual(optionDigest("builtin-style"), "builtin-style")
+            self.assertIsNone(optionDigest(None))
+
+    def test_directory_digest_tracks_file_content(self):
+        with tempfile.TemporaryDirectory(prefix="pinion-test-") as directory:
+            footprint = Path(directory) / "Lib" / "R.svg"
+            footprint.parent.mkdir()
+            footprint.write_text("<svg/>")
+            digest = directoryDigest([directory, Path(directory) / "missing"])
+            footprint.write_text("<svg><g/></svg>")
+
+            self.assertNotEqual(directoryDigest([directory]), digest)
+
+    def test_value_digest_ignores_key_order(self):
+        self.assertEqual(valueDigest({"a": 1, "b": [1, 2]}),
+                         valueDigest({"b": (1, 2), "a": 1}))
+
+
+if __name__ == "__main__":
+    unittest.main()
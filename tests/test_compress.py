@@ -0,0 +1,61 @@
+import gzip
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from pinion.compress import compressedPath, compressFiles
+
+
+class CompressTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.files = []
+        for name in ["spec.json", "pinion.js"]:
+            path = self.dir / name
+            path.write_text(name * 1000)
+            self.files.append(path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_gzip_siblings(self):
+        written = compressFiles(self.files, ["gz"])
+        self.assertEqual(sorted(written), sorted(compressedPath(f, "gz") for f in self.files))
+        for f in self.files:
+            with gzip.open(compressedPath(f, "gz")) as c:
+                self.assertEqual(c.read(), f.read_bytes())
+
+    def test_gzip_is_reproducible(self):
+        compressFiles(self.files, ["gz"])
+        first = compressedPath(self.files[0], "gz").read_bytes()
+        os.remove(compressedPath(self.files[0], "gz"))
+        compressFiles(self.files, ["gz"])
+        self.assertEqual(compressedPath(self.files[0], "gz").read_bytes(), first)
+
+    def test_fresh_siblings_are_skipped(self):
+        compressFiles(self.files, ["gz"])
+        self.assertEqual(compressFiles(self.files, ["gz"]), [])
+        stat = self.files[0].stat()
+        os.utime(self.files[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        self.assertEqual(compressFiles(self.files, ["gz"]),
+                         [compressedPath(self.files[0], "gz")])
+
+    def test_siblings_of_other_methods_are_removed(self):
+        compressFiles(self.files, ["gz", "br"])
+        compressFiles(self.files, ["br"])
+        for f in self.files:
+            self.assertFalse(compressedPath(f, "gz").exists())
+            self.assertTrue(compressedPath(f, "br").exists())
+        compressFiles(self.files, [])
+        self.assertEqual(sorted(p.name for p in self.dir.iterdir()),
+                         ["pinion.js", "spec.json"])
+
+    def test_unknown_method_is_rejected(self):
+        with self.assertRaises(RuntimeError):
+            compressFiles(self.files, ["zip"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,404 @@
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import types
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+import pcbnew
+from ruamel.yaml import YAML
+
+from PIL import Image
+
+from benchmarks.boards import syntheticBoard, writeKicadBoard
+from pinion.generate import (PadGeometryCache, boardAreaRect, buildSpecification,
+                             componentsDefinition, createPlotter, generateRenderedBatch,
+                             generateRenderedImages,
+                             overlappingRectComparator,
+                             renderResolution, renderedAreaRect, sortByRectangles,
+                             stagedImageGenerator, writeSpecification)
+from pinion.kicadcli import RenderSession
+from pinion.specformat import decodeSpecification, encodeSpecification
+from pinion.template import collectComponents
+
+RESOURCES = Path(__file__).resolve().parent.parent / "docs" / "resources"
+ALKS_BOARD = RESOURCES / "ArduinoLearningKitStarter.kicad_pcb"
+ALKS_SPEC = RESOURCES / "alksSpec.yml"
+
+
+def loadSynthetic(tmp, padCount):
+    description = syntheticBoard(padCount)
+    filename = Path(tmp) / "board.kicad_pcb"
+    writeKicadBoard(description, filename)
+    return description, pcbnew.LoadBoard(str(filename))
+
+
+def insertionSortByRectangles(items):
+    """
+    The original insertion sort on the partial ordering, the reference for
+    sortByRectangles
+    """
+    for i in range(1, len(items)):
+        for j in reversed(range(i)):
+            cmp = overlappingRectComparator(items[j]["bbox"], items[j+1]["bbox"])
+            if cmp == 1:
+                break
+            items[j], items[j + 1] = items[j + 1], items[j]
+    return items
+
+
+def randomItems(rng, count, extent):
+    items = []
+    for i in range(count):
+        x, y = rng.randint(0, extent), rng.randint(0, extent)
+        w, h = rng.randint(1, extent // 2), rng.randint(1, extent // 2)
+        if rng.random() < 0.1 and items:
+            # Exact duplicates and touching rects are the corner cases
+            bbox = dict(rng.choice(items)["bbox"])
+        else:
+            bbox = {"tl": (x, y), "br": (x + w, y + h)}
+        items.append({"ref": i, "bbox": bbox})
+    return items
+
+
+class SortByRectanglesTest(unittest.TestCase):
+    def assertSameOrder(self, items):
+        expected = [x["ref"] for x in insertionSortByRectangles(list(items))]
+        self.assertEqual([x["ref"] for x in sortByRectangles(list(items))], expected)
+
+    def test_matches_insertion_sort(self):
+        rng = random.Random(42)
+        for _ in range(2000):
+            self.assertSameOrder(randomItems(rng, rng.randint(0, 30), rng.choice([5, 20, 100])))
+
+    def test_matches_insertion_sort_on_dense_boards(self):
+        rng = random.Random(7)
+        for _ in range(5):
+            self.assertSameOrder(randomItems(rng, 300, 40))
+
+    def test_matches_insertion_sort_on_nested_rects(self):
+        # Every item goes between the same two items, so the labels have to be
+        # reassigned
+        items = [{"ref": 0, "bbox": {"tl": (0, 0), "br": (1000, 1000)}}]
+        items += [{"ref": i, "bbox": {"tl": (0, 0), "br": (2000 - i, 2000 - i)}}
+                  for i in range(1, 100)]
+        self.assertSameOrder(items)
+        self.assertSameOrder(list(reversed(items)))
+
+
+class RenderResolutionTest(unittest.TestCase):
+    def test_follows_aspect_ratio(self):
+        area = {"tl": (10, 10), "br": (110, 60)}
+        self.assertEqual(renderResolution(area, maxPixels=2 * 100 * 100), (200, 100))
+        self.assertEqual(renderResolution(area, pixelsPerMm=1), (100, 50))
+
+    def test_board_without_outline(self):
+        area = {"tl": (0, 0), "br": (0, 0)}
+        self.assertEqual(renderResolution(area), (3000, 3000))
+        self.assertEqual(renderResolution(area, pixelsPerMm=10, maxPixels=100), (10, 10))
+
+
+class AlksTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.board = pcbnew.LoadBoard(str(ALKS_BOARD))
+        with open(ALKS_SPEC) as f:
+            cls.specification = json.loads(json.dumps(YAML(typ="safe").load(f)))
+
+    def test_board_area(self):
+        area = boardAreaRect(self.board)
+        width = area["br"][0] - area["tl"][0]
+        height = area["br"][1] - area["tl"][1]
+        self.assertGreater(width, 80)
+        self.assertGreater(height, 55)
+
+    def test_components_definition(self):
+        components = self.specification["components"]
+        definitions = componentsDefinition(components, self.board)
+        self.assertEqual(sorted(d["ref"] for d in definitions), sorted(components.keys()))
+        for definition in definitions:
+            pinNames = [p["name"] for p in definition["pins"]]
+            spec = components[definition["ref"]].get("pins") or {}
+            self.assertEqual(len(pinNames), len(spec))
+            tl, br = definition["bbox"]["tl"], definition["bbox"]["br"]
+            for pin in definition["pins"]:
+                x, y = pin["pos"]
+                self.assertTrue(tl[0] <= x <= br[0] and tl[1] <= y <= br[1])
+
+    def test_stale_sidecar_is_removed(self):
+        area = boardAreaRect(self.board)
+        spec = buildSpecification(self.board, self.specification, {"front": area})
+        with TemporaryDirectory() as outputdir:
+            outputdir = Path(outputdir)
+            writeSpecification(outputdir, spec, 1, geometrySidecar=True)
+            (outputdir / "geometry.bin.gz").write_bytes(b"")
+            self.assertTrue((outputdir / "geometry.bin").exists())
+
+            writeSpecification(outputdir, spec, 1, geometrySidecar=False)
+            self.assertEqual(sorted(p.name for p in outputdir.iterdir()), ["spec.json"])
+
+    def test_missing_component(self):
+        with self.assertRaises(RuntimeError):
+            componentsDefinition({"X1000": {"description": ""}}, self.board)
+
+    def test_specification_round_trip(self):
+        area = boardAreaRect(self.board)
+        spec = buildSpecification(self.board, self.specification,
+                                  {"front": area, "back": area})
+        for specFormat in [1, 2]:
+            decoded = decodeSpecification(encodeSpecification(spec, specFormat))
+            self.assertEqual([c["ref"] for c in decoded["components"]],
+                             [c["ref"] for c in spec["components"]])
+
+
+class SyntheticBoardTest(unittest.TestCase):
+    def test_load(self):
+        with TemporaryDirectory() as tmp:
+            description, board = loadSynthetic(tmp, 500)
+            self.assertEqual(len(board.GetFootprints()), len(description["footprints"]))
+            for footprint in description["footprints"]:
+                loaded = board.FindFootprintByReference(footprint["ref"])
+                self.assertEqual(len(loaded.Pads()), len(footprint["pads"]))
+                self.assertEqual(loaded.GetLayer() == pcbnew.B_Cu,
+                                 footprint["layer"] == "B.Cu")
+
+    def test_collect_components(self):
+        with TemporaryDirectory() as tmp:
+            description, board = loadSynthetic(tmp, 500)
+            components = collectComponents(board)
+            self.assertEqual(len(components), len(description["footprints"]))
+            pads = sum(len(c["pins"]) for c in components.values())
+            self.assertEqual(pads, sum(len(f["pads"]) for f in description["footprints"]))
+
+
+def makePad(shape, position, orientation=0, size=(1000000, 600000),
+            offset=(0, 0), layer=pcbnew.F_Cu):
+    return pcbnew.PAD(None, "1", "smd", shape,
+                      position=pcbnew.VECTOR2I(*position), orientation=orientation,
+                      size=pcbnew.VECTOR2I(*size), drill=pcbnew.VECTOR2I(),
+                      drillShape=pcbnew.PAD_DRILL_SHAPE_CIRCLE,
+                      layers=pcbnew.LSET([layer]), netname="",
+                      offset=pcbnew.VECTOR2I(*offset), delta=pcbnew.VECTOR2I(),
+                      roundRectRatio=0.25, chamferRatio=0.2, chamferPositions=0)
+
+
+def expectedRectCorners(pad):
+    """
+    Corners of a rectangular pad computed directly from its parameters (in mm)
+    """
+    angle = math.radians(pad.orientation)
+    c, s = math.cos(angle), math.sin(angle)
+    corners = []
+    for sx, sy in [(-1, -1), (1, -1), (1, 1), (-1, 1)]:
+        x = sx * pad.size.x / 2 + pad.offset.x
+        y = sy * pad.size.y / 2 + pad.offset.y
+        corners.append(((pad.position.x + x * c + y * s) / 1e6,
+                        (pad.position.y - x * s + y * c) / 1e6))
+    return corners
+
+
+class PadGeometryCacheTest(unittest.TestCase):
+    # Pads that differ only in a single parameter. If the cache key missed
+    # the parameter, the later pads would get the shape of the earlier ones.
+    POSITIONS = [(0, 0), (12345678, -7654321), (-3000001, 99999999)]
+    VARIANTS = [
+        {},
+        {"orientation": 90},
+        {"orientation": 30},
+        {"orientation": -45, "offset": (200000, -100000)},
+        {"offset": (200000, 0)},
+        {"offset": (0, 150000)},
+        {"layer": pcbnew.B_Cu},
+        {"layer": pcbnew.B_Cu, "orientation": 180, "offset": (100000, 50000)},
+        {"size": (600000, 1000000)}
+    ]
+
+    def assertPointsAlmostEqual(self, points, expected):
+        self.assertEqual(len(points), len(expected))
+        for (x, y), (ex, ey) in zip(points, expected):
+            self.assertAlmostEqual(x, ex, delta=2e-6)
+            self.assertAlmostEqual(y, ey, delta=2e-6)
+
+    def test_rect_pads(self):
+        cache = PadGeometryCache()
+        for position in self.POSITIONS:
+            for variant in self.VARIANTS:
+                pad = makePad("rect", position, **variant)
+                shape, bbox = cache.geometry(pad, variant.get("layer", pcbnew.F_Cu),
+                                             pad.GetPosition())
+                expected = expectedRectCorners(pad)
+                self.assertPointsAlmostEqual(shape, expected)
+                self.assertAlmostEqual(bbox["tl"][0], min(x for x, _ in expected), delta=2e-6)
+                self.assertAlmostEqual(bbox["br"][1], max(y for _, y in expected), delta=2e-6)
+        self.assertEqual(len(cache._geometry), len(self.VARIANTS))
+
+    def test_circle_pads(self):
+        cache = PadGeometryCache()
+        for position in self.POSITIONS:
+            for variant in self.VARIANTS:
+                variant = dict(variant, size=(800000, 800000))
+                pad = makePad("circle", position, **variant)
+                shape, _ = cache.geometry(pad, variant.get("layer", pcbnew.F_Cu),
+                                          pad.GetPosition())
+                angle = math.radians(pad.orientation)
+                ox, oy = pad.offset.x, pad.offset.y
+                cx = (pad.position.x + ox * math.cos(angle) + oy * math.sin(angle)) / 1e6
+                cy = (pad.position.y - ox * math.sin(angle) + oy * math.cos(angle)) / 1e6
+                for x, y in shape:
+                    self.assertAlmostEqual(math.hypot(x - cx, y - cy), 0.4, delta=2e-6)
+
+
+# Stand-in for kicad-cli: renders an opaque board with a transparent margin of
+# a quarter of the image size
+RENDERER = f"""#!{sys.executable}
+import sys
+from PIL import Image
+arguments = sys.argv[1:]
+value = lambda name: arguments[arguments.index(name) + 1]
+width, height = int(value("--width")), int(value("--height"))
+image = Image.new("RGBA", (width, height))
+image.paste((0, 128, 0, 255), (width // 4, height // 4, width - width // 4, height - height // 4))
+image.save(value("--output"))
+"""
+
+
+class CreatePlotterTest(unittest.TestCase):
+    def test_plotter_falls_back_to_board_file(self):
+        # PcbDraw 1.3 accepts only a board file path
+        def pcbPlotter(board):
+            if not isinstance(board, str):
+                raise TypeError("PcbPlotter expects a board file path")
+            return mock.MagicMock(board=board)
+
+        plot = types.ModuleType("pcbdraw.plot")
+        plot.PcbPlotter = pcbPlotter
+        plot.PlotComponents = plot.PlotSubstrate = mock.MagicMock()
+        plot.load_remapping = lambda remap: {}
+        pcbdraw = types.ModuleType("pcbdraw")
+        pcbdraw.plot = plot
+        board = pcbnew.LoadBoard(str(ALKS_BOARD))
+        with mock.patch.dict(sys.modules, {"pcbdraw": pcbdraw, "pcbdraw.plot": plot}):
+            plotter = createPlotter(board, {"libs": None, "style": None,
+                                            "remap": None, "filter": None})
+        self.assertEqual(plotter.board, str(ALKS_BOARD))
+
+
+class RenderedAreaTest(unittest.TestCase):
+    def test_overhanging_components_extend_area(self):
+        # The Arduino Uno footprint overhangs the left board edge
+        board = pcbnew.LoadBoard(str(ALKS_BOARD))
+        boardArea = boardAreaRect(board)
+        area = renderedAreaRect(board)
+        self.assertLess(area["tl"][0], boardArea["tl"][0] - 5)
+        for footprint in board.GetFootprints():
+            bbox = footprint.GetBoundingBox(False, False)
+            self.assertGreaterEqual(bbox.GetX() / 1e6, area["tl"][0])
+            self.assertLessEqual((bbox.GetX() + bbox.GetWidth()) / 1e6, area["br"][0])
+        self.assertEqual(renderedAreaRect(board, components=False), boardArea)
+
+
+def fakeKicadCli(tmp):
+    executable = Path(tmp) / "kicad-cli"
+    executable.write_text(RENDERER)
+    executable.chmod(0o755)
+    return str(executable)
+
+
+class CountingSession(RenderSession):
+    """
+    Session recording the number of renders executed by every run
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.runs = []
+
+    def run(self):
+        self.runs.append(len(self.pending))
+        super().run()
+
+
+class KicadCliRenderTest(unittest.TestCase):
+    def test_rendered_board_spans_rendered_area(self):
+        board = pcbnew.LoadBoard(str(ALKS_BOARD))
+        area = renderedAreaRect(board)
+        with TemporaryDirectory() as tmp, \
+                mock.patch.dict(os.environ, {"KICAD_CLI": fakeKicadCli(tmp)}):
+            outputdir = Path(tmp) / "out"
+            outputdir.mkdir()
+            areas = generateRenderedImages(board, outputdir, orthographic=True,
+                raytraced=False, componets=True, baseResolution=(400, 200),
+                sides=("front", "back"), crop=True, backend="kicad-cli")
+            self.assertEqual(areas["front"], area)
+            self.assertEqual(areas["back"], {
+                "tl": (-area["br"][0], area["tl"][1]),
+                "br": (-area["tl"][0], area["br"][1])
+            })
+            for side in ["front", "back"]:
+                with Image.open(outputdir / f"{side}.png") as image:
+                    self.assertEqual(image.size, (200, 100))
+
+    def test_kicad_cli_requires_crop(self):
+        board = pcbnew.LoadBoard(str(ALKS_BOARD))
+        with TemporaryDirectory() as tmp:
+            with self.assertRaises(RuntimeError):
+                generateRenderedImages(board, Path(tmp), orthographic=True,
+                    raytraced=False, componets=True, baseResolution=(400, 200),
+                    sides=("front",), crop=False, backend="kicad-cli")
+
+    def test_batch_renders_all_boards_in_one_run(self):
+        with open(ALKS_SPEC) as f:
+            specification = YAML(typ="safe").load(f)
+        with TemporaryDirectory() as tmp:
+            diagrams = []
+            for name in ["first", "second"]:
+                board = Path(tmp) / f"{name}.kicad_pcb"
+                shutil.copy(ALKS_BOARD, board)
+                diagrams.append((pcbnew.LoadBoard(str(board)), specification,
+                                 Path(tmp) / name))
+            session = CountingSession(fakeKicadCli(tmp))
+            batch = lambda: generateRenderedBatch(diagrams, session,
+                orthographic=True, raytraced=False, sides=("front", "back"),
+                maxPixels=20000, imageKey={"generator": "rendered"},
+                incremental=True, pack=False, embed=False)
+
+            batch()
+            self.assertEqual(session.runs, [4])
+            for _, _, outputdir in diagrams:
+                with open(outputdir / "spec.json") as f:
+                    spec = json.load(f)
+                self.assertEqual(spec["front"]["area"],
+                                 json.loads(json.dumps(renderedAreaRect(diagrams[0][0]))))
+                for side in ["front", "back"]:
+                    self.assertTrue((outputdir / f"{side}.png").exists())
+
+            # Fresh images are not rendered again
+            (diagrams[1][2] / "back.png").unlink()
+            batch()
+            self.assertEqual(session.runs, [4, 1])
+
+
+class StagedImageGeneratorTest(unittest.TestCase):
+    def test_images_replace_previous(self):
+        def generator(board, outputdir, sides):
+            for side in sides:
+                (outputdir / f"{side}.png").write_text("new")
+            return {side: {"tl": (0, 0), "br": (1, 1)} for side in sides}
+
+        with TemporaryDirectory() as outputdir:
+            outputdir = Path(outputdir)
+            (outputdir / "front.png").write_text("old")
+            sources = stagedImageGenerator(generator)(None, outputdir, ("front", "back"))
+            self.assertEqual(set(sources), {"front", "back"})
+            self.assertEqual((outputdir / "front.png").read_text(), "new")
+            self.assertEqual((outputdir / "back.png").read_text(), "new")
+            self.assertEqual(sorted(p.name for p in outputdir.iterdir()),
+                             ["back.png", "front.png"])
+
+
+if __name__ == "__main__":
+    unittest.main()
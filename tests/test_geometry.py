@@ -0,0 +1,56 @@
+import math
+import unittest
+
+from pinion.geometry import fitCircle, simplifyPolygon, simplifyPolyline
+
+
+def circle(center, radius, count):
+    return [(center[0] + radius * math.cos(2 * math.pi * i / count),
+             center[1] + radius * math.sin(2 * math.pi * i / count))
+            for i in range(count)]
+
+
+class SimplificationTest(unittest.TestCase):
+    def test_polyline_drops_collinear_points(self):
+        points = [(0, 0), (1, 0), (2, 0), (3, 0.001), (4, 0)]
+        self.assertEqual(simplifyPolyline(points, 0.01), [(0, 0), (4, 0)])
+
+    def test_polyline_keeps_significant_points(self):
+        points = [(0, 0), (1, 1), (2, 0)]
+        self.assertEqual(simplifyPolyline(points, 0.1), points)
+
+    def test_polygon_keeps_rectangle(self):
+        rectangle = [(0, 0), (2, 0), (2, 1), (0, 1)]
+        self.assertEqual(simplifyPolygon(rectangle, 0.1), rectangle)
+
+    def test_polygon_respects_tolerance(self):
+        points = circle((1, 1), 1, 64)
+        simplified = simplifyPolygon(points, 0.01)
+        self.assertLess(len(simplified), len(points))
+        self.assertGreaterEqual(len(simplified), 3)
+        self.assertTrue(all(p in points for p in simplified))
+
+    def test_polygon_without_tolerance_is_unchanged(self):
+        points = circle((0, 0), 1, 32)
+        self.assertEqual(simplifyPolygon(points, None), points)
+        self.assertEqual(simplifyPolygon(points, 0), points)
+
+
+class CircleFitTest(unittest.TestCase):
+    def test_detects_circle(self):
+        center, radius = fitCircle(circle((5, -3), 0.5, 32), 0.01)
+        self.assertAlmostEqual(center[0], 5)
+        self.assertAlmostEqual(center[1], -3)
+        self.assertAlmostEqual(radius, 0.5, places=2)
+
+    def test_rejects_square(self):
+        square = [(0, 0), (1, 0), (1, 1), (0, 1)]
+        self.assertIsNone(fitCircle(square, 0.01))
+
+    def test_rejects_oval(self):
+        oval = [(2 * x, y) for x, y in circle((0, 0), 1, 32)]
+        self.assertIsNone(fitCircle(oval, 0.01))
+
+
+if __name__ == "__main__":
+    unittest.main()
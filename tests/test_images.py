@@ -0,0 +1,103 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from PIL import Image, ImageChops, ImageDraw
+
+from pinion.images import (convertImage, croppedArea, cropTransparent,
+                           imageFiles, imageMimeType, optimizePng, variantDpi,
+                           variantWidth)
+
+
+def flatColorImage(filename):
+    image = Image.new("RGBA", (400, 300), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    colors = [(200, 160, 20, 255), (20, 120, 40, 255), (250, 250, 250, 255)]
+    for i in range(40):
+        draw.rectangle([i * 9, i * 7, i * 9 + 30, i * 7 + 20], fill=colors[i % 3])
+    image.save(filename, compress_level=1)
+    return image
+
+
+class ImagesTest(unittest.TestCase):
+    def test_image_files(self):
+        self.assertEqual(imageFiles("front"), ["front.png"])
+        self.assertEqual(imageFiles("back", {"format": "webp"}), ["back.webp"])
+        self.assertEqual(imageFiles("back", {"format": "webp", "keepPng": True}),
+                         ["back.webp", "back.png"])
+        self.assertEqual(imageFiles("back", {"format": "png", "keepPng": True}),
+                         ["back.png"])
+
+    def test_image_files_with_srcset(self):
+        self.assertEqual(imageFiles("front", {"format": "webp", "srcset": ["150", "800w"]}),
+                         ["front.webp", "front-150.webp", "front-800w.webp"])
+
+    def test_variant_resolution(self):
+        self.assertEqual(variantWidth("800w", 50.8), 800)
+        self.assertEqual(variantWidth("150", 50.8), 300)
+        self.assertEqual(variantDpi("150", 50.8), 150)
+        self.assertEqual(variantDpi("800w", 50.8), 400)
+        with self.assertRaises(RuntimeError):
+            variantWidth("large", 50.8)
+
+    def test_mime_type_follows_extension(self):
+        self.assertEqual(imageMimeType("front.png"), "image/png")
+        self.assertEqual(imageMimeType(Path("x/front.webp")), "image/webp")
+        self.assertEqual(imageMimeType("front.avif"), "image/avif")
+
+    def test_convert_keeps_alpha(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            png = Path(tmp) / "front.png"
+            Image.new("RGBA", (64, 32), (255, 0, 0, 0)).save(png)
+            convertImage(png, {"format": "webp", "quality": 50})
+            self.assertFalse(png.exists())
+            with Image.open(Path(tmp) / "front.webp") as image:
+                self.assertEqual(image.mode, "RGBA")
+                self.assertEqual(image.size, (64, 32))
+
+    def test_convert_keeps_fallback(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            png = Path(tmp) / "front.png"
+            Image.new("RGBA", (64, 32)).save(png)
+            convertImage(png, {"format": "webp", "keepPng": True})
+            self.assertTrue(png.exists())
+            self.assertTrue((Path(tmp) / "front.webp").exists())
+
+    def test_optimize_is_lossless(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            png = Path(tmp) / "front.png"
+            original = flatColorImage(png)
+            before, after = optimizePng(png)
+            self.assertLess(after, before)
+            self.assertEqual(png.stat().st_size, after)
+            with Image.open(png) as optimized:
+                self.assertEqual(optimized.mode, "P")
+                difference = ImageChops.difference(optimized.convert("RGBA"), original)
+                self.assertIsNone(difference.getbbox())
+
+    def test_optimize_never_grows(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            png = Path(tmp) / "front.png"
+            flatColorImage(png)
+            optimizePng(png)
+            size = png.stat().st_size
+            self.assertEqual(optimizePng(png), (size, size))
+
+    def test_crop_transparent(self):
+        image = Image.new("RGBA", (200, 100), (0, 0, 0, 0))
+        ImageDraw.Draw(image).rectangle([20, 10, 179, 89], fill=(0, 128, 0, 255))
+        cropped, box = cropTransparent(image)
+        self.assertEqual(box, (20, 10, 180, 90))
+        self.assertEqual(cropped.size, (160, 80))
+        area = croppedArea({"tl": (0, 0), "br": (100, 50)}, box, image.size)
+        self.assertEqual(area, {"tl": (10, 5), "br": (90, 45)})
+
+    def test_crop_empty_image(self):
+        image = Image.new("RGBA", (20, 10), (0, 0, 0, 0))
+        cropped, box = cropTransparent(image)
+        self.assertIs(cropped, image)
+        self.assertEqual(box, (0, 0, 20, 10))
+
+
+if __name__ == "__main__":
+    unittest.main()
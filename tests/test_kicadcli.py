@@ -0,0 +1,96 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from pinion.kicadcli import RenderSession, findKicadCli, renderCommand, runCommands
+
+# Stand-in for kicad-cli, it just records the side into the output file
+RENDERER = f"""#!{sys.executable}
+import sys
+arguments = sys.argv[1:]
+with open(arguments[arguments.index("--output") + 1], "w") as f:
+    f.write(arguments[arguments.index("--side") + 1])
+"""
+
+
+class KicadCliTest(unittest.TestCase):
+    def test_render_command(self):
+        command = renderCommand("kicad-cli", "board.kicad_pcb", "back.png",
+                                side="back", width=800, height=600,
+                                raytraced=True, orthographic=False)
+        self.assertEqual(command[:3], ["kicad-cli", "pcb", "render"])
+        self.assertEqual(command[command.index("--side") + 1], "bottom")
+        self.assertEqual(command[command.index("--quality") + 1], "high")
+        self.assertIn("--perspective", command)
+        self.assertEqual(command[-1], "board.kicad_pcb")
+
+    def test_environment_override(self):
+        with mock.patch.dict(os.environ, {"KICAD_CLI": sys.executable}):
+            self.assertEqual(findKicadCli(), sys.executable)
+        with mock.patch.dict(os.environ, {"KICAD_CLI": "/nonexistent/kicad-cli"}):
+            with self.assertRaises(RuntimeError):
+                findKicadCli()
+
+    def test_run_commands(self):
+        runCommands({
+            "front": [sys.executable, "-c", "pass"],
+            "back": [sys.executable, "-c", "pass"]
+        })
+
+    def test_failure_is_reported(self):
+        with self.assertRaisesRegex(RuntimeError, "broken board"):
+            runCommands({
+                "front": [sys.executable, "-c", "import sys; sys.exit('broken board')"]
+            })
+
+    def test_failure_kills_other_renders(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            marker = Path(tmp) / "finished"
+            start = time.monotonic()
+            with self.assertRaisesRegex(RuntimeError, "broken board"):
+                runCommands({
+                    "front": [sys.executable, "-c",
+                              f"import time; time.sleep(5); open({str(marker)!r}, 'w')"],
+                    "back": [sys.executable, "-c", "import sys; sys.exit('broken board')"]
+                })
+            self.assertLess(time.monotonic() - start, 4)
+            time.sleep(0.1)
+            self.assertFalse(marker.exists())
+
+    def test_jobs_limit_concurrency(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            log = Path(tmp) / "log"
+            script = (f"import time; f = open({str(log)!r}, 'a'); f.write('s'); f.flush(); "
+                      "time.sleep(0.3); f.write('e')")
+            runCommands({str(i): [sys.executable, "-c", script] for i in range(3)}, jobs=1)
+            self.assertEqual(log.read_text(), "sesese")
+
+    def test_timeout(self):
+        with self.assertRaisesRegex(RuntimeError, "timed out"):
+            runCommands({
+                "front": [sys.executable, "-c", "import time; time.sleep(10)"]
+            }, timeout=0.2)
+
+    def test_session_batches_boards(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            executable = Path(tmp) / "kicad-cli"
+            executable.write_text(RENDERER)
+            executable.chmod(0o755)
+            session = RenderSession(str(executable), jobs=2)
+            renders = [session.render(board, Path(tmp) / f"{i}-{side}.png", side,
+                                      100, 50, raytraced=False, orthographic=True)
+                       for i, board in enumerate(["a.kicad_pcb", "b.kicad_pcb"])
+                       for side in ["front", "back"]]
+            self.assertFalse(any(render.exists() for render in renders))
+            session.run()
+            self.assertEqual([render.read_text() for render in renders],
+                             ["top", "bottom", "top", "bottom"])
+            self.assertEqual(session.pending, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
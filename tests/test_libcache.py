@@ -0,0 +1,103 @@
+import os
+import sys
+import tempfile
+import types
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from lxml import etree
+
+from pinion.libcache import FootprintCache
+
+FOOTPRINT = """<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="10mm" height="5mm" viewBox="0 0 10 5">
+  <defs><linearGradient id="grad"/></defs>
+  <rect id="body" x="0" y="0" width="10" height="5" fill="url(#grad)"/>
+  <use xlink:href="#body"/>
+  <circle id="origin" cx="5" cy="2.5" r="0"/>
+</svg>
+"""
+
+
+def pcbdrawRead(filename, prefix):
+    # The algorithm of pcbdraw.plot.read_svg_unique2
+    root = etree.parse(filename).getroot()
+    ids = [el.attrib["id"] for el in root.iter()
+           if "id" in el.attrib and el.attrib["id"] != "origin"]
+    with open(filename) as f:
+        content = f.read()
+    for i in ids:
+        content = content.replace("#" + i, "#" + prefix + i)
+    root = etree.fromstring(str.encode(content))
+    for el in root.iter():
+        if "id" in el.attrib and el.attrib["id"] != "origin":
+            el.attrib["id"] = prefix + el.attrib["id"]
+    return root, prefix
+
+
+class FootprintCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.footprint = self.dir / "R_0805.svg"
+        self.footprint.write_text(FOOTPRINT)
+        self.cache = FootprintCache(self.dir / "cache")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assertSameAsPcbDraw(self, prefix):
+        expected, _ = pcbdrawRead(str(self.footprint), prefix)
+        actual, actualPrefix = self.cache.read(str(self.footprint), prefix)
+        self.assertEqual(actualPrefix, prefix)
+        self.assertEqual(etree.tostring(actual), etree.tostring(expected))
+
+    def test_matches_pcbdraw(self):
+        self.assertSameAsPcbDraw("pref_1")
+        # Second read comes from the cache
+        self.assertSameAsPcbDraw("pref_2")
+        self.assertEqual(len(list((self.dir / "cache").glob("*.json"))), 1)
+
+    def test_changed_file_is_reread(self):
+        self.cache.read(str(self.footprint), "p")
+        self.footprint.write_text(FOOTPRINT.replace('id="body"', 'id="pad"')
+                                           .replace("#body", "#pad") + " ")
+        self.assertSameAsPcbDraw("p")
+
+    def test_prune_removes_least_recently_used(self):
+        other = self.dir / "C_0805.svg"
+        other.write_text(FOOTPRINT)
+        self.cache.read(str(self.footprint), "p")
+        self.cache.read(str(other), "p")
+        entries = sorted((self.dir / "cache").glob("*.json"))
+        os.utime(entries[0], ns=(0, 0))
+        self.cache.limit = entries[1].stat().st_size
+        self.cache.prune()
+        self.assertEqual(sorted((self.dir / "cache").glob("*.json")), entries[1:])
+
+    def pcbdrawModule(self, **attributes):
+        plot = types.ModuleType("pcbdraw.plot")
+        plot.__dict__.update(attributes)
+        pcbdraw = types.ModuleType("pcbdraw")
+        pcbdraw.plot = plot
+        return mock.patch.dict(sys.modules, {"pcbdraw": pcbdraw, "pcbdraw.plot": plot}), plot
+
+    def test_installed_replaces_reader(self):
+        patch, plot = self.pcbdrawModule(read_svg_unique2=pcbdrawRead)
+        with patch:
+            with self.cache.installed():
+                root, _ = plot.read_svg_unique2(str(self.footprint), "p")
+                self.assertIsNot(plot.read_svg_unique2, pcbdrawRead)
+            self.assertIs(plot.read_svg_unique2, pcbdrawRead)
+        self.assertEqual(len(list((self.dir / "cache").glob("*.json"))), 1)
+
+    def test_installed_without_reader_does_nothing(self):
+        patch, plot = self.pcbdrawModule()
+        with patch:
+            with self.cache.installed():
+                self.assertFalse(hasattr(plot, "read_svg_unique2"))
+            self.assertFalse(hasattr(plot, "read_svg_unique2"))
+
+
+if __name__ == "__main__":
+    unittest.main()
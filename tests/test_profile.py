@@ -0,0 +1,59 @@
+import contextlib
+import io
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from pinion.profile import Profiler, stage
+from pinion.ui import profiling
+
+
+class ProfileTest(unittest.TestCase):
+    def test_stages_are_recorded_only_when_active(self):
+        profiler = Profiler()
+        with stage("before"):
+            pass
+        with profiler.activated():
+            with stage("images"):
+                with stage("plot front"):
+                    sum(range(10000))
+            with stage("pack"):
+                pass
+        with stage("after"):
+            pass
+        self.assertEqual([(r["stage"], r["depth"]) for r in profiler.records],
+                         [("images", 0), ("plot front", 1), ("pack", 0)])
+        images, plot, _ = profiler.records
+        self.assertGreaterEqual(images["wall"], plot["wall"])
+        self.assertGreaterEqual(plot["cpu"], 0)
+
+    def test_save_and_report(self):
+        profiler = Profiler(cprofileStage="plot front")
+        with profiler.activated():
+            for _ in range(2):
+                with stage("plot front"):
+                    sum(range(10000))
+        with tempfile.TemporaryDirectory() as tmp:
+            profiler.save(Path(tmp))
+            with open(Path(tmp) / "profile.json") as f:
+                self.assertEqual(len(json.load(f)["stages"]), 2)
+            self.assertTrue((Path(tmp) / "profile-plot-front.prof").exists())
+        report = io.StringIO()
+        profiler.report(report)
+        self.assertEqual(report.getvalue().count("plot front"), 2)
+
+    def test_summary_is_optional(self):
+        for summary in [True, False]:
+            with tempfile.TemporaryDirectory() as tmp:
+                report = io.StringIO()
+                with contextlib.redirect_stderr(report):
+                    with profiling(True, None, tmp, summary):
+                        with stage("pack"):
+                            pass
+                self.assertTrue((Path(tmp) / "profile.json").exists())
+                self.assertEqual("pack" in report.getvalue(), summary)
+
+
+if __name__ == "__main__":
+    unittest.main()
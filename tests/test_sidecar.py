@@ -0,0 +1,38 @@
+import json
+import unittest
+
+from pinion.sidecar import joinGeometry, splitGeometry
+from pinion.specformat import decodeSpecification, encodeSpecification
+
+from test_specformat import specification
+
+
+class SidecarTest(unittest.TestCase):
+    def test_metadata_has_no_geometry(self):
+        metadata, _ = splitGeometry(specification())
+        self.assertEqual(metadata["geometry"], "geometry.bin")
+        component = metadata["components"][0]
+        self.assertNotIn("bbox", component)
+        self.assertNotIn("shape", component["pins"][0])
+        self.assertEqual(component["pins"][1]["alias"], "GND")
+
+    def test_roundtrip(self):
+        spec = json.loads(json.dumps(specification()))
+        metadata, data = splitGeometry(spec)
+        self.assertEqual(joinGeometry(metadata, data), spec)
+
+    def test_roundtrip_through_compact_format(self):
+        spec = json.loads(json.dumps(specification()))
+        metadata, data = splitGeometry(spec)
+        decoded = decodeSpecification(encodeSpecification(metadata, 2))
+        self.assertEqual(decoded, metadata)
+        self.assertEqual(joinGeometry(decoded, data), spec)
+
+    def test_rejects_foreign_files(self):
+        metadata, data = splitGeometry(specification())
+        with self.assertRaises(RuntimeError):
+            joinGeometry(metadata, b"XXXX" + data[4:])
+
+
+if __name__ == "__main__":
+    unittest.main()
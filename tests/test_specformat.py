@@ -0,0 +1,72 @@
+import json
+import unittest
+
+from pinion.specformat import (compactSpecification, decodeSpecification,
+                               encodeSpecification)
+
+
+def specification():
+    pin = {
+        "shape": [(1.0, 2.0), (1.5, 2.0), (1.5, 2.25), (1.0, 2.25)],
+        "bbox": {"tl": (1.0, 2.0), "br": (1.5, 2.25)},
+        "pos": [1.25, 2.125],
+        "front": True,
+        "back": False,
+        "name": "GND",
+        "description": "Ground",
+        "alias": False,
+        "groups": ["Power"]
+    }
+    return {
+        "pinionVersion": "0.0.0",
+        "name": "Board",
+        "description": "Test board",
+        "components": [{
+            "ref": "J1",
+            "description": "Header",
+            "front": True,
+            "back": True,
+            "highlight": False,
+            "bbox": {"tl": (0.0, 0.0), "br": (10.0, 5.0)},
+            "groups": ["Power"],
+            "pins": [
+                pin,
+                dict(pin, name="GND2", alias="GND", back=True,
+                     shape={"center": [3.0, 4.0], "radius": 0.5})
+            ]
+        }],
+        "groups": {"Power": {}},
+        "front": {"file": "front.png", "area": {"tl": [0, 0], "br": [10, 5]}}
+    }
+
+
+class SpecFormatTest(unittest.TestCase):
+    def test_v1_is_plain_json(self):
+        spec = specification()
+        self.assertEqual(json.loads(encodeSpecification(spec, 1)),
+                         json.loads(json.dumps(spec)))
+
+    def test_v2_roundtrip(self):
+        spec = specification()
+        decoded = decodeSpecification(encodeSpecification(spec, 2))
+        self.assertEqual(decoded, json.loads(json.dumps(spec)))
+
+    def test_v2_shares_strings(self):
+        compact = compactSpecification(specification())
+        self.assertEqual(compact["strings"].count("GND"), 1)
+        self.assertEqual(compact["strings"].count("Power"), 1)
+
+    def test_v2_delta_encodes_polygons(self):
+        compact = compactSpecification(specification())
+        shape = compact["components"][0][5][0][7]
+        self.assertEqual(shape, [1000, 2000, 500, 0, 0, 250, -500, 0])
+
+    def test_unknown_format_is_rejected(self):
+        with self.assertRaises(RuntimeError):
+            encodeSpecification(specification(), 3)
+        with self.assertRaises(RuntimeError):
+            decodeSpecification('{"format": 3}')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import unittest
+
+from lxml import etree
+
+from pinion.svg import deduplicateGroups, localName, minifySvg, trimNumbers
+
+SVG = "http://www.w3.org/2000/svg"
+XLINK = "http://www.w3.org/1999/xlink"
+
+
+def footprint():
+    return "".join(f'<path d="M {i}.500 {i}.000 L 10.25000 3.0"/>' for i in range(20))
+
+
+FOOTPRINT_SVG = f"""<svg xmlns="{SVG}" xmlns:xlink="{XLINK}" width="2mm" height="1.25mm" viewBox="0 0 2 1.25">
+  <defs>
+    <linearGradient id="grad"><stop offset="0" stop-color="#b5ae30"/><stop offset="1" stop-color="#f0f0f0"/></linearGradient>
+  </defs>
+  <rect id="origin" x="1" y="0.625" width="0" height="0"/>
+  <path fill="url(#grad)" d="M 0.000 0.000 L 0.500 0.000 L 0.500 1.250 L 0.000 1.250 Z"/>
+  <path fill="url(#grad)" d="M 1.500 0.000 L 2.000 0.000 L 2.000 1.250 L 1.500 1.250 Z"/>
+  <path fill="#c0c0c0" d="M 0.500 0.000 L 1.500 0.000 L 1.500 1.250 L 0.500 1.250 Z"/>
+</svg>"""
+
+
+def pcbdrawComponent(prefix, xmlId):
+    """
+    Place the footprint the way PcbDraw does it for the first occurrence of a
+    footprint and value: ids get a unique prefix, the content is wrapped in a
+    group identified by xmlId and placed by a transformed group.
+    """
+    content = FOOTPRINT_SVG
+    ids = [i for i in etree.fromstring(content).xpath("//@id") if i != "origin"]
+    for i in ids:
+        content = content.replace("#" + i, "#" + prefix + i)
+    root = etree.fromstring(content)
+    for el in root.iter():
+        if "id" in el.attrib and el.attrib["id"] != "origin":
+            el.attrib["id"] = prefix + el.attrib["id"]
+    for el in root.xpath("//*[@id='origin']"):
+        el.getparent().remove(el)
+    inner = "".join(etree.tostring(x, encoding="unicode") for x in root)
+    return f'<g transform="translate(10 10) scale(1, 1)"><g id="{xmlId}">{inner}</g></g>'
+
+
+def board(*groups):
+    return etree.fromstring(
+        f'<svg xmlns="{SVG}" xmlns:xlink="{XLINK}" viewBox="0 0 100 100">\n' +
+        "\n".join(groups) + "\n</svg>")
+
+
+class SvgTest(unittest.TestCase):
+    def test_trim_numbers(self):
+        self.assertEqual(trimNumbers("M 1.500 2.000 L 10 0.250"), "M 1.5 2 L 10 0.25")
+        self.assertEqual(trimNumbers("translate(100.0, 2.05)"), "translate(100, 2.05)")
+        # The dot delimits the next number of the path data
+        self.assertEqual(trimNumbers("M1.000.5"), "M1.000.5")
+        self.assertEqual(trimNumbers("M1.5.500"), "M1.5.5")
+
+    def test_minify(self):
+        root = board("<!-- comment -->", "<metadata>x</metadata>",
+                     f'<g>\n  <path d="M 1.0 2.50"/>\n</g>')
+        minifySvg(root)
+        self.assertEqual(etree.tostring(root).decode(),
+            f'<svg xmlns="{SVG}" xmlns:xlink="{XLINK}" viewBox="0 0 100 100">' +
+            '<g><path d="M 1 2.5"/></g></svg>')
+
+    def test_repeated_groups_become_symbols(self):
+        root = board(*[f'<g transform="translate({i} 0)"><g>{footprint()}</g></g>'
+                       for i in range(3)])
+        minifySvg(root)
+        self.assertEqual(deduplicateGroups(root), 1)
+        symbols = root.findall(f"{{{SVG}}}defs/{{{SVG}}}symbol")
+        self.assertEqual(len(symbols), 1)
+        self.assertEqual(len(symbols[0].findall(f".//{{{SVG}}}path")), 20)
+        # The innermost repeated groups are replaced, the transformed groups
+        # stay in place
+        uses = root.findall(f"{{{SVG}}}g/{{{SVG}}}g/{{{SVG}}}use")
+        self.assertEqual(len(uses), 3)
+        self.assertTrue(all(u.get(f"{{{XLINK}}}href") == "#pinion-s0" for u in uses))
+        self.assertEqual(len(root.findall(f".//{{{SVG}}}path")), 20)
+
+    def test_group_ids_are_kept(self):
+        root = board(*[f'<g id="c{i}">{footprint()}</g>' for i in range(3)])
+        self.assertEqual(deduplicateGroups(root), 1)
+        self.assertEqual([g.get("id") for g in root.findall(f"{{{SVG}}}g")],
+                         ["c0", "c1", "c2"])
+
+    def test_content_referenced_from_outside_is_kept(self):
+        root = board(*[f'<g><path id="p{i}" d="M 0 0"/>{footprint()}</g>' for i in range(3)],
+                     '<use xlink:href="#p1"/>')
+        self.assertEqual(deduplicateGroups(root), 1)
+        # Only the group with the referenced path keeps its content
+        referenced = root.find(f"{{{SVG}}}g/{{{SVG}}}path[@id='p1']")
+        self.assertIsNotNone(referenced)
+        self.assertEqual(len(referenced.getparent()), 21)
+        self.assertEqual(len(root.findall(f"{{{SVG}}}g/{{{SVG}}}use")), 2)
+
+    def test_pcbdraw_footprints_with_different_values(self):
+        # PcbDraw places every footprint with a distinct value as a group
+        # whose ids are uniquely prefixed (pcbdraw.plot.read_svg_unique2) and
+        # refers to it by <use> for the repeated values
+        root = board(*[pcbdrawComponent(f"pref_{i}", f"pref_0_Lib__C_0805_{value}")
+                       for i, value in enumerate(["100n", "1u", "10u"], start=1)],
+                     '<g transform="translate(50 0)"><use xlink:href="#pref_0_Lib__C_0805_1u"/></g>')
+        minifySvg(root)
+        self.assertEqual(deduplicateGroups(root), 1)
+        symbol = root.find(f"{{{SVG}}}defs/{{{SVG}}}symbol")
+        # The symbol keeps the ids of the first placement and its references
+        gradient = symbol.find(f".//{{{SVG}}}linearGradient")
+        self.assertEqual(gradient.get("id"), "pref_1grad")
+        self.assertEqual(symbol.find(f".//{{{SVG}}}path").get("fill"), "url(#pref_1grad)")
+        components = root.findall(f".//{{{SVG}}}g[@id]")
+        self.assertEqual([g.get("id") for g in components],
+                         [f"pref_0_Lib__C_0805_{v}" for v in ["100n", "1u", "10u"]])
+        for g in components:
+            self.assertEqual([localName(c) for c in g], ["use"])
+        self.assertEqual(len(root.findall(f".//{{{SVG}}}linearGradient")), 1)
+
+    def test_small_groups_are_kept(self):
+        root = board(*['<g><path d="M 0 0"/></g>' for i in range(3)])
+        self.assertEqual(deduplicateGroups(root), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from PIL import Image
+
+from pinion.tiles import generateTiles, pyramidLevels
+
+
+class TilesTest(unittest.TestCase):
+    def test_levels_halve_until_single_tile(self):
+        self.assertEqual(pyramidLevels(2000, 1000, 512),
+                         [(2000, 1000), (1000, 500), (500, 250)])
+        self.assertEqual(pyramidLevels(300, 200, 512), [(300, 200)])
+
+    def test_generate_tiles(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            outputdir = Path(tmp)
+            Image.new("RGBA", (1100, 600), (255, 0, 0, 255)).save(outputdir / "front.png")
+            path = generateTiles(outputdir / "front.png", outputdir, "front", 512)
+            self.assertEqual(path, "front_tiles/manifest.json")
+            with open(outputdir / path) as f:
+                manifest = json.load(f)
+            self.assertEqual((manifest["width"], manifest["height"]), (1100, 600))
+            self.assertEqual([(l["columns"], l["rows"]) for l in manifest["levels"]],
+                             [(3, 2), (2, 1), (1, 1)])
+            with Image.open(outputdir / "front_tiles" / "0" / "2_1.png") as tile:
+                self.assertEqual(tile.size, (76, 88))
+            with Image.open(outputdir / "front_tiles" / "2" / "0_0.png") as tile:
+                self.assertEqual(tile.size, (275, 150))
+
+
+if __name__ == "__main__":
+    unittest.main()
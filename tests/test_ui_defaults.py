@@ -8,6 +8,7 @@ from pinion.ui import (
     defaultBoardPath,
     defaultSpecificationPath,
     defaultTemplateOutputPath,
+    loadBatch,
     resolveTemplateOutput,
 )
 
@@ -95,5 +96,25 @@ class DefaultPathTest(unittest.TestCase):
                 os.chdir(oldCwd)
 
 
+class LoadBatchTest(unittest.TestCase):
+    def test_paths_are_relative_to_batch(self):
+        with tempfile.TemporaryDirectory(prefix="pinion-test-") as directory:
+            batch = Path(directory) / "batch.yaml"
+            batch.write_text("- {board: a.kicad_pcb, specification: a.yaml, output: out/a}\n")
+
+            self.assertEqual(loadBatch(str(batch)), [(
+                Path(directory) / "a.kicad_pcb",
+                Path(directory) / "a.yaml",
+                Path(directory) / "out" / "a")])
+
+    def test_incomplete_diagram_is_rejected(self):
+        with tempfile.TemporaryDirectory(prefix="pinion-test-") as directory:
+            batch = Path(directory) / "batch.yaml"
+            batch.write_text("- {board: a.kicad_pcb, output: out/a}\n")
+
+            with self.assertRaises(click.ClickException):
+                loadBatch(str(batch))
+
+
 if __name__ == "__main__":
     unittest.main()